@@ -18,3 +18,4 @@ from .version import version as __version__  # noqa: F401 (imported but unused)
 
 # Import here the bare minimum to break the circular import between modules
 from . import charm  # noqa: F401 (imported but unused)
+from .framework import observe  # noqa: F401 (imported but unused)
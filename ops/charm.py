@@ -29,6 +29,37 @@ def _loadYaml(source):
     return yaml.load(source, Loader=yaml.SafeLoader)
 
 
+class _RestoredAttribute:
+    """An event attribute that restored events only resolve when first accessed.
+
+    The restore method of the event keeps its snapshot as ``_snapshot``, and the value
+    is computed by calling resolve(event, snapshot) at most once. Assigning the
+    attribute, as __init__ does, sets its value directly.
+    """
+
+    def __init__(self, name, resolve):
+        self.name = name
+        self.resolve = resolve
+
+    def __get__(self, event, event_type=None):
+        if event is None:
+            return self
+        values = event.__dict__
+        try:
+            return values[self.name]
+        except KeyError:
+            pass
+        try:
+            snapshot = values['_snapshot']
+        except KeyError:
+            raise AttributeError(self.name) from None
+        value = values[self.name] = self.resolve(event, snapshot)
+        return value
+
+    def __set__(self, event, value):
+        event.__dict__[self.name] = value
+
+
 class HookEvent(EventBase):
     """A base class for events that trigger because of a Juju hook firing."""
 
@@ -40,11 +71,17 @@ class ActionEvent(EventBase):
     To respond with the result of the action, call `set_results`. To add progress
     messages that are visible as the action is progressing use `log`.
 
-    :ivar params: The parameters passed to the action (read by action-get)
+    :ivar params: The parameters passed to the action (read by action-get, when
+        they're first accessed)
     """
 
-    def defer(self):
-        """Action events are not deferable like other events.
+    # Params are loaded when restoring rather than in __init__ because the model is
+    # not available in __init__, and only if they're used.
+    params = _RestoredAttribute(
+        'params', lambda event, snapshot: event.framework.model._backend.action_get())
+
+    def defer(self, *, until=None, backoff=None):
+        """Action events are not deferable like other events, with or without a schedule.
 
         This is because an action runs synchronously and the user is waiting for the result.
         """
@@ -60,9 +97,7 @@ class ActionEvent(EventBase):
         if event_action_name != env_action_name:
             # This could only happen if the dev manually emits the action, or from a bug.
             raise RuntimeError('action event kind does not match current action')
-        # Params are loaded at restore rather than __init__ because
-        # the model is not available in __init__.
-        self.params = self.framework.model._backend.action_get()
+        self._snapshot = snapshot
 
     def set_results(self, results: typing.Mapping) -> None:
         """Report the result of the action.
@@ -204,6 +239,24 @@ class RelationEvent(HookEvent):
               if the relation event was triggered as an Application level event
     """
 
+    # Restored events only look the model objects up when they're accessed.
+    relation = _RestoredAttribute(
+        'relation', lambda event, snapshot: event.framework.model.get_relation(
+            snapshot['relation_name'], snapshot['relation_id']))
+    app = _RestoredAttribute(
+        'app', lambda event, snapshot: event.framework.model.get_app(snapshot['app_name'])
+        if snapshot.get('app_name') else None)
+    unit = _RestoredAttribute(
+        'unit', lambda event, snapshot: event.framework.model.get_unit(snapshot['unit_name'])
+        if snapshot.get('unit_name') else None)
+
+    filter_fields = {
+        'relation_name': lambda event: event.relation.name,
+        'relation_id': lambda event: event.relation.id,
+        'app': lambda event: event.app.name if event.app else None,
+        'unit': lambda event: event.unit.name if event.unit else None,
+    }
+
     def __init__(self, handle, relation, app=None, unit=None):
         super().__init__(handle)
 
@@ -233,22 +286,21 @@ class RelationEvent(HookEvent):
     def restore(self, snapshot: dict) -> None:
         """Used by the framework to deserialize the event from disk.
 
-        Not meant to be called by Charm code.
+        Not meant to be called by Charm code. The relation, app and unit are only
+        looked up when they're first accessed.
+        """
+        self._snapshot = snapshot
+
+    def coalesce_key(self) -> tuple:
+        """Used by the framework to coalesce deferrals per relation and remote unit.
+
+        See :class:`ops.framework.CoalescePolicy`.
         """
-        self.relation = self.framework.model.get_relation(
-            snapshot['relation_name'], snapshot['relation_id'])
-
-        app_name = snapshot.get('app_name')
-        if app_name:
-            self.app = self.framework.model.get_app(app_name)
-        else:
-            self.app = None
-
-        unit_name = snapshot.get('unit_name')
-        if unit_name:
-            self.unit = self.framework.model.get_unit(unit_name)
-        else:
-            self.unit = None
+        snapshot = self.__dict__.get('_snapshot')
+        if snapshot is not None and 'unit' not in self.__dict__:
+            # Don't look the relation and unit up just for this.
+            return snapshot['relation_id'], snapshot.get('unit_name')
+        return self.relation.id, self.unit.name if self.unit else None
 
 
 class RelationCreatedEvent(RelationEvent):
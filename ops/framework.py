@@ -12,24 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import abc
+import asyncio
 import collections
 import collections.abc
+import concurrent.futures
+import copy
+import datetime
+import enum
+import functools
+import hashlib
+import heapq
 import inspect
+import itertools
+import json
 import keyword
 import logging
-import marshal
+import operator
 import os
 import pathlib
 import pdb
+import pickle
 import re
 import sys
+import threading
+import time
 import types
+import typing
 import weakref
 
 from ops import charm
 from ops.storage import (
+    JujuStorage,
     NoSnapshotError,
+    SimpleTypeError,
     SQLiteStorage,
+    _simple_dumps,
 )
 
 logger = logging.getLogger(__name__)
@@ -49,6 +67,8 @@ class Handle:
     under the same parent and kind may have the same key.
     """
 
+    __slots__ = ('_parent', '_kind', '_key', '_path')
+
     def __init__(self, parent, kind, key):
         if parent and not isinstance(parent, Handle):
             parent = parent.handle
@@ -114,14 +134,287 @@ class Handle:
         return handle
 
 
-class EventBase:
+class CoalescePolicy(enum.Enum):
+    """How repeated deferrals of the same event are merged for an observer.
+
+    The policy applies to events of the same kind coming from the same emitter
+    and deferred by the same observer method. When a new deferral arrives, the
+    older deferred events it supersedes are dropped from storage, so a backlog of
+    identical events is reemitted once rather than once per hook that fired it.
+
+    Attributes:
+        keep_all: every deferred event is kept and reemitted (the default).
+        latest: only the most recently deferred event is kept.
+        latest_per_key: only the most recently deferred event is kept for each
+            value of :meth:`EventBase.coalesce_key` (eg, per relation and unit).
+    """
+
+    keep_all = 'keep-all'
+    latest = 'latest'
+    latest_per_key = 'latest-per-key'
+
+
+class EvictionPolicy(enum.Enum):
+    """What to do when a deferral takes the backlog over a limit.
+
+    See :meth:`Framework.set_deferral_limits`.
+
+    Attributes:
+        drop_oldest: evict the oldest deferred events.
+        drop_newest: evict the newest deferred events, including the one just deferred.
+        refuse: make :meth:`EventBase.defer` raise :class:`DeferralLimitError`.
+    """
+
+    drop_oldest = 'drop-oldest'
+    drop_newest = 'drop-newest'
+    refuse = 'refuse'
+
+
+# The types event fields may be declared with, as they can be stored in snapshots.
+_EVENT_FIELD_TYPES = (bool, int, float, str, bytes, list, tuple, dict, set, frozenset)
+
+_NO_DEFAULT = object()
+
+
+class EventField:
+    """Declare a field of the data carried by an event type.
+
+    The fields of an event type are the arguments, after the handle, of its __init__
+    and its snapshot is the tuple of their values, so none of that needs writing::
+
+        class DatabaseReadyEvent(EventBase):
+            host = EventField(str)
+            port = EventField(int)
+            tls = EventField(bool, default=False)
+
+        class DatabaseEvents(ObjectEvents):
+            database_ready = EventSource(DatabaseReadyEvent)
+
+        db.on.database_ready.emit('10.0.0.1', 5432)
+
+    Args:
+        field_type: the type of the values of the field, or a tuple of types; they must
+            be types that can be stored, like int, str or dict.
+        default: the value of the field if it's not given. If it's None, None is also
+            accepted as the value of the field.
+    """
+
+    def __init__(self, field_type, *, default=_NO_DEFAULT):
+        field_types = field_type if isinstance(field_type, tuple) else (field_type,)
+        for t in field_types:
+            if t not in _EVENT_FIELD_TYPES:
+                raise TypeError('event fields cannot be of type {!r}'.format(t))
+        if default is not _NO_DEFAULT and default is not None:
+            if not isinstance(default, field_types):
+                raise TypeError('default {!r} is not a {}'.format(
+                    default, _type_names(field_types)))
+            if isinstance(default, (list, dict, set)):
+                raise TypeError('default {!r} is mutable, it would be shared by all the events'
+                                .format(default))
+        self.field_types = field_types
+        self.default = default
+        self.name = None
+
+    def check(self, owner_type, value):
+        """Raise TypeError if value isn't acceptable for the field."""
+        if isinstance(value, self.field_types) or (value is None and self.default is None):
+            return
+        raise TypeError('{}.{} must be a {}, not {!r}'.format(
+            owner_type.__name__, self.name, _type_names(self.field_types), value))
+
+
+def _type_names(types):
+    return ' or '.join(t.__name__ for t in types)
+
+
+def _event_init(fields):
+    """Generate the __init__ of an event type setting the given fields."""
+    parameters = [
+        inspect.Parameter(name, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+        for name in ('self', 'handle')]
+    for field in fields:
+        default = inspect.Parameter.empty if field.default is _NO_DEFAULT else field.default
+        parameters.append(inspect.Parameter(
+            field.name, inspect.Parameter.POSITIONAL_OR_KEYWORD, default=default))
+    signature = inspect.Signature(parameters)
+
+    def __init__(self, handle, *args, **kwargs):
+        if kwargs or len(args) != len(fields):
+            bound = signature.bind(self, handle, *args, **kwargs)
+            bound.apply_defaults()
+            args = [bound.arguments[field.name] for field in fields]
+        EventBase.__init__(self, handle)
+        for field, value in zip(fields, args):
+            field.check(type(self), value)
+            setattr(self, field.name, value)
+    __init__.__signature__ = signature
+    return __init__
+
+
+def _event_snapshot(fields):
+    """Generate the snapshot method of an event type, returning the tuple of the fields."""
+    get_fields = operator.attrgetter(*[field.name for field in fields])
+    if len(fields) == 1:
+        def snapshot(self):
+            return (get_fields(self),)
+    else:
+        def snapshot(self):
+            return get_fields(self)
+    return snapshot
+
+
+def _event_restore(fields):
+    """Generate the restore method of an event type, the reverse of its snapshot method."""
+    names = [field.name for field in fields]
+
+    def restore(self, snapshot):
+        self.deferred = False
+        for name, value in zip(names, snapshot):
+            setattr(self, name, value)
+        # Events saved before fields with defaults were added to their type.
+        for field in fields[len(snapshot):]:
+            if field.default is _NO_DEFAULT:
+                raise ValueError('missing field {} in the snapshot of {}'.format(
+                    field.name, self.handle.path))
+            setattr(self, field.name, field.default)
+    return restore
+
+
+class _EventMetaclass(abc.ABCMeta):
+    """Generate the methods of the event types declaring EventFields.
+
+    The fields also become the __slots__ of the type, so (if its bases have no
+    __dict__ either) events only take the memory needed for their values. It derives
+    from ABCMeta so event types can still mix in abc.ABC.
+    """
+
+    @classmethod
+    def __prepare__(mcs, name, bases, **kwargs):
+        # Python 3.5 doesn't keep the class namespace in definition order.
+        return collections.OrderedDict()
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        new_fields = collections.OrderedDict(
+            (n, v) for n, v in namespace.items() if isinstance(v, EventField))
+        if not new_fields:
+            return super().__new__(mcs, name, bases, dict(namespace), **kwargs)
+
+        fields = collections.OrderedDict()
+        for base in reversed(bases):
+            fields.update(getattr(base, '_event_fields', {}))
+        for field_name, field in new_fields.items():
+            if field_name in fields:
+                raise TypeError('{} redefines event field {}'.format(name, field_name))
+            if field_name == 'self' or any(hasattr(base, field_name) for base in bases):
+                raise TypeError('{} event field {} clashes with an attribute of the event'.format(
+                    name, field_name))
+            field.name = field_name
+            fields[field_name] = field
+            # The slot takes the place of the declaration.
+            del namespace[field_name]
+        with_default = False
+        for field in fields.values():
+            if field.default is not _NO_DEFAULT:
+                with_default = True
+            elif with_default:
+                raise TypeError('{} field {} without a default follows fields with one'.format(
+                    name, field.name))
+
+        namespace = dict(namespace)
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + tuple(new_fields)
+        namespace['_event_fields'] = fields
+        field_list = list(fields.values())
+        namespace.setdefault('__init__', _event_init(field_list))
+        namespace.setdefault('snapshot', _event_snapshot(field_list))
+        namespace.setdefault('restore', _event_restore(field_list))
+        if 'filter_fields' not in namespace:
+            filter_fields = {}
+            for base in reversed(bases):
+                filter_fields.update(getattr(base, 'filter_fields', {}))
+            for field_name in new_fields:
+                filter_fields[field_name] = operator.attrgetter(field_name)
+            namespace['filter_fields'] = filter_fields
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+class EventBase(metaclass=_EventMetaclass):
+    """The base class of events.
+
+    Events that carry data either override snapshot and restore to save and restore
+    it, or declare it with :class:`EventField`\\ s.
+    """
+
+    # Subclasses without __slots__ still get a __dict__.
+    __slots__ = ('handle', 'framework', 'deferred', 'defer_schedule', 'consumed', '__weakref__')
+
+    # The CoalescePolicy applied when observers defer this type of event. It may
+    # be overridden for a specific observer via Framework.observe.
+    coalesce = CoalescePolicy.keep_all
+
+    # The fields observers may filter this type of event on, via the when argument
+    # of Framework.observe, mapped to a function returning their value for an event.
+    filter_fields = {}
 
     def __init__(self, handle):
         self.handle = handle
         self.deferred = False
+        self.defer_schedule = None
+        self.consumed = False
+
+    def defer(self, *, until=None, backoff=None):
+        """Defer the event, so the observer is notified again on a later hook.
 
-    def defer(self):
+        By default the event is reemitted on the very next hook. Otherwise it's not
+        reemitted before it's due, which is computed from the given arguments.
+
+        Args:
+            until: earliest time to reemit the event, as a datetime.datetime or
+                seconds since the epoch.
+            backoff: base delay before reemitting the event, as a datetime.timedelta
+                or seconds, doubled every time the event is deferred with a backoff.
+        """
+        if isinstance(until, datetime.datetime):
+            until = until.timestamp()
+        elif until is not None and not isinstance(until, (int, float)):
+            raise TypeError('until must be a datetime or a timestamp, not {!r}'.format(until))
+        if isinstance(backoff, datetime.timedelta):
+            backoff = backoff.total_seconds()
+        elif backoff is not None and not isinstance(backoff, (int, float)):
+            raise TypeError('backoff must be a timedelta or seconds, not {!r}'.format(backoff))
+        framework = getattr(self, 'framework', None)
+        if framework is not None:
+            framework._check_deferral(self)
         self.deferred = True
+        if until is None and backoff is None:
+            self.defer_schedule = None
+        else:
+            self.defer_schedule = (until, backoff)
+
+    def consume(self):
+        """Stop notifying the observers that come after this one of the event.
+
+        Their notices are dropped without calling them, unless the event is also
+        deferred, in which case they are deferred along with it (see :meth:`defer_all`).
+        Observers are notified by decreasing priority, see :meth:`Framework.observe`.
+        """
+        self.consumed = True
+
+    def defer_all(self, *, until=None, backoff=None):
+        """Defer the event for this observer and all those that come after it.
+
+        The observers that come after this one aren't notified now, and are notified
+        after it again when the event is reemitted. The arguments are those of :meth:`defer`.
+        """
+        self.defer(until=until, backoff=backoff)
+        self.consume()
+
+    def coalesce_key(self):
+        """Return the key used to merge deferrals under CoalescePolicy.latest_per_key.
+
+        Subclasses may override; the returned value must be hashable. By default all
+        events share the same key, making latest_per_key equivalent to latest.
+        """
+        return None
 
     def snapshot(self):
         """Return the snapshot data that should be persisted.
@@ -188,6 +481,8 @@ class EventSource:
 
 class BoundEvent:
 
+    __slots__ = ('emitter', 'event_type', 'event_kind')
+
     def __repr__(self):
         return '<BoundEvent {} bound to {}.{} at {}>'.format(
             self.event_type.__name__,
@@ -211,6 +506,129 @@ class BoundEvent:
         event = self.event_type(Handle(self.emitter, self.event_kind, key), *args, **kwargs)
         framework._emit(event)
 
+    def emit_many(self, iterable_of_args: typing.Iterable[tuple]):
+        """Emit the event once per tuple of arguments, as a single batch.
+
+        This is equivalent to calling emit(*args) for each of them, except that all
+        the events are saved before any observer is notified, with far fewer storage
+        calls. See :meth:`Framework.emit_batch`.
+        """
+        self.emitter.framework.emit_batch((self, args) for args in iterable_of_args)
+
+
+class LazyObject:
+    """Declare an Object attribute that is only constructed when it's needed.
+
+    Charms usually create all their components in __init__, which loads their state
+    and registers their observers on every hook, even if none of them cares about
+    the event of the hook. A component declared as
+
+        class MyCharm(CharmBase):
+            db = LazyObject(lambda charm: DatabaseRequires(charm, 'db'))
+
+    is only constructed, by calling the factory with the owner object, when the
+    attribute is accessed or when one of the events it observes is emitted or
+    reemitted. The events it observes, other than the commits of the framework, are
+    recorded in storage whenever it's constructed. It's constructed along with its
+    owner when none were recorded yet, and on upgrade-charm, as its code may have
+    changed.
+    """
+
+    def __init__(self, factory: typing.Callable[['Object'], 'Object']):
+        self.factory = factory
+        self.attr_name = None
+
+    def _set_name(self, owner_type, attr_name):
+        self.attr_name = attr_name
+
+    def __get__(self, owner, owner_type=None):
+        if owner is None:
+            return self
+        # Once constructed the object is stored in the owner's __dict__, which takes
+        # precedence over this descriptor.
+        return owner.framework._construct_lazy(owner, self)
+
+
+# The order observe decorators were applied in, as Python 3.5 class namespaces are
+# unordered.
+_observe_order = itertools.count()
+
+
+def observe(event, *, coalesce: CoalescePolicy = None, parallel: bool = False,
+            when: typing.Mapping[str, typing.Any] = None, priority: int = 0):
+    """Decorate a method of an Object to observe the given event.
+
+    The observers declared on a class are collected once, when the class is created.
+    Those of its instances are registered together before the next event is emitted
+    or reemitted, after any observer registered by calling :meth:`Framework.observe`,
+    so that __init__ doesn't need to make those calls on every hook::
+
+        class MyCharm(CharmBase):
+
+            @observe('config_changed')
+            def _on_config_changed(self, event):
+                ...
+
+            @observe('db.on.database_ready', coalesce=CoalescePolicy.latest)
+            def _on_database_ready(self, event):
+                ...
+
+    Args:
+        event: the name of the event on the ``on`` attribute of the object, the dotted
+            path of the event from the object (for events of other objects created in
+            __init__), or an EventSource of the class whose instance the object has as
+            its ``on`` attribute.
+        coalesce: see :meth:`Framework.observe`.
+        parallel: see :meth:`Framework.observe`.
+        when: see :meth:`Framework.observe`.
+        priority: see :meth:`Framework.observe`.
+    """
+    if not isinstance(event, (str, EventSource, BoundEvent)):
+        raise TypeError('cannot observe {!r}: not an event name nor an event'.format(event))
+    if coalesce is not None and not isinstance(coalesce, CoalescePolicy):
+        raise TypeError('coalesce must be a CoalescePolicy, not {!r}'.format(coalesce))
+    if not isinstance(priority, int):
+        raise TypeError('priority must be an int, not {!r}'.format(priority))
+    options = {'coalesce': coalesce, 'parallel': parallel, 'when': when, 'priority': priority}
+
+    def decorator(method):
+        _check_observer_params(
+            list(inspect.signature(method).parameters.values())[1:], method.__qualname__)
+        method._observe_specs = getattr(method, '_observe_specs', ()) + (
+            (next(_observe_order), event, options),)
+        return method
+    return decorator
+
+
+def _check_observer_params(params, name):
+    """Check the parameters, besides self, of the observer method with the given name."""
+    if not params:
+        raise TypeError('{} must accept event parameter'.format(name))
+    elif any(param.default is inspect.Parameter.empty for param in params[1:]):
+        # Allow for additional optional params, since there's no reason to exclude them, but
+        # required params will break.
+        raise TypeError('{} has extra required parameter'.format(name))
+
+
+def _resolve_declared_event(obj, event):
+    """Return the BoundEvent of obj that the observe decorator was given as event."""
+    try:
+        if not isinstance(event, str):
+            # An EventSource, or an event of the unbound class attribute, from the body of
+            # the class defining on.
+            bound_event = getattr(obj.on, event.event_kind)
+        elif '.' in event:
+            bound_event = functools.reduce(getattr, event.split('.'), obj)
+        else:
+            bound_event = getattr(obj.on, event)
+    except AttributeError as e:
+        raise RuntimeError('{} cannot observe {!r}: {}'.format(
+            type(obj).__name__, getattr(event, 'event_kind', event), e)) from None
+    if not isinstance(bound_event, BoundEvent):
+        raise RuntimeError('{} cannot observe {!r}: not an event'.format(
+            type(obj).__name__, event))
+    return bound_event
+
 
 class HandleKind:
     """Helper descriptor to define the Object.handle_kind field.
@@ -229,7 +647,7 @@ class HandleKind:
 class _Metaclass(type):
     """Helper class to ensure proper instantiation of Object-derived classes.
 
-    This class currently has a single purpose: events derived from EventSource
+    This class has two purposes. First, events derived from EventSource
     that are class attributes of Object-derived classes need to be told what
     their name is in that class. For example, in
 
@@ -241,9 +659,14 @@ class _Metaclass(type):
     Starting from python 3.6 we could use __set_name__ on EventSource for this,
     but until then this (meta)class does the equivalent work.
 
-    TODO: when we drop support for 3.5 drop this class, and rename _set_name in
-          EventSource to __set_name__; everything should continue to work.
+    Second, it precomputes for every class the ordered table of EventSources
+    visible on it (including inherited ones), so looking up events doesn't need
+    to go through class introspection every time, and likewise the tuple of its
+    LazyObjects and the table of the observers declared with the observe decorator.
 
+    TODO: when we drop support for 3.5 rename _set_name in EventSource to
+          __set_name__, and move the table building to __init_subclass__;
+          everything should continue to work.
     """
 
     def __new__(typ, *a, **kw):
@@ -252,12 +675,36 @@ class _Metaclass(type):
         for n, v in vars(k).items():
             # we could do duck typing here if we want to support
             # non-EventSource-derived shenanigans. We don't.
-            if isinstance(v, EventSource):
+            if isinstance(v, (EventSource, LazyObject)):
                 # this is what 3.6+ does automatically for us:
                 v._set_name(k, n)
+        k._event_sources = _collect_class_attributes(k, EventSource)
+        k._lazy_objects = tuple(_collect_class_attributes(k, LazyObject).values())
+        table = []
+        for n, v in _collect_class_attributes(k, types.FunctionType).items():
+            for order, event, options in getattr(v, '_observe_specs', ()):
+                table.append((order, n, event, options))
+        table.sort(key=lambda entry: entry[0])
+        k._observer_table = tuple(entry[1:] for entry in table)
         return k
 
 
+def _collect_class_attributes(cls, attr_type):
+    """Return an ordered {name: value} mapping of the attr_type attributes visible on cls.
+
+    The MRO is walked from the most generic class to cls itself, so that attributes
+    defined closer to cls override (or hide, if they're not attr_type) inherited ones.
+    """
+    attributes = collections.OrderedDict()
+    for klass in reversed(cls.__mro__):
+        for name, value in vars(klass).items():
+            if isinstance(value, attr_type):
+                attributes[name] = value
+            elif name in attributes:
+                del attributes[name]
+    return attributes
+
+
 class Object(metaclass=_Metaclass):
 
     handle_kind = HandleKind()
@@ -274,6 +721,10 @@ class Object(metaclass=_Metaclass):
             self.framework = parent.framework
             self.handle = Handle(parent, kind, key)
         self.framework._track(self)
+        if self._lazy_objects:
+            self.framework._register_lazy(self)
+        if self._observer_table:
+            self.framework._declared_owners.append(self)
 
         # TODO Detect conflicting handles here.
 
@@ -332,20 +783,25 @@ class ObjectEvents(Object):
         event_descriptor._set_name(cls, event_kind)
         setattr(cls, event_kind, event_descriptor)
 
+        # Keep the precomputed event tables of cls and of any subclass that
+        # sees the new event in sync with the class attributes.
+        pending = [cls]
+        while pending:
+            klass = pending.pop()
+            if getattr(klass, event_kind, None) is event_descriptor:
+                klass._event_sources[event_kind] = event_descriptor
+            pending.extend(klass.__subclasses__())
+
     def events(self):
         """Return a mapping of event_kinds to bound_events for all available events.
         """
-        events_map = {}
-        # We have to iterate over the class rather than instance to allow for properties which
-        # might call this method (e.g., event views), leading to infinite recursion.
-        for attr_name, attr_value in inspect.getmembers(type(self)):
-            if isinstance(attr_value, EventSource):
-                # We actually care about the bound_event, however, since it
-                # provides the most info for users of this method.
-                event_kind = attr_name
-                bound_event = getattr(self, event_kind)
-                events_map[event_kind] = bound_event
-        return events_map
+        # We use the class-level table rather than the instance to allow for properties
+        # which might call this method (e.g., event views), leading to infinite recursion.
+        # We actually care about the bound_event, however, since it provides the most
+        # info for users of this method.
+        cls = type(self)
+        return {event_kind: event_source.__get__(self, cls)
+                for event_kind, event_source in cls._event_sources.items()}
 
     def __getitem__(self, key):
         return PrefixedEvents(self, key)
@@ -358,7 +814,12 @@ class PrefixedEvents:
         self._prefix = key.replace("-", "_") + '_'
 
     def __getattr__(self, name):
-        return getattr(self._emitter, self._prefix + name)
+        emitter = self._emitter
+        event_kind = self._prefix + name
+        event_source = type(emitter)._event_sources.get(event_kind)
+        if event_source is None:
+            return getattr(emitter, event_kind)
+        return event_source.__get__(emitter, type(emitter))
 
 
 class PreCommitEvent(EventBase):
@@ -374,6 +835,27 @@ class FrameworkEvents(ObjectEvents):
     commit = EventSource(CommitEvent)
 
 
+class DeferralLimitError(Exception):
+    """Raised by EventBase.defer when the deferral limits don't allow another deferral."""
+
+    def __init__(self, event_path, observer_path, limit):
+        self.event_path = event_path
+        self.observer_path = observer_path
+        self.limit = limit
+
+    def __str__(self):
+        return "cannot defer {}: {} is already at the limit of {} deferred events".format(
+            self.event_path, self.observer_path, self.limit)
+
+
+def _simple_type_value_error(owner, error, prefix=''):
+    msg = "unable to save the data for {}, it must contain only simple types " \
+          "(found {!r} at data{}{}): {!r}"
+    owner_type = owner if isinstance(owner, type) else owner.__class__
+    return ValueError(msg.format(
+        owner_type.__name__, error.value, prefix, error.path, error.data))
+
+
 class NoTypeError(Exception):
 
     def __init__(self, handle_path):
@@ -393,6 +875,143 @@ More details at https://discourse.jujucharms.com/t/debugging-charm-hooks
 """
 
 
+ObserverCall = collections.namedtuple(
+    'ObserverCall', 'event_kind observer_path method_name wall_time cpu_time deferred')
+ObserverCall.__doc__ = """A single call of an observer, as passed to DispatchProfiler callbacks."""
+
+
+class ObserverStats:
+    """Accumulated timings of an observer method for one kind of event."""
+
+    __slots__ = ('calls', 'wall_time', 'cpu_time', 'deferred')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.deferred = 0
+
+
+class SnapshotStats:
+    """Accumulated time spent saving or loading snapshots (and StoredState records)."""
+
+    __slots__ = ('count', 'time')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+
+class DispatchProfiler:
+    """Collects how long observers and snapshot saving/loading take.
+
+    Enable it with :meth:`Framework.enable_profiling`. After a hook the results are in
+    :attr:`observers`, keyed by (event kind, observer path, method name), and in
+    :attr:`snapshots`, keyed by 'save' and 'load' (and 'checkpoint', for the commits
+    of incremental reemit).
+
+    Callbacks added with :meth:`add_callback` get an :class:`ObserverCall` right after
+    every observer call, e.g. to forward the timings to some other system.
+    """
+
+    def __init__(self):
+        self.observers = collections.OrderedDict()
+        self.snapshots = {
+            'save': SnapshotStats(), 'load': SnapshotStats(), 'checkpoint': SnapshotStats()}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Call callback(observer_call) after every observer call.
+
+        Callbacks are called from the thread running the observer, one at a time.
+        """
+        self._callbacks.append(callback)
+
+    def _record_call(self, call):
+        key = (call.event_kind, call.observer_path, call.method_name)
+        # Observers running in parallel may finish at the same time.
+        with self._lock:
+            stats = self.observers.get(key)
+            if stats is None:
+                stats = self.observers[key] = ObserverStats()
+            stats.calls += 1
+            stats.wall_time += call.wall_time
+            stats.cpu_time += call.cpu_time
+            if call.deferred:
+                stats.deferred += 1
+            for callback in self._callbacks:
+                callback(call)
+
+    def _snapshot_timer(self, kind):
+        return _SnapshotTimer(self.snapshots[kind])
+
+    def _timed_iter(self, kind, iterable):
+        """Yield from iterable, adding the time spent producing the items to kind."""
+        stats = self.snapshots[kind]
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stats.time += time.perf_counter() - start
+            yield item
+
+    def as_dict(self):
+        """Return the results as a JSON-serializable dict."""
+        return {
+            'observers': [{
+                'event_kind': event_kind,
+                'observer_path': observer_path,
+                'method_name': method_name,
+                'calls': stats.calls,
+                'wall_time': stats.wall_time,
+                'cpu_time': stats.cpu_time,
+                'deferred': stats.deferred,
+            } for (event_kind, observer_path, method_name), stats in self.observers.items()],
+            'snapshots': {
+                kind: {'count': stats.count, 'time': stats.time}
+                for kind, stats in self.snapshots.items()},
+        }
+
+
+class _SnapshotTimer:
+
+    __slots__ = ('_stats', '_start')
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._stats.count += 1
+        self._stats.time += time.perf_counter() - self._start
+
+
+class _NoTimer:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_timer = _NoTimer()
+
+
+# The storage record namespace of the events observed by LazyObjects.
+_LAZY_OBJECTS_NAMESPACE = '#lazy-objects#'
+# The storage record namespace of the values of cached_across_hooks methods.
+_CACHED_NAMESPACE = '#cached-across-hooks#'
+
 _event_regex = r'^(|.*/)on/[a-zA-Z_]+\[\d+\]$'
 
 
@@ -400,12 +1019,18 @@ class Framework(Object):
 
     on = FrameworkEvents()
 
+    # The maximum number of threads running parallel observers that aren't async.
+    PARALLEL_WORKERS = 8
+
     # Override properties from Object so that we can set them in __init__.
     model = None
     meta = None
     charm_dir = None
 
     def __init__(self, storage, charm_dir, meta, model):
+        # Serializes the use of the storage, and of the framework's own state, by
+        # parallel observers running on other threads.
+        self._lock = threading.RLock()
 
         super().__init__(self, None)
 
@@ -413,6 +1038,8 @@ class Framework(Object):
         self.meta = meta
         self.model = model
         self._observers = []      # [(observer_path, method_name, parent_path, event_key)]
+        # {(observer_path, method_name, parent_path, event_key): {option_name: value}}
+        self._observer_options = {}
         self._observer = weakref.WeakValueDictionary()       # {observer_path: observer}
         self._objects = weakref.WeakValueDictionary()
         self._type_registry = {}  # {(parent_path, kind): cls}
@@ -424,6 +1051,36 @@ class Framework(Object):
             storage = SQLiteStorage(storage)
         self._storage = storage
 
+        # The DispatchProfiler, if profiling was enabled.
+        self.profiler = None
+
+        # The owners of LazyObjects not looked up yet, the LazyObjects waiting for an
+        # event as {(emitter_path, event_kind): [(owner weakref, lazy_object)]}, their
+        # recorded events by record key, and the sets collecting the events observed
+        # by those being constructed.
+        self._lazy_owners = []
+        self._lazy_waiting = {}
+        # The objects whose observers declared with the observe decorator aren't
+        # registered yet.
+        self._declared_owners = []
+        self._lazy_records = {}
+        self._lazy_observed = []
+
+        # Whether events are only stored when deferred, and the (deferral, snapshot data,
+        # schedule) of those waiting to be stored; see enable_optimistic_persistence.
+        self._optimistic = False
+        self._journal = []
+
+        # How many reemitted events are dispatched between commits, if incremental
+        # reemit is enabled; see enable_incremental_reemit.
+        self._reemit_batch_size = None
+
+        # The values of cached_per_hook and cached_across_hooks methods computed or
+        # loaded in this hook, by (object handle path, method name, key). They're
+        # dropped on commit, and whenever a Juju event is emitted, as a Harness
+        # simulates several hooks without committing.
+        self._hook_caches = {}
+
         # We can't use the higher-level StoredState because it relies on events.
         self.register_type(StoredStateData, None, StoredStateData.handle_kind)
         stored_handle = Handle(None, StoredStateData.handle_kind, '_stored')
@@ -444,7 +1101,82 @@ class Framework(Object):
         debug_at = os.environ.get('JUJU_DEBUG_AT')
         self._juju_debug_at = debug_at.split(',') if debug_at else ()
 
+        # {id(event): observer_path} of the events being dispatched.
+        self._dispatching = {}
+        # The (pending, dropped, unstored) notices of the reemits in progress, innermost
+        # last; see _reemit and _check_deferral.
+        self._dispatches = []
+
+        # The asyncio event loop running async observers, and the thread pool running
+        # parallel observers that aren't async, both created on first use.
+        self._loop = None
+        self._executor = None
+        # The thread dispatching events, the only one allowed to emit them.
+        self._owner_thread = threading.get_ident()
+
+        # Limits to the deferred events backlog; see set_deferral_limits.
+        self._max_deferred_per_observer = None
+        self._max_deferred = None
+        self._deferral_eviction = EvictionPolicy.drop_oldest
+
+    def enable_profiling(self) -> DispatchProfiler:
+        """Start profiling observer calls and snapshot saving/loading.
+
+        Returns the :class:`DispatchProfiler` collecting the results, also available as
+        the profiler attribute. Calling this again returns the same profiler.
+        """
+        if self.profiler is None:
+            self.profiler = DispatchProfiler()
+        return self.profiler
+
+    def enable_optimistic_persistence(self):
+        """Only store emitted events when some observer defers them.
+
+        By default an event and its notices are stored before any observer is notified,
+        and dropped once they're all done. In optimistic mode the observers are notified
+        from memory instead, and only the events deferred by some of them are stored,
+        on :meth:`commit` or before deferred events are reemitted. If an observer raises,
+        nothing is stored for the event.
+        """
+        self._optimistic = True
+
+    def enable_incremental_reemit(self, batch_size: int = 1):
+        """Commit the progress of reemit every batch_size deferred events.
+
+        By default the notices of the deferred events that are reemitted and not deferred
+        again are dropped in the transaction committed at the end of the hook, so if the
+        hook dies every observer is notified again on the next one. With incremental
+        reemit, :meth:`commit` is called after every batch_size events are dispatched,
+        so only the events not dispatched yet are reemitted after a crash.
+
+        Each checkpoint saves the state of the charm (emitting pre-commit and commit)
+        and commits the storage, which for SQLiteStorage means a synced write. The time
+        spent in checkpoints is reported as 'checkpoint' by the profiler; see
+        :meth:`enable_profiling`.
+
+        This has no effect with JujuStorage, whose changes Juju only commits at the end
+        of the hook, so a warning is logged and every event is reemitted after a crash.
+        """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('batch_size must be a positive integer, not {!r}'.format(
+                batch_size))
+        if isinstance(self._storage, JujuStorage):
+            logger.warning('Incremental reemit has no effect when using Juju for storage.')
+            return
+        self._reemit_batch_size = batch_size
+
+    def _snapshot_timer(self, kind):
+        if self.profiler is None:
+            return _no_timer
+        return self.profiler._snapshot_timer(kind)
+
     def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
         self._storage.close()
 
     def _track(self, obj):
@@ -452,10 +1184,11 @@ class Framework(Object):
         if obj is self:
             # Framework objects don't track themselves
             return
-        if obj.handle.path in self.framework._objects:
-            raise RuntimeError(
-                'two objects claiming to be {} have been created'.format(obj.handle.path))
-        self._objects[obj.handle.path] = obj
+        with self._lock:
+            if obj.handle.path in self.framework._objects:
+                raise RuntimeError(
+                    'two objects claiming to be {} have been created'.format(obj.handle.path))
+            self._objects[obj.handle.path] = obj
 
     def _forget(self, obj):
         """Stop tracking the given object. See also _track."""
@@ -467,9 +1200,11 @@ class Framework(Object):
         # Make sure snapshots are saved by instances of StoredStateData. Any possible state
         # modifications in on_commit handlers of instances of other classes will not be persisted.
         self.on.commit.emit()
+        self._flush_journal()
         # Save our event count after all events have been emitted.
-        self.save_snapshot(self._stored)
+        self._stored.on_commit(None)
         self._storage.commit()
+        self._hook_caches.clear()
 
     def register_type(self, cls, parent, kind=None):
         if parent and not isinstance(parent, Handle):
@@ -480,8 +1215,9 @@ class Framework(Object):
             parent_path = None
         if not kind:
             kind = cls.handle_kind
-        self._type_registry[(parent_path, kind)] = cls
-        self._type_known.add(cls)
+        with self._lock:
+            self._type_registry[(parent_path, kind)] = cls
+            self._type_known.add(cls)
 
     def save_snapshot(self, value):
         """Save a persistent snapshot of the provided value.
@@ -495,29 +1231,47 @@ class Framework(Object):
         if type(value) not in self._type_known:
             raise RuntimeError(
                 'cannot save {} values before registering that type'.format(type(value).__name__))
-        data = value.snapshot()
-
-        # Use marshal as a validator, enforcing the use of simple types, as we later the
-        # information is really pickled, which is too error prone for future evolution of the
-        # stored data (e.g. if the developer stores a custom object and later changes its
-        # class name; when unpickling the original class will not be there and event
-        # data loading will fail).
-        try:
-            marshal.dumps(data)
-        except ValueError:
-            msg = "unable to save the data for {}, it must contain only simple types: {!r}"
-            raise ValueError(msg.format(value.__class__.__name__, data))
-
-        self._storage.save_snapshot(value.handle.path, data)
+        with self._snapshot_timer('save'):
+            data = value.snapshot()
+
+            # The storage enforces the use of simple types while serializing the data, as
+            # anything else is too error prone for future evolution of the stored data (e.g.
+            # if the developer stores a custom object and later changes its class name; when
+            # unpickling the original class will not be there and event data loading will
+            # fail).
+            try:
+                with self._lock:
+                    self._storage.save_snapshot(value.handle.path, data)
+            except SimpleTypeError as e:
+                raise _simple_type_value_error(value, e) from None
+
+    def _save_record(self, owner, namespace, key, data):
+        """Save a storage record on behalf of owner, enforcing simple types like save_snapshot."""
+        with self._snapshot_timer('save'):
+            try:
+                with self._lock:
+                    self._storage.save_record(namespace, key, data)
+            except SimpleTypeError as e:
+                raise _simple_type_value_error(owner, e, '[{!r}]'.format(key)) from None
 
     def load_snapshot(self, handle):
+        cls = self._snapshot_type(handle)
+        with self._snapshot_timer('load'), self._lock:
+            data = self._storage.load_snapshot(handle.path)
+            return self._restore_snapshot(cls, handle, data)
+
+    def _snapshot_type(self, handle):
+        """Return the type registered for objects with the given handle."""
         parent_path = None
         if handle.parent:
             parent_path = handle.parent.path
         cls = self._type_registry.get((parent_path, handle.kind))
         if not cls:
             raise NoTypeError(handle.path)
-        data = self._storage.load_snapshot(handle.path)
+        return cls
+
+    def _restore_snapshot(self, cls, handle, data):
+        """Build a fresh cls instance for handle out of already loaded snapshot data."""
         obj = cls.__new__(cls)
         obj.framework = self
         obj.handle = handle
@@ -526,9 +1280,12 @@ class Framework(Object):
         return obj
 
     def drop_snapshot(self, handle):
-        self._storage.drop_snapshot(handle.path)
+        with self._lock:
+            self._storage.drop_snapshot(handle.path)
 
-    def observe(self, bound_event: BoundEvent, observer: types.MethodType):
+    def observe(self, bound_event: BoundEvent, observer: types.MethodType, *,
+                coalesce: CoalescePolicy = None, parallel: bool = False,
+                when: typing.Mapping[str, typing.Any] = None, priority: int = 0):
         """Register observer to be called when bound_event is emitted.
 
         The bound_event is generally provided as an attribute of the object that emits
@@ -541,8 +1298,43 @@ class Framework(Object):
 
             framework.observe(someobj.something_happened, self._on_something_happened)
 
+        The observer may also be an ``async def`` method, which is run to completion on
+        an event loop owned by the framework before the next observer is notified.
+
+        Observers registered with parallel=True are run concurrently with the other
+        parallel observers of the same event: async ones on the event loop, and the
+        others on a pool of at most :attr:`PARALLEL_WORKERS` threads. Those threads
+        may use the model, and StoredState, whose access to the storage the framework
+        serializes with a lock, but must not emit events. The deferrals they make are
+        only checked against the limits of :meth:`set_deferral_limits` once they're all
+        done, raising DeferralLimitError from the emitting call rather than from
+        :meth:`EventBase.defer`.
+
+        Args:
+            bound_event: the event to observe.
+            observer: the method to call when the event is emitted.
+            coalesce: the :class:`CoalescePolicy` applied when the observer defers the
+                event, overriding the ``coalesce`` attribute of the event type.
+            parallel: whether the observer may run concurrently with the other
+                parallel observers of the same event. They all finish before any other
+                observer is notified, and their notices are still settled in the order
+                they were registered.
+            when: only notify the observer of the events matching these filters, checked
+                when the event is emitted, before anything is saved for the observer. It
+                maps fields from the ``filter_fields`` of the event type to the value, or
+                to a list, tuple or set of the values, accepted for them; e.g.
+                ``when={'relation_id': relation.id}`` or ``when={'app': ('pg', 'mysql')}``
+                for relation events.
+            priority: observers with a higher priority are notified of the event before
+                those with a lower one, and those with the same priority in the order
+                they were registered. An observer may stop the event from reaching the
+                observers after it with :meth:`EventBase.consume` or
+                :meth:`EventBase.defer_all`.
+
         Raises:
             RuntimeError: if bound_event or observer are the wrong type.
+            TypeError: if coalesce is not a CoalescePolicy, priority is not an int, or
+                when has fields that the event type can't be filtered on.
         """
         if not isinstance(bound_event, BoundEvent):
             raise RuntimeError(
@@ -559,6 +1351,18 @@ class Framework(Object):
             raise RuntimeError(
                 'Framework.observe requires a method as third parameter, got {}'.format(observer))
 
+        # Validate that the method has an acceptable call signature.
+        sig = inspect.signature(observer)
+        method_name = observer.__name__
+        observer = observer.__self__
+        # Self isn't included in the params list, so the first arg will be the event.
+        _check_observer_params(
+            list(sig.parameters.values()), '{}.{}'.format(type(observer).__name__, method_name))
+        self._add_observer(bound_event, observer, method_name, coalesce, parallel, when, priority)
+
+    def _add_observer(self, bound_event, observer, method_name, coalesce, parallel, when,
+                      priority=0):
+        """Register the method of observer, whose signature was checked, for bound_event."""
         event_type = bound_event.event_type
         event_kind = bound_event.event_kind
         emitter = bound_event.emitter
@@ -571,26 +1375,65 @@ class Framework(Object):
             raise RuntimeError(
                 'event emitter {} must have a "handle" attribute'.format(type(emitter).__name__))
 
-        # Validate that the method has an acceptable call signature.
-        sig = inspect.signature(observer)
-        # Self isn't included in the params list, so the first arg will be the event.
-        extra_params = list(sig.parameters.values())[1:]
-
-        method_name = observer.__name__
-        observer = observer.__self__
-        if not sig.parameters:
-            raise TypeError(
-                '{}.{} must accept event parameter'.format(type(observer).__name__, method_name))
-        elif any(param.default is inspect.Parameter.empty for param in extra_params):
-            # Allow for additional optional params, since there's no reason to exclude them, but
-            # required params will break.
-            raise TypeError(
-                '{}.{} has extra required parameter'.format(type(observer).__name__, method_name))
+        if coalesce is not None and not isinstance(coalesce, CoalescePolicy):
+            raise TypeError('coalesce must be a CoalescePolicy, not {!r}'.format(coalesce))
+        if not isinstance(priority, int):
+            raise TypeError('priority must be an int, not {!r}'.format(priority))
+        if when:
+            when = self._event_filters(event_type, when)
 
         # TODO Prevent the exact same parameters from being registered more than once.
 
-        self._observer[observer.handle.path] = observer
-        self._observers.append((observer.handle.path, method_name, emitter_path, event_kind))
+        entry = (observer.handle.path, method_name, emitter_path, event_kind)
+        options = {}
+        if coalesce is not None:
+            options['coalesce'] = coalesce
+        if parallel:
+            options['parallel'] = True
+        if when:
+            options['when'] = when
+        if priority:
+            options['priority'] = priority
+        with self._lock:
+            # An object that isn't constructed has no state to save on commit, so
+            # the framework's own events don't construct it.
+            if emitter is not self.on:
+                for observed in self._lazy_observed:
+                    observed.add((emitter_path, event_kind))
+            self._observer[observer.handle.path] = observer
+            self._observers.append(entry)
+            if options:
+                self._observer_options.setdefault(entry, {}).update(options)
+
+    def _observe_declared(self, start=0):
+        """Register the observers declared with the observe decorator of new objects.
+
+        Only the objects created after the first start ones still waiting are registered.
+        """
+        # Waiting for an event lets the objects finish their __init__ first, which
+        # may define the events (e.g. those of relations on charms).
+        owners = self._declared_owners[start:]
+        del self._declared_owners[start:]
+        for obj in owners:
+            for method_name, event, options in type(obj)._observer_table:
+                bound_event = _resolve_declared_event(obj, event)
+                self._add_observer(bound_event, obj, method_name, **options)
+
+    @staticmethod
+    def _event_filters(event_type, when):
+        """Return the when filters of observe as a tuple of (getter, accepted values)."""
+        filters = []
+        for field, accepted in when.items():
+            getter = event_type.filter_fields.get(field)
+            if getter is None:
+                raise TypeError('{} events cannot be filtered on {!r}'.format(
+                    event_type.__name__, field))
+            if isinstance(accepted, (list, tuple, set, frozenset)):
+                accepted = frozenset(accepted)
+            else:
+                accepted = frozenset((accepted,))
+            filters.append((getter, accepted))
+        return tuple(filters)
 
     def _next_event_key(self):
         """Return the next event key that should be used, incrementing the internal counter."""
@@ -601,18 +1444,19 @@ class Framework(Object):
 
     def _emit(self, event):
         """See BoundEvent.emit for the public way to call this."""
-
-        saved = False
+        self._check_emitting_thread(event)
+        if isinstance(event, (charm.HookEvent, charm.ActionEvent)):
+            self._hook_caches.clear()
+        observers = self._event_observers(event)
         event_path = event.handle.path
-        event_kind = event.handle.kind
-        parent_path = event.handle.parent.path
-        # TODO Track observers by (parent_path, event_kind) rather than as a list of
-        # all observers. Avoiding linear search through all observers for every event
-        for observer_path, method_name, _parent_path, _event_kind in self._observers:
-            if _parent_path != parent_path:
-                continue
-            if _event_kind and _event_kind != event_kind:
-                continue
+        if observers and self._optimistic:
+            # Observing the event registered its type already.
+            data = event.snapshot()
+            self._reemit(emitted=[(event_path, observer_path, method_name, data, None)
+                                  for observer_path, method_name in observers], stored=False)
+            return
+        saved = False
+        for observer_path, method_name in observers:
             if not saved:
                 # Save the event for all known observers before the first notification
                 # takes place, so that either everyone interested sees it, or nobody does.
@@ -623,6 +1467,117 @@ class Framework(Object):
         if saved:
             self._reemit(event_path)
 
+    def emit_batch(self, emissions: typing.Iterable[tuple]):
+        """Emit several events at once, e.g. one per relation or remote unit.
+
+        The events are saved together, with a single storage call for all their
+        snapshots and another for all their notices, and then dispatched in order.
+        Unlike emitting them one at a time, no observer is notified before all the
+        events are saved. See also :meth:`BoundEvent.emit_many`.
+
+        Args:
+            emissions: (bound_event, args) or (bound_event, args, kwargs) tuples, with
+                the arguments to emit each event with.
+        """
+        emissions = list(emissions)
+        if not emissions:
+            return
+        # Allocate all the event keys at once.
+        first_key = self._stored['event_count'] + 1
+        self._stored['event_count'] += len(emissions)
+        events = []
+        for i, emission in enumerate(emissions):
+            bound_event, args = emission[:2]
+            kwargs = emission[2] if len(emission) > 2 else {}
+            handle = Handle(bound_event.emitter, bound_event.event_kind, str(first_key + i))
+            event = bound_event.event_type(handle, *args, **kwargs)
+            self._check_emitting_thread(event)
+            events.append(event)
+
+        saved = []
+        snapshots = []
+        notices = []
+        for event in events:
+            observers = self._event_observers(event)
+            if not observers:
+                continue
+            # Observing the event registered its type already.
+            data = event.snapshot()
+            event_path = event.handle.path
+            saved.append(event)
+            snapshots.append((event_path, data))
+            notices.extend((event_path, observer_path, method_name, data, None)
+                           for observer_path, method_name in observers)
+        if not notices:
+            return
+        if self._optimistic:
+            self._reemit(emitted=notices, stored=False)
+            return
+        with self._snapshot_timer('save'):
+            try:
+                self._storage.save_snapshots(snapshots)
+            except SimpleTypeError as e:
+                event = next(event for event, (_, data) in zip(saved, snapshots)
+                             if data is e.data)
+                raise _simple_type_value_error(event, e) from None
+        self._storage.save_notices(notice[:3] for notice in notices)
+        self._reemit(emitted=notices)
+
+    def _check_emitting_thread(self, event):
+        if threading.get_ident() != self._owner_thread:
+            raise RuntimeError('cannot emit {} from an observer running in parallel'.format(
+                event.handle.path))
+
+    def _event_observers(self, event):
+        """Return the (observer_path, method_name) of the observers to notify of event.
+
+        They are sorted by decreasing priority, which sets the order of their notices.
+        """
+        observers = []
+        prioritized = False
+        event_kind = event.handle.kind
+        parent_path = event.handle.parent.path
+        if self._lazy_owners or self._lazy_waiting:
+            if isinstance(event, charm.UpgradeCharmEvent):
+                self._wake_lazy(None, None)
+            else:
+                self._wake_lazy(parent_path, event_kind)
+        if self._declared_owners:
+            self._observe_declared()
+        # TODO Track observers by (parent_path, event_kind) rather than as a list of
+        # all observers. Avoiding linear search through all observers for every event
+        for observer_path, method_name, _parent_path, _event_kind in self._observers:
+            if _parent_path != parent_path:
+                continue
+            if _event_kind and _event_kind != event_kind:
+                continue
+            options = self._observer_options.get(
+                (observer_path, method_name, _parent_path, _event_kind))
+            if options and 'when' in options and not all(
+                    getter(event) in accepted for getter, accepted in options['when']):
+                continue
+            priority = options.get('priority', 0) if options else 0
+            prioritized = prioritized or priority != 0
+            observers.append((priority, observer_path, method_name))
+        if prioritized:
+            # The sort is stable, keeping the registration order of equal priorities.
+            observers.sort(key=lambda observer: -observer[0])
+        return [(observer_path, method_name) for _, observer_path, method_name in observers]
+
+    def _observed_event_kinds(self, emitter_path):
+        """Return the kinds of the events of the emitter that may have observers.
+
+        That includes the events observed by lazy objects that weren't constructed yet,
+        and None if some observer was registered for all the events of the emitter.
+        """
+        if self._declared_owners:
+            self._observe_declared()
+        if self._lazy_owners:
+            self._load_lazy()
+        kinds = {kind for _, _, path, kind in self._observers if path == emitter_path}
+        kinds.update(kind for path, kind in self._lazy_waiting if path == emitter_path)
+        return kinds
+
     def reemit(self):
         """Reemit previously deferred events to the observers that deferred them.
 
@@ -630,52 +1585,605 @@ class Framework(Object):
         notified again. Observers that asked to be notified about events after it's
         been first emitted won't be notified, as that would mean potentially observing
         events out of order.
+
+        Events deferred with a schedule (see :meth:`EventBase.defer`) are only reemitted
+        once due, and so are later events from the same emitter to the same observer.
         """
         self._reemit()
 
-    def _reemit(self, single_event_path=None):
+    def _reemit(self, single_event_path=None, emitted=None, stored=True):
+        # Notices come joined with the snapshot of their event, which the storage
+        # decodes only once per event, and its raw pickled data. Each observer still
+        # gets an event object restored from its own copy of the data: the first one
+        # gets the decoded data, and those after it unpickle the raw data again.
+        # Snapshots that don't come pickled are pickled once, and never handed out
+        # as they are.
+        # Notices and snapshots to drop are collected and removed in one batch at
+        # the end, even if an observer raises.
+        # Notices of a single event path, or the emitted (event_path, observer_path,
+        # method_name, snapshot_data, None) notices of a batch, were just saved, so they
+        # can't have a schedule yet. Otherwise notices that aren't due are skipped
+        # before their snapshot is even decoded.
+        # Emitted notices that weren't stored (see enable_optimistic_persistence) have
+        # nothing to drop, and only get into the journal if deferred and dispatched
+        # without errors.
+        # Once an observer consumes the event, the notices of the observers after it
+        # are settled as if they had done the same as that observer, without calling
+        # them nor restoring the event again.
+        fresh = single_event_path is not None or emitted is not None
+        if not fresh:
+            self._flush_journal()
+            if self._declared_owners:
+                self._observe_declared()
+        schedules = {} if fresh else self._storage.notice_schedules()
+        held = self._held_notices(schedules) if schedules else set()
+        held_paths = {notice[0] for notice in held}
         last_event_path = None
         deferred = True
-        for event_path, observer_path, method_name in self._storage.notices(single_event_path):
-            event_handle = Handle.from_path(event_path)
-
-            if last_event_path != event_path:
-                if not deferred and last_event_path is not None:
-                    self._storage.drop_snapshot(last_event_path)
-                last_event_path = event_path
-                deferred = False
-
-            try:
-                event = self.load_snapshot(event_handle)
-            except NoTypeError:
-                self._storage.drop_notice(event_path, observer_path, method_name)
-                continue
-
-            event.deferred = False
-            observer = self._observer.get(observer_path)
-            if observer:
-                custom_handler = getattr(observer, method_name, None)
-                if custom_handler:
-                    event_is_from_juju = isinstance(event, charm.HookEvent)
-                    event_is_action = isinstance(event, charm.ActionEvent)
-                    if (event_is_from_juju or event_is_action) and 'hook' in self._juju_debug_at:
-                        # Present the welcome message and run under PDB.
-                        self._show_debug_code_message()
-                        pdb.runcall(custom_handler, event)
-                    else:
-                        # Regular call to the registered method.
-                        custom_handler(event)
-
+        consumer = None
+        drop_notices = []
+        drop_snapshots = []
+        deferrals = []
+        # The snapshot data and schedule of emitted events that weren't stored.
+        snapshots = {}
+        new_schedules = {}
+        # Parallel observers of the last event, as (notice, event, handler) tuples.
+        parallel = []
+        # The emitted notices not dispatched yet, or not deferred by their observer.
+        # Though already stored, they don't count against the deferral limits.
+        pending = {notice[:3] for notice in emitted} if stored and emitted else set()
+        debugging = 'hook' in self._juju_debug_at
+        if emitted is not None:
+            notices = emitted
+        else:
+            notices = self._storage.notices_with_snapshots(single_event_path, held)
+        if self.profiler is not None:
+            notices = self.profiler._timed_iter('load', notices)
+
+        def settle(notice, event):
+            nonlocal deferred, consumer
+            if event.consumed:
+                consumer = event
             if event.deferred:
                 deferred = True
+                pending.discard(notice)
+                if event.defer_schedule is not None or notice in schedules:
+                    _, attempts = schedules.get(notice, (None, 0))
+                    schedule = self._schedule_deferral(event, attempts)
+                    if stored:
+                        self._storage.set_notice_schedule(*notice, *schedule)
+                    else:
+                        new_schedules[notice] = schedule
+                policy = self._coalesce_policy(event, notice[1], notice[2])
+                key = None
+                if policy is CoalescePolicy.latest_per_key:
+                    key = event.coalesce_key()
+                deferrals.append(notice + (policy, key))
             else:
-                self._storage.drop_notice(event_path, observer_path, method_name)
+                drop_notices.append(notice)
             # We intentionally consider this event to be dead and reload it from
             # scratch in the next path.
-            self.framework._forget(event)
+            self._forget(event)
+
+        def run_parallel():
+            # Notices are settled in order once all the observers are done, and only
+            # if their observer didn't raise, nor deferred the event over the limits.
+            if not parallel:
+                return
+            errors = self._run_async(self._gather_observers(parallel))
+            error = None
+            for (notice, event, _), e in zip(parallel, errors):
+                if e is None and event.deferred:
+                    try:
+                        self._check_deferral(event, notice[1])
+                    except DeferralLimitError as limit_error:
+                        e = limit_error
+                if e is None:
+                    settle(notice, event)
+                elif error is None:
+                    error = e
+            del parallel[:]
+            if error is not None:
+                raise error
+
+        # Committing the progress of a reemit makes sense only for stored notices,
+        # which are already committed.
+        batch_size = self._reemit_batch_size if stored and not fresh else None
+        dispatched = 0
+
+        def checkpoint():
+            if drop_notices:
+                self._storage.drop_notices(drop_notices)
+                del drop_notices[:]
+            if drop_snapshots:
+                self._storage.drop_snapshots(drop_snapshots)
+                del drop_snapshots[:]
+            if deferrals:
+                self._process_deferrals(deferrals)
+                del deferrals[:]
+            with self._snapshot_timer('checkpoint'):
+                self.commit()
+
+        self._dispatches.append((pending, drop_notices, None if stored else deferrals))
+        try:
+            for event_path, observer_path, method_name, snapshot_data, raw_data in notices:
+                notice = (event_path, observer_path, method_name)
+                if last_event_path != event_path:
+                    run_parallel()
+                    if (not deferred and last_event_path is not None
+                            and last_event_path not in held_paths):
+                        drop_snapshots.append(last_event_path)
+                    if batch_size is not None and last_event_path is not None:
+                        dispatched += 1
+                        if dispatched % batch_size == 0:
+                            checkpoint()
+                    consumer = None
+                    last_event_path = event_path
+                    deferred = False
+                    # Whether snapshot_data can be handed to the next observer as it is.
+                    unshared = raw_data is not None
+                    event_handle = Handle.from_path(event_path)
+                    if not stored:
+                        snapshots[event_path] = snapshot_data
+                    if self._lazy_owners or self._lazy_waiting:
+                        self._wake_lazy(event_handle.parent.path, event_handle.kind)
+                    try:
+                        event_type = self._snapshot_type(event_handle)
+                    except NoTypeError:
+                        event_type = None
+
+                if event_type is None:
+                    drop_notices.append(notice)
+                    continue
+                if consumer is not None:
+                    settle(notice, consumer)
+                    continue
+
+                with self._snapshot_timer('load'):
+                    if unshared:
+                        data = snapshot_data
+                        unshared = False
+                    else:
+                        if raw_data is None:
+                            try:
+                                raw_data = _simple_dumps(snapshot_data)
+                            except SimpleTypeError as e:
+                                raise _simple_type_value_error(event_type, e) from None
+                        data = pickle.loads(raw_data)
+                    event = self._restore_snapshot(event_type, event_handle, data)
+                event.deferred = False
+                event.defer_schedule = None
+                event.consumed = False
+                observer = self._observer.get(observer_path)
+                custom_handler = observer and getattr(observer, method_name, None)
+                if custom_handler and not debugging and self._observer_option(
+                        event_handle, observer_path, method_name, 'parallel'):
+                    # Every parallel observer gets its own event object.
+                    self._forget(event)
+                    parallel.append((notice, event, custom_handler))
+                    continue
+                run_parallel()
+                if consumer is not None:
+                    # Consumed by one of the parallel observers just run.
+                    self._forget(event)
+                    settle(notice, consumer)
+                    continue
+                if custom_handler:
+                    self._call_observer(event, observer_path, method_name, custom_handler)
+                settle(notice, event)
+
+            run_parallel()
+            if (not deferred and last_event_path is not None
+                    and last_event_path not in held_paths):
+                drop_snapshots.append(last_event_path)
+        finally:
+            self._dispatches.pop()
+            if stored and drop_notices:
+                self._storage.drop_notices(drop_notices)
+            if stored and drop_snapshots:
+                self._storage.drop_snapshots(drop_snapshots)
+
+        if not stored:
+            self._journal.extend(
+                (deferral, snapshots[deferral[0]], new_schedules.get(deferral[:3]))
+                for deferral in deferrals)
+        elif deferrals:
+            self._process_deferrals(deferrals)
+
+    def _register_lazy(self, owner):
+        """Construct the LazyObjects of owner when the events they observe come."""
+        # Their factories may depend on the rest of the owner's __init__, so wait
+        # for the first event to look them up.
+        self._lazy_owners.append(weakref.ref(owner))
+
+    def _load_lazy(self):
+        owners, self._lazy_owners = self._lazy_owners, []
+        for owner_ref in owners:
+            owner = owner_ref()
+            if owner is None:
+                continue
+            for lazy in owner._lazy_objects:
+                key = self._lazy_record_key(owner, lazy)
+                try:
+                    events = self._storage.load_record(_LAZY_OBJECTS_NAMESPACE, key)
+                except KeyError:
+                    # Not known yet, find out now.
+                    self._construct_lazy(owner, lazy)
+                    continue
+                self._lazy_records[key] = events
+                for emitter_path, event_kind in events:
+                    self._lazy_waiting.setdefault((emitter_path, event_kind), []).append(
+                        (owner_ref, lazy))
+
+    @staticmethod
+    def _lazy_record_key(owner, lazy):
+        return owner.handle.nest('LazyObject', lazy.attr_name).path
+
+    def _wake_lazy(self, emitter_path, event_kind):
+        """Construct the LazyObjects observing the event, or all of them if it's None."""
+        if self._lazy_owners:
+            self._load_lazy()
+        if emitter_path is None:
+            waiting = [entry for entries in self._lazy_waiting.values() for entry in entries]
+            self._lazy_waiting.clear()
+        else:
+            waiting = self._lazy_waiting.pop((emitter_path, event_kind), ())
+        for owner_ref, lazy in waiting:
+            owner = owner_ref()
+            if owner is not None:
+                self._construct_lazy(owner, lazy)
+
+    def _construct_lazy(self, owner, lazy):
+        """Return the object of the LazyObject of owner, constructing it if needed."""
+        obj = owner.__dict__.get(lazy.attr_name)
+        if obj is not None:
+            return obj
+        observed = set()
+        self._lazy_observed.append(observed)
+        declared = len(self._declared_owners)
+        try:
+            obj = lazy.factory(owner)
+            # The events observed by the objects it created with the observe decorator
+            # are those of the LazyObject too.
+            if len(self._declared_owners) > declared:
+                self._observe_declared(declared)
+        finally:
+            self._lazy_observed.pop()
+        owner.__dict__[lazy.attr_name] = obj
+        events = sorted([emitter_path, event_kind] for emitter_path, event_kind in observed)
+        key = self._lazy_record_key(owner, lazy)
+        if self._lazy_records.get(key) != events:
+            self._lazy_records[key] = events
+            self._storage.save_record(_LAZY_OBJECTS_NAMESPACE, key, events)
+        return obj
+
+    def _process_deferrals(self, deferrals):
+        """Coalesce the new deferrals, and apply the deferral limits."""
+        self._coalesce_deferrals(deferrals)
+        if self._max_deferred_per_observer is not None or self._max_deferred is not None:
+            self._enforce_deferral_limits()
 
-        if not deferred and last_event_path is not None:
-            self._storage.drop_snapshot(last_event_path)
+    def _flush_journal(self):
+        """Save the events deferred without being stored, with their notices."""
+        with self._lock:
+            self._flush_journal_locked()
+
+    def _flush_journal_locked(self):
+        journal, self._journal = self._journal, []
+        if not journal:
+            return
+        snapshots = collections.OrderedDict()
+        for deferral, data, _ in journal:
+            snapshots.setdefault(deferral[0], data)
+        with self._snapshot_timer('save'):
+            try:
+                self._storage.save_snapshots(snapshots.items())
+            except SimpleTypeError as e:
+                event_path = next(path for path, data in snapshots.items() if data is e.data)
+                event_type = self._snapshot_type(Handle.from_path(event_path))
+                raise _simple_type_value_error(event_type, e) from None
+        self._storage.save_notices(deferral[:3] for deferral, _, _ in journal)
+        for deferral, _, schedule in journal:
+            if schedule is not None:
+                self._storage.set_notice_schedule(*deferral[:3], *schedule)
+        self._process_deferrals([deferral for deferral, _, _ in journal])
+
+    def _call_observer(self, event, observer_path, method_name, handler):
+        """Call handler with event, running it to completion if it's a coroutine function."""
+        event_is_from_juju = isinstance(event, charm.HookEvent)
+        event_is_action = isinstance(event, charm.ActionEvent)
+        debug = (event_is_from_juju or event_is_action) and 'hook' in self._juju_debug_at
+        if debug:
+            # Present the welcome message and run under PDB.
+            self._show_debug_code_message()
+        if inspect.iscoroutinefunction(handler):
+            coro = self._await_observer(event, observer_path, method_name, handler)
+            if debug:
+                pdb.runcall(self._run_async, coro)
+            else:
+                self._run_async(coro)
+            return
+        start = self._observer_started(event, observer_path)
+        try:
+            if debug:
+                pdb.runcall(handler, event)
+            else:
+                # Regular call to the registered method.
+                handler(event)
+        finally:
+            self._observer_finished(event, observer_path, method_name, start)
+
+    async def _await_observer(self, event, observer_path, method_name, handler):
+        start = self._observer_started(event, observer_path)
+        try:
+            await handler(event)
+        finally:
+            self._observer_finished(event, observer_path, method_name, start)
+
+    async def _gather_observers(self, calls):
+        """Run the (notice, event, handler) calls concurrently, returning their errors."""
+        loop = asyncio.get_event_loop()
+        pending = []
+        for notice, event, handler in calls:
+            if inspect.iscoroutinefunction(handler):
+                pending.append(self._await_observer(event, notice[1], notice[2], handler))
+            else:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        self.PARALLEL_WORKERS)
+                pending.append(loop.run_in_executor(
+                    self._executor, self._call_observer, event, notice[1], notice[2], handler))
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        return [e if isinstance(e, BaseException) else None for e in results]
+
+    def _observer_started(self, event, observer_path):
+        self._dispatching[id(event)] = observer_path
+        if self.profiler is not None:
+            return time.perf_counter(), time.process_time()
+        return None
+
+    def _observer_finished(self, event, observer_path, method_name, start):
+        del self._dispatching[id(event)]
+        if start is not None:
+            wall_start, cpu_start = start
+            self.profiler._record_call(ObserverCall(
+                event.handle.kind, observer_path, method_name,
+                time.perf_counter() - wall_start, time.process_time() - cpu_start,
+                event.deferred))
+
+    def _run_async(self, coro):
+        """Run coro to completion on the framework's event loop, returning its result.
+
+        The loop is created on first use, and closed together with the framework.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        if self._loop.is_running():
+            # An async observer emitted an event. Its loop is blocked until the event is
+            # dispatched, so the observers of that event need a loop of their own.
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                return executor.submit(self._run_in_new_loop, coro).result()
+        return self._loop.run_until_complete(coro)
+
+    def _run_in_new_loop(self, coro):
+        # The calling thread is blocked meanwhile, so hand it the framework.
+        owner_thread = self._owner_thread
+        self._owner_thread = threading.get_ident()
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+            self._owner_thread = owner_thread
+
+    @staticmethod
+    def _schedule_deferral(event, attempts):
+        """Return the (due, attempts) schedule for the notice of a deferred event."""
+        if event.defer_schedule is None:
+            return None, attempts
+        until, backoff = event.defer_schedule
+        due = until
+        if backoff is not None:
+            retry = time.time() + backoff * 2 ** attempts
+            due = retry if due is None else max(due, retry)
+            attempts += 1
+        return due, attempts
+
+    def _held_notices(self, schedules):
+        """Return the notices that must not be reemitted yet.
+
+        Those are the notices that are not due yet, plus any later notice from the
+        same emitter to the same observer, so that their ordering is preserved.
+        """
+        now = time.time()
+        if all(due is None or due <= now for due, _ in schedules.values()):
+            return set()
+        held = set()
+        held_routes = set()
+        for notice in self._storage.notices(None):
+            event_path, observer_path, _ = notice
+            parent = Handle.from_path(event_path).parent
+            route = (parent.path if parent else None, observer_path)
+            due, _ = schedules.get(notice, (None, 0))
+            if route in held_routes or (due is not None and due > now):
+                held.add(notice)
+                held_routes.add(route)
+        return held
+
+    def _observer_option(self, event_handle, observer_path, method_name, name):
+        """Return the named option given to observe for the observer, or None."""
+        entry = (observer_path, method_name, event_handle.parent.path, event_handle.kind)
+        options = self._observer_options.get(entry)
+        if options:
+            return options.get(name)
+        return None
+
+    def _coalesce_policy(self, event, observer_path, method_name):
+        """Return the CoalescePolicy that applies to observer_path deferring event."""
+        policy = self._observer_option(event.handle, observer_path, method_name, 'coalesce')
+        if policy is not None:
+            return policy
+        return event.coalesce
+
+    def _coalesce_deferrals(self, deferrals):
+        """Drop the stored notices superseded by the given deferrals.
+
+        A notice is superseded when it precedes the deferred one, is for the same
+        observer method and for an event of the same kind and emitter, and (for the
+        latest_per_key policy) its event has the same coalesce_key.
+        """
+        deferrals = [deferral for deferral in deferrals
+                     if deferral[3] is not CoalescePolicy.keep_all]
+        if not deferrals:
+            return
+        notices = list(self._storage.notices(None))
+        superseded = set()
+        for event_path, observer_path, method_name, policy, key in deferrals:
+            handle = Handle.from_path(event_path)
+            for notice in notices:
+                other_path, other_observer_path, other_method_name = notice
+                if other_path == event_path:
+                    # Only older notices are superseded.
+                    break
+                if (notice in superseded or other_observer_path != observer_path
+                        or other_method_name != method_name):
+                    continue
+                other_handle = Handle.from_path(other_path)
+                if (other_handle.kind != handle.kind
+                        or other_handle.parent.path != handle.parent.path):
+                    continue
+                if policy is CoalescePolicy.latest_per_key:
+                    try:
+                        other_event = self.load_snapshot(other_handle)
+                    except (NoTypeError, NoSnapshotError):
+                        continue
+                    other_key = other_event.coalesce_key()
+                    self._forget(other_event)
+                    if other_key != key:
+                        continue
+                logger.debug('Dropping deferred %s for %s.%s, superseded by %s.',
+                             other_path, observer_path, method_name, event_path)
+                superseded.add(notice)
+
+        self._drop_stored_notices(superseded, notices)
+
+    def _drop_stored_notices(self, to_drop, notices):
+        """Drop the to_drop notices, and the snapshots no other notice refers to.
+
+        notices must hold all the notices currently in storage.
+        """
+        if not to_drop:
+            return
+        self._storage.drop_notices(to_drop)
+        remaining = {notice[0] for notice in notices if notice not in to_drop}
+        self._storage.drop_snapshots(
+            {notice[0] for notice in to_drop if notice[0] not in remaining})
+
+    def set_deferral_limits(self, *, per_observer: int = None, total: int = None,
+                            eviction: 'EvictionPolicy' = None):
+        """Limit how many deferred events are kept in storage.
+
+        Without limits, an observer that keeps deferring makes the backlog of
+        deferred events (and the time spent reemitting it on every hook) grow forever.
+        When a deferral takes the backlog over a limit, events are evicted according
+        to the eviction policy, :attr:`evicted_count` is increased, and a warning
+        naming the observer is logged.
+
+        Args:
+            per_observer: maximum number of deferred events kept for each observer.
+            total: maximum number of deferred events kept overall.
+            eviction: the :class:`EvictionPolicy` to apply; drop_oldest by default.
+        """
+        for name, value in (('per_observer', per_observer), ('total', total)):
+            if value is not None and (not isinstance(value, int) or value < 1):
+                raise ValueError('{} limit must be a positive int, not {!r}'.format(name, value))
+        if eviction is None:
+            eviction = EvictionPolicy.drop_oldest
+        elif not isinstance(eviction, EvictionPolicy):
+            raise TypeError('eviction must be an EvictionPolicy, not {!r}'.format(eviction))
+        self._max_deferred_per_observer = per_observer
+        self._max_deferred = total
+        self._deferral_eviction = eviction
+
+    @property
+    def evicted_count(self) -> int:
+        """The number of deferred events evicted because of the deferral limits."""
+        return self._stored['evicted_count'] or 0
+
+    def _check_deferral(self, event, observer_path=None):
+        """Raise DeferralLimitError if event can't be deferred under the refuse policy.
+
+        Deferrals from parallel observers running on other threads are only checked
+        by the dispatching thread, once all those observers are done.
+        """
+        if self._deferral_eviction is not EvictionPolicy.refuse:
+            return
+        if observer_path is None:
+            if threading.get_ident() != self._owner_thread:
+                return
+            observer_path = self._dispatching.get(id(event))
+            if observer_path is None:
+                return
+        event_path = event.handle.path
+        with self._lock:
+            self._flush_journal()
+            notices = list(self._storage.notices(None))
+        # Leave out the notices the reemits in progress haven't settled as deferred,
+        # and add those they did but haven't stored yet.
+        excluded = set()
+        for pending, dropped, unstored in self._dispatches:
+            excluded.update(pending)
+            excluded.update(dropped)
+            if unstored:
+                notices.extend(deferral[:3] for deferral in unstored)
+        others = [notice for notice in notices
+                  if notice[0] != event_path and notice not in excluded]
+        limit = self._max_deferred
+        if limit is not None and len(others) >= limit:
+            raise DeferralLimitError(event_path, observer_path, limit)
+        limit = self._max_deferred_per_observer
+        if limit is not None:
+            mine = [notice for notice in others if notice[1] == observer_path]
+            if len(mine) >= limit:
+                raise DeferralLimitError(event_path, observer_path, limit)
+
+    def _enforce_deferral_limits(self):
+        """Evict deferred events exceeding the configured limits."""
+        eviction = self._deferral_eviction
+        if eviction is EvictionPolicy.refuse:
+            # Nothing to evict, deferrals over the limit were refused.
+            return
+        notices = list(self._storage.notices(None))
+        evicted = []
+
+        def evict(candidates, limit):
+            excess = len(candidates) - limit
+            if excess <= 0:
+                return
+            if eviction is EvictionPolicy.drop_oldest:
+                victims = candidates[:excess]
+            else:
+                victims = candidates[-excess:]
+            for notice in victims:
+                logger.warning(
+                    'Deferred events for %s exceeded the limit of %d; evicting %s.',
+                    notice[1], limit, notice[0])
+                evicted.append(notice)
+
+        limit = self._max_deferred_per_observer
+        if limit is not None:
+            per_observer = collections.OrderedDict()
+            for notice in notices:
+                per_observer.setdefault(notice[1], []).append(notice)
+            for candidates in per_observer.values():
+                evict(candidates, limit)
+        limit = self._max_deferred
+        if limit is not None:
+            evict([notice for notice in notices if notice not in evicted], limit)
+
+        if evicted:
+            self._drop_stored_notices(set(evicted), notices)
+            self._stored['evicted_count'] = self.evicted_count + len(evicted)
 
     def _show_debug_code_message(self):
         """Present the welcome message (only once!) when using debugger functionality."""
@@ -741,44 +2249,149 @@ class Framework(Object):
 
 class StoredStateData(Object):
 
+    # The snapshot of StoredStateData is only the list of its keys. Each value is saved as
+    # a separate storage record, namespaced by the handle path, and only the values that
+    # changed are saved on commit.
+
     def __init__(self, parent, attr_name):
         super().__init__(parent, attr_name)
         self._cache = {}
-        self.dirty = False
+        self._dirty_keys = set()
+        self._keys_changed = False
+        # The StoredDict/StoredList/StoredSet wrapping each container within the value of
+        # a key, as {key: {id(container): wrapper}}; see _wrap_stored.
+        self._wrappers = {}
+
+    @property
+    def dirty(self):
+        return bool(self._dirty_keys or self._keys_changed)
+
+    def _mark_dirty(self, key):
+        self._dirty_keys.add(key)
+
+    def _forget_wrappers(self, key, value):
+        _forget_stored_wrappers(self._wrappers.get(key), value)
 
     def __getitem__(self, key):
         return self._cache.get(key)
 
     def __setitem__(self, key, value):
+        if key not in self._cache:
+            self._keys_changed = True
+        elif self._cache[key] is not value:
+            self._wrappers.pop(key, None)
         self._cache[key] = value
-        self.dirty = True
+        self._dirty_keys.add(key)
 
     def __contains__(self, key):
         return key in self._cache
 
     def snapshot(self):
-        return self._cache
+        return sorted(self._cache)
 
     def restore(self, snapshot):
-        self._cache = snapshot
-        self.dirty = False
+        self._wrappers = {}
+        if isinstance(snapshot, dict):
+            # Saved by an older version, with all the values in the snapshot itself;
+            # they're moved to their own records on the next commit.
+            self._cache = snapshot
+            self._dirty_keys = set(snapshot)
+            self._keys_changed = True
+        else:
+            self._cache = self.framework._storage.load_records(self.handle.path, snapshot)
+            self._dirty_keys = set()
+            self._keys_changed = False
+
+    def on_commit(self, event):
+        for key in sorted(self._dirty_keys):
+            self.framework._save_record(self, self.handle.path, key, self._cache[key])
+        self._dirty_keys.clear()
+        if self._keys_changed:
+            self.framework.save_snapshot(self)
+            self._keys_changed = False
+
+
+# The types of the values StoredState accepts.
+_STORED_TYPES = (type(None), bool, int, float, str, bytes, list, dict, set)
+
+
+class TypedStoredStateData(StoredStateData):
+    """The storage side of a StoredState with a schema.
+
+    All the fields are always present, with their default until they're set. The
+    snapshot is the tuple of the field names and the tuple of their values, saved as
+    a single unit only when some value changed.
+    """
+
+    # The {name: (types, default)} of the fields, set on the subclass StoredState
+    # creates for its schema.
+    schema = {}
+
+    def __init__(self, parent, attr_name):
+        super().__init__(parent, attr_name)
+        self._set_defaults()
+        self._legacy_keys = ()
+
+    def _set_defaults(self):
+        self._cache = {
+            name: copy.deepcopy(default) for name, (_, default) in self.schema.items()}
+
+    def check(self, key, value):
+        """Raise AttributeError if value can't be stored in the field key."""
+        try:
+            types, default = self.schema[key]
+        except KeyError:
+            raise AttributeError('attribute {!r} is not in the schema of {}'.format(
+                key, self.handle.path)) from None
+        if type(value) not in types and not (value is None and default is None):
+            raise AttributeError('attribute {!r} must be a {}, not {!r}'.format(
+                key, _type_names(types), value))
+
+    def snapshot(self):
+        names = tuple(sorted(self.schema))
+        return names, tuple(self._cache[name] for name in names)
+
+    def restore(self, snapshot):
+        self._wrappers = {}
+        self._set_defaults()
+        self._dirty_keys = set()
+        self._keys_changed = False
+        self._legacy_keys = ()
+        if isinstance(snapshot, tuple):
+            values = dict(zip(*snapshot))
+        elif isinstance(snapshot, dict):
+            values = snapshot
+            self._keys_changed = True
+        else:
+            # Saved without a schema, as a record per key; it's converted on commit.
+            values = self.framework._storage.load_records(self.handle.path, snapshot)
+            self._legacy_keys = tuple(snapshot)
+            self._keys_changed = True
+        for name, value in values.items():
+            # Fields dropped from the schema are forgotten.
+            if name in self.schema:
+                self._cache[name] = value
 
     def on_commit(self, event):
         if self.dirty:
             self.framework.save_snapshot(self)
-            self.dirty = False
+            self._dirty_keys.clear()
+            self._keys_changed = False
+        for key in self._legacy_keys:
+            self.framework._storage.drop_record(self.handle.path, key)
+        self._legacy_keys = ()
 
 
 class BoundStoredState:
 
-    def __init__(self, parent, attr_name):
-        parent.framework.register_type(StoredStateData, parent)
+    def __init__(self, parent, attr_name, data_type=StoredStateData):
+        parent.framework.register_type(data_type, parent)
 
-        handle = Handle(parent, StoredStateData.handle_kind, attr_name)
+        handle = Handle(parent, data_type.handle_kind, attr_name)
         try:
             data = parent.framework.load_snapshot(handle)
         except NoSnapshotError:
-            data = StoredStateData(parent, attr_name)
+            data = data_type(parent, attr_name)
 
         # __dict__ is used to avoid infinite recursion.
         self.__dict__["_data"] = data
@@ -792,7 +2405,7 @@ class BoundStoredState:
             return self._data.on
         if key not in self._data:
             raise AttributeError("attribute '{}' is not stored".format(key))
-        return _wrap_stored(self._data, self._data[key])
+        return _wrap_stored(self._data, self._data[key], key)
 
     def __setattr__(self, key, value):
         if key == "on":
@@ -800,7 +2413,9 @@ class BoundStoredState:
 
         value = _unwrap_stored(self._data, value)
 
-        if not isinstance(value, (type(None), int, float, str, bytes, list, dict, set)):
+        if isinstance(self._data, TypedStoredStateData):
+            self._data.check(key, value)
+        elif not isinstance(value, _STORED_TYPES):
             raise AttributeError(
                 'attribute {!r} cannot be a {}: must be int/float/dict/list/etc'.format(
                     key, type(value).__name__))
@@ -809,6 +2424,8 @@ class BoundStoredState:
 
     def set_default(self, **kwargs):
         """"Set the value of any given key if it has not already been set"""
+        if isinstance(self._data, TypedStoredStateData):
+            raise TypeError('the defaults of a StoredState with a schema are in the schema')
         for k, v in kwargs.items():
             if k not in self._data:
                 self._data[k] = v
@@ -837,19 +2454,63 @@ class StoredState:
         def _on_seen(self, event):
             self._stored.seen.add(event.uuid)
 
+    Alternatively, the fields may be declared with a schema, mapping their names to
+    their type, or to a tuple of their type and default (which is otherwise None)::
+
+        class MyClass(Object):
+            _stored = StoredState(schema={
+                'seen': (set, set()),
+                'started': (bool, False),
+                'leader_address': str,
+            })
+
+    Their values are then checked when they're set: setting a field that isn't in
+    the schema, or to a value that isn't exactly of its type (or of one of its types,
+    if it's a tuple of types), raises AttributeError; so a bool isn't accepted for an
+    int field. Such state is saved as a unit,
+    in a compact encoding. Fields removed from the schema are dropped from storage,
+    and fields added to it start from their default.
     """
 
-    def __init__(self):
+    def __init__(self, schema: typing.Mapping[str, typing.Any] = None):
         self.parent_type = None
         self.attr_name = None
+        self._data_type = StoredStateData
+        if schema is not None:
+            self._data_type = type('StoredStateData', (TypedStoredStateData,), {
+                'schema': self._parse_schema(schema)})
+
+    @staticmethod
+    def _parse_schema(schema):
+        fields = {}
+        for name, spec in schema.items():
+            if not isinstance(name, str) or not name.isidentifier() or name == 'on':
+                raise ValueError('invalid StoredState field name {!r}'.format(name))
+            if isinstance(spec, tuple) and len(spec) == 2 and not isinstance(spec[1], type):
+                types, default = spec
+            else:
+                types, default = spec, None
+            if not isinstance(types, tuple):
+                types = (types,)
+            for t in types:
+                if t not in _STORED_TYPES:
+                    raise TypeError('StoredState field {} cannot be of type {!r}'.format(name, t))
+            if default is not None and type(default) not in types:
+                raise TypeError('default {!r} of StoredState field {} is not a {}'.format(
+                    default, name, _type_names(types)))
+            fields[name] = (types, default)
+        return fields
+
+    def _bind(self, parent, attr_name):
+        return BoundStoredState(parent, attr_name, self._data_type)
 
     def __get__(self, parent, parent_type=None):
         if self.parent_type is not None and self.parent_type not in parent_type.mro():
             # the StoredState instance is being shared between two unrelated classes
             # -> unclear what is exepcted of us -> bail out
             raise RuntimeError(
-                'StoredState shared by {} and {}'.format(
-                    self.parent_type.__name__, parent_type.__name__))
+                '{} shared by {} and {}'.format(
+                    self.__class__.__name__, self.parent_type.__name__, parent_type.__name__))
 
         if parent is None:
             # accessing via the class directly (e.g. MyClass.stored)
@@ -862,42 +2523,218 @@ class StoredState:
                 # we already have the thing from a previous pass, huzzah
                 return bound
 
-        # need to find ourselves amongst the parent's bases
-        for cls in parent_type.mro():
-            for attr_name, attr_value in cls.__dict__.items():
-                if attr_value is not self:
-                    continue
-                # we've found ourselves! is it the first time?
+        # Parallel observers may bind the state concurrently, only one of them does.
+        with parent.framework._lock:
+            if self.attr_name is not None:
+                bound = parent.__dict__.get(self.attr_name)
                 if bound is not None:
-                    # the StoredState instance is being stored in two different
-                    # attributes -> unclear what is expected of us -> bail out
-                    raise RuntimeError("StoredState shared by {0}.{1} and {0}.{2}".format(
-                        cls.__name__, self.attr_name, attr_name))
-                # we've found ourselves for the first time; save where, and bind the object
-                self.attr_name = attr_name
-                self.parent_type = cls
-                bound = BoundStoredState(parent, attr_name)
-
-        if bound is not None:
-            # cache the bound object to avoid the expensive lookup the next time
-            # (don't use setattr, to keep things symmetric with the fast-path lookup above)
-            parent.__dict__[self.attr_name] = bound
-            return bound
+                    return bound
+
+            # need to find ourselves amongst the parent's bases
+            for cls in parent_type.mro():
+                for attr_name, attr_value in cls.__dict__.items():
+                    if attr_value is not self:
+                        continue
+                    # we've found ourselves! is it the first time?
+                    if bound is not None:
+                        # the StoredState instance is being stored in two different
+                        # attributes -> unclear what is expected of us -> bail out
+                        raise RuntimeError("{0} shared by {1}.{2} and {1}.{3}".format(
+                            self.__class__.__name__, cls.__name__, self.attr_name, attr_name))
+                    # we've found ourselves for the first time; save where, and bind the object
+                    self.attr_name = attr_name
+                    self.parent_type = cls
+                    bound = self._bind(parent, attr_name)
+
+            if bound is not None:
+                # cache the bound object to avoid the expensive lookup the next time
+                # (don't use setattr, to keep things symmetric with the fast-path lookup above)
+                parent.__dict__[self.attr_name] = bound
+                return bound
 
         raise AttributeError(
             'cannot find {} attribute in type {}'.format(
                 self.__class__.__name__, parent_type.__name__))
 
 
-def _wrap_stored(parent_data, value):
+class StoredMappingData(Object):
+    """The storage side of a StoredMapping.
+
+    Each key is its own storage record in the namespace of the handle path. Records are
+    loaded as they're accessed, and only the changed ones are saved on commit.
+    """
+
+    # How many keys are listed from storage at once when iterating.
+    page_size = 100
+
+    def __init__(self, parent, attr_name):
+        super().__init__(parent, attr_name)
+        self._cache = {}
+        self._dirty_keys = set()
+        self._deleted_keys = set()
+        # Container wrappers, as in StoredStateData.
+        self._wrappers = {}
+
+    def _mark_dirty(self, key):
+        self._dirty_keys.add(key)
+
+    def _forget_wrappers(self, key, value):
+        _forget_stored_wrappers(self._wrappers.get(key), value)
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            if key in self._deleted_keys:
+                raise
+        with self.framework._lock:
+            value = self._cache[key] = self.framework._storage.load_record(self.handle.path, key)
+        return value
+
+    def __setitem__(self, key, value):
+        if self._cache.get(key, value) is not value:
+            self._wrappers.pop(key, None)
+        self._cache[key] = value
+        self._deleted_keys.discard(key)
+        self._dirty_keys.add(key)
+
+    def __delitem__(self, key):
+        self[key]  # Raise KeyError if there's no such key.
+        del self._cache[key]
+        self._wrappers.pop(key, None)
+        self._dirty_keys.discard(key)
+        self._deleted_keys.add(key)
+
+    def _stored_keys(self):
+        storage = self.framework._storage
+        after = None
+        while True:
+            page = storage.list_records(self.handle.path, after=after, limit=self.page_size)
+            yield from page
+            if len(page) < self.page_size:
+                break
+            after = page[-1]
+
+    def keys(self):
+        """Iterate over the keys in order, listing the stored ones a page at a time."""
+        last = None
+        for key in heapq.merge(self._stored_keys(), sorted(self._dirty_keys)):
+            if key == last or key in self._deleted_keys:
+                continue
+            last = key
+            yield key
+
+    def on_commit(self, event):
+        namespace = self.handle.path
+        for key in sorted(self._dirty_keys):
+            self.framework._save_record(self, namespace, key, self._cache[key])
+        for key in sorted(self._deleted_keys):
+            self.framework._storage.drop_record(namespace, key)
+        self._dirty_keys.clear()
+        self._deleted_keys.clear()
+
+
+class BoundStoredMapping(collections.abc.MutableMapping):
+    """The mapping StoredMapping provides on instances; see StoredMapping."""
+
+    def __init__(self, parent, attr_name):
+        self._data = StoredMappingData(parent, attr_name)
+        parent.framework.observe(parent.framework.on.commit, self._data.on_commit)
+
+    def __getitem__(self, key):
+        return _wrap_stored(self._data, self._data[key], key)
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, str):
+            raise TypeError('StoredMapping keys must be strings, not {}'.format(
+                type(key).__name__))
+        value = _unwrap_stored(self._data, value)
+        if not isinstance(value, _STORED_TYPES):
+            raise TypeError(
+                'value for {!r} cannot be a {}: must be int/float/dict/list/etc'.format(
+                    key, type(value).__name__))
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        try:
+            self._data[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return self._data.keys()
+
+    def __len__(self):
+        return sum(1 for _ in self._data.keys())
+
+
+class StoredMapping(StoredState):
+    """A persistent mapping of string keys to simple values, stored key by key.
+
+    Unlike StoredState, which loads and saves its data as a unit, every key of a
+    StoredMapping is a separate storage record: only the keys that are read get loaded,
+    and only the keys that changed are saved on commit. This suits large collections,
+    like per-unit or per-relation data across many peers::
+
+        class MyCharm(CharmBase):
+            peers = StoredMapping()
+
+            def _on_peer_relation_changed(self, event):
+                self.peers[event.unit.name] = {'addr': event.relation.data[event.unit]['addr']}
+
+    Iterating lists the stored keys from storage in order, a page at a time.
+    """
+
+    def __init__(self):
+        # Its values are free-form, so unlike StoredState it takes no schema.
+        super().__init__()
+
+    def _bind(self, parent, attr_name):
+        return BoundStoredMapping(parent, attr_name)
+
+
+def _wrap_stored(parent_data, value, key):
     t = type(value)
     if t is dict:
-        return StoredDict(parent_data, value)
-    if t is list:
-        return StoredList(parent_data, value)
-    if t is set:
-        return StoredSet(parent_data, value)
-    return value
+        wrapper_type = StoredDict
+    elif t is list:
+        wrapper_type = StoredList
+    elif t is set:
+        wrapper_type = StoredSet
+    else:
+        return value
+    # Wrappers are cached so repeated reads neither allocate nor change identity. A cached
+    # wrapper keeps its container alive, so the id can't be reused while it's cached.
+    wrappers = parent_data._wrappers.get(key)
+    if wrappers is None:
+        wrappers = parent_data._wrappers[key] = {}
+    wrapper = wrappers.get(id(value))
+    if wrapper is None or wrapper._under is not value:
+        wrapper = wrappers[id(value)] = wrapper_type(parent_data, value, key)
+    return wrapper
+
+
+def _forget_stored_wrappers(wrappers, value):
+    """Drop the cached wrappers of value and the containers within it."""
+    if not wrappers:
+        return
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        t = type(value)
+        if t is dict:
+            stack.extend(value.values())
+        elif t is list:
+            stack.extend(value)
+        elif t is not set:
+            continue
+        wrapper = wrappers.get(id(value))
+        if wrapper is not None and wrapper._under is value:
+            del wrappers[id(value)]
 
 
 def _unwrap_stored(parent_data, value):
@@ -909,20 +2746,28 @@ def _unwrap_stored(parent_data, value):
 
 class StoredDict(collections.abc.MutableMapping):
 
-    def __init__(self, stored_data, under):
+    __slots__ = ('_stored_data', '_under', '_key')
+
+    def __init__(self, stored_data, under, key):
         self._stored_data = stored_data
         self._under = under
+        # The top-level key of stored_data this value is under.
+        self._key = key
 
     def __getitem__(self, key):
-        return _wrap_stored(self._stored_data, self._under[key])
+        return _wrap_stored(self._stored_data, self._under[key], self._key)
 
     def __setitem__(self, key, value):
+        if key in self._under:
+            self._stored_data._forget_wrappers(self._key, self._under[key])
         self._under[key] = _unwrap_stored(self._stored_data, value)
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def __delitem__(self, key):
+        if key in self._under:
+            self._stored_data._forget_wrappers(self._key, self._under[key])
         del self._under[key]
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def __iter__(self):
         return self._under.__iter__()
@@ -941,31 +2786,37 @@ class StoredDict(collections.abc.MutableMapping):
 
 class StoredList(collections.abc.MutableSequence):
 
-    def __init__(self, stored_data, under):
+    __slots__ = ('_stored_data', '_under', '_key')
+
+    def __init__(self, stored_data, under, key):
         self._stored_data = stored_data
         self._under = under
+        # The top-level key of stored_data this value is under.
+        self._key = key
 
     def __getitem__(self, index):
-        return _wrap_stored(self._stored_data, self._under[index])
+        return _wrap_stored(self._stored_data, self._under[index], self._key)
 
     def __setitem__(self, index, value):
+        self._stored_data._forget_wrappers(self._key, self._under[index])
         self._under[index] = _unwrap_stored(self._stored_data, value)
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def __delitem__(self, index):
+        self._stored_data._forget_wrappers(self._key, self._under[index])
         del self._under[index]
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def __len__(self):
         return len(self._under)
 
     def insert(self, index, value):
         self._under.insert(index, value)
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def append(self, value):
         self._under.append(value)
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def __eq__(self, other):
         if isinstance(other, StoredList):
@@ -1010,17 +2861,21 @@ class StoredList(collections.abc.MutableSequence):
 
 class StoredSet(collections.abc.MutableSet):
 
-    def __init__(self, stored_data, under):
+    __slots__ = ('_stored_data', '_under', '_key')
+
+    def __init__(self, stored_data, under, key):
         self._stored_data = stored_data
         self._under = under
+        # The top-level key of stored_data this value is under.
+        self._key = key
 
     def add(self, key):
         self._under.add(key)
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def discard(self, key):
         self._under.discard(key)
-        self._stored_data.dirty = True
+        self._stored_data._mark_dirty(self._key)
 
     def __contains__(self, key):
         return key in self._under
@@ -1065,3 +2920,148 @@ class StoredSet(collections.abc.MutableSet):
             return self._under == other
         else:
             return NotImplemented
+
+
+CacheInfo = collections.namedtuple('CacheInfo', 'hits misses')
+CacheInfo.__doc__ = """The hits and misses of a cached method, as returned by its cache_info()."""
+
+
+def _call_key(args, kwargs):
+    if not kwargs:
+        return args
+    return args + tuple(sorted(kwargs.items()))
+
+
+class _CachedMethod:
+    """A method of an Object whose results are cached; see cached_per_hook."""
+
+    def __init__(self, method):
+        functools.update_wrapper(self, method)
+        self._method = method
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        # Attributes like cache_info are still reachable through the bound method.
+        return types.MethodType(self, obj)
+
+    def __call__(self, obj, *args, **kwargs):
+        caches = obj.framework._hook_caches
+        key = (obj.handle.path, self.__qualname__, _call_key(args, kwargs))
+        try:
+            value = caches[key]
+        except KeyError:
+            self._count(hit=False)
+            value = caches[key] = self._method(obj, *args, **kwargs)
+        else:
+            self._count(hit=True)
+        return value
+
+    def _count(self, hit):
+        # Methods may be called by observers running in parallel.
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def cache_info(self) -> CacheInfo:
+        """Return how many calls, on any object, were served from the cache or not."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses)
+
+
+class _CachedAcrossHooksMethod(_CachedMethod):
+    """A method of an Object whose results are stored; see cached_across_hooks."""
+
+    def __init__(self, method, key, ttl):
+        super().__init__(method)
+        self._key = key
+        self._ttl = ttl
+
+    def _digest(self, obj, args, kwargs):
+        inputs = [self._key(obj, *args, **kwargs), list(args), sorted(kwargs.items())]
+        try:
+            encoded = json.dumps(inputs, sort_keys=True)
+        except TypeError as e:
+            raise TypeError('inputs of cached method {} must be JSON serializable: {}'.format(
+                self.__qualname__, e)) from None
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _fresh(self, entry, digest):
+        if entry is None or entry['digest'] != digest:
+            return False
+        return self._ttl is None or time.time() - entry['time'] < self._ttl
+
+    def __call__(self, obj, *args, **kwargs):
+        framework = obj.framework
+        digest = self._digest(obj, args, kwargs)
+        record_key = '{}/{}'.format(obj.handle.path, self.__qualname__)
+        cache_key = (obj.handle.path, self.__qualname__, None)
+        entry = framework._hook_caches.get(cache_key)
+        if entry is None:
+            try:
+                with framework._lock:
+                    entry = framework._storage.load_record(_CACHED_NAMESPACE, record_key)
+            except KeyError:
+                pass
+        if self._fresh(entry, digest):
+            self._count(hit=True)
+        else:
+            self._count(hit=False)
+            value = self._method(obj, *args, **kwargs)
+            entry = {'digest': digest, 'time': time.time(), 'value': value}
+            framework._save_record(obj, _CACHED_NAMESPACE, record_key, entry)
+        framework._hook_caches[cache_key] = entry
+        return entry['value']
+
+
+def cached_per_hook(method):
+    """Decorate a method of an Object to cache its results until the next commit.
+
+    Calling the method again on the same object with equal (and hashable) arguments
+    returns the cached result, until the framework commits at the end of the hook, or
+    the next hook or action event is emitted::
+
+        class MyCharm(CharmBase):
+
+            @cached_per_hook
+            def topology(self):
+                return compute_topology(self.model.relations['cluster'])
+
+    The decorated method has a ``cache_info()`` method returning its :class:`CacheInfo`.
+    """
+    return _CachedMethod(method)
+
+
+def cached_across_hooks(key: typing.Callable[..., typing.Any], ttl: float = None):
+    """Decorate a method of an Object to store its results in the unit's storage.
+
+    The result is reused, in this hook and the following ones, for as long as the inputs
+    returned by key are the same. key is called with the object and the arguments of
+    the method, and must return the JSON serializable values the result is derived
+    from, such as config values or relation data; they and the arguments are stored as
+    a digest only. The result must be made of simple types, like StoredState values::
+
+        class MyCharm(CharmBase):
+
+            @cached_across_hooks(key=lambda self: self.config['rules'])
+            def rules(self):
+                return parse_rules(self.config['rules'])
+
+    Only the result for the latest inputs is stored, and it is saved on commit like any
+    other state, so it is dropped if the hook fails.
+
+    Args:
+        key: returns the inputs the result is derived from.
+        ttl: if not None, the number of seconds after which the result is computed
+            again regardless of the inputs.
+
+    The decorated method has a ``cache_info()`` method returning its :class:`CacheInfo`.
+    """
+    def decorator(method):
+        return _CachedAcrossHooksMethod(method, key, ttl)
+    return decorator
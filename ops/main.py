@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import inspect
+import json
 import logging
 import os
 import subprocess
@@ -25,11 +26,13 @@ import yaml
 import ops.charm
 import ops.framework
 import ops.model
+import ops.shim
 import ops.storage
 
 from ops.log import setup_root_logging
 
 CHARM_STATE_FILE = '.unit-state.db'
+PROFILE_FILE = '.unit-profile.json'
 
 
 logger = logging.getLogger()
@@ -100,6 +103,18 @@ def _setup_event_links(charm_dir, charm):
             _create_event_link(charm, bound_event)
 
 
+def _dispatch_manifest(charm):
+    """Return the events of the charm that Juju dispatches and that are observed."""
+    observed = charm.framework._observed_event_kinds(charm.on.handle.path)
+    hooks = []
+    for event_kind, bound_event in charm.on.events().items():
+        if not issubclass(bound_event.event_type, (ops.charm.HookEvent, ops.charm.ActionEvent)):
+            continue
+        if None in observed or event_kind in observed:
+            hooks.append(event_kind)
+    return sorted(hooks)
+
+
 def _emit_charm_event(charm, event_name):
     """Emits a charm event based on a Juju event name.
 
@@ -273,10 +288,22 @@ class _Dispatcher:
         return self.event_name in ('collect_metrics',)
 
 
-def main(charm_class, use_juju_for_storage=False):
+def main(charm_class, use_juju_for_storage=False, skip_unobserved=False):
     """Setup the charm and dispatch the observed event.
 
     The event name is based on the way this executable was called (argv[0]).
+
+    Args:
+        charm_class: your charm class.
+        use_juju_for_storage: whether to store the framework's state in Juju's
+            controller rather than in a local file.
+        skip_unobserved: whether to return without even instantiating the charm when
+            the dispatch manifest (see :mod:`ops.shim`) says the event wasn't observed
+            on the last hook and nothing is deferred. Only charms whose observers are
+            the same on every hook, whatever their leadership, config or state, and
+            that don't need their __init__ or commit observers to run on every hook,
+            should enable it. The manifest is only kept up to date when it's enabled,
+            or when the charm is run by the shim of :mod:`ops.shim`.
     """
     charm_dir = _get_charm_dir()
 
@@ -288,6 +315,10 @@ def main(charm_class, use_juju_for_storage=False):
     dispatcher = _Dispatcher(charm_dir)
     dispatcher.run_any_legacy_hook()
 
+    if skip_unobserved and not ops.shim.has_work(charm_dir, dispatcher.event_name):
+        logger.debug('Event %s is not observed and nothing is deferred.', dispatcher.event_name)
+        return
+
     metadata = (charm_dir / 'metadata.yaml').read_text()
     actions_meta = charm_dir / 'actions.yaml'
     if actions_meta.exists():
@@ -319,6 +350,10 @@ def main(charm_class, use_juju_for_storage=False):
     else:
         store = ops.storage.SQLiteStorage(charm_state_path)
     framework = ops.framework.Framework(store, charm_dir, meta, model)
+    # Profile the dispatch of the hook, and dump the results next to the unit state.
+    profile = 'OPERATOR_PROFILE' in os.environ
+    if profile:
+        framework.enable_profiling()
     try:
         sig = inspect.signature(charm_class)
         try:
@@ -343,6 +378,17 @@ def main(charm_class, use_juju_for_storage=False):
 
         _emit_charm_event(charm, dispatcher.event_name)
 
+        keep_manifest = skip_unobserved or ops.shim.SHIM_ENV in os.environ
+        if keep_manifest:
+            observed = _dispatch_manifest(charm)
         framework.commit()
+        if keep_manifest:
+            # Let the next hooks skip the charm when it has nothing to do for them.
+            deferred = any(True for _ in framework._storage.notices(None))
+            ops.shim.write_manifest(charm_dir, {'observed': observed, 'deferred': deferred})
+        if profile:
+            results = framework.profiler.as_dict()
+            results['event_name'] = dispatcher.event_name
+            (charm_dir / PROFILE_FILE).write_text(json.dumps(results, indent=2))
     finally:
         framework.close()
@@ -20,6 +20,7 @@ import os
 import re
 import shutil
 import tempfile
+import threading
 import time
 import typing
 import weakref
@@ -37,7 +38,8 @@ class Model:
     """Represents the Juju Model as seen from this unit.
 
     This should not be instantiated directly by Charmers, but can be accessed as `self.model`
-    from any class that derives from Object.
+    from any class that derives from Object. It's safe to use from observers running in
+    parallel, in different threads.
 
     Attributes:
         unit: A :class:`Unit` that represents the unit that is running this code (eg yourself)
@@ -127,13 +129,15 @@ class _ModelCache:
     def __init__(self, backend):
         self._backend = backend
         self._weakrefs = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
 
     def get(self, entity_type, *args):
         key = (entity_type,) + args
-        entity = self._weakrefs.get(key)
-        if entity is None:
-            entity = entity_type(*args, backend=self._backend, cache=self)
-            self._weakrefs[key] = entity
+        with self._lock:
+            entity = self._weakrefs.get(key)
+            if entity is None:
+                entity = entity_type(*args, backend=self._backend, cache=self)
+                self._weakrefs[key] = entity
         return entity
 
 
@@ -149,6 +153,8 @@ class Application:
             the charm, if the user has deployed it to a different name.
     """
 
+    __slots__ = ('name', '_backend', '_cache', '_is_our_app', '_status', '__weakref__')
+
     def __init__(self, name, backend, cache):
         self.name = name
         self._backend = backend
@@ -221,6 +227,8 @@ class Unit:
         app: The Application the unit is a part of.
     """
 
+    __slots__ = ('name', 'app', '_backend', '_cache', '_is_our_unit', '_status', '__weakref__')
+
     def __init__(self, name, backend, cache):
         self.name = name
 
@@ -306,6 +314,9 @@ class Unit:
         self._backend.application_version_set(version)
 
 
+_shared_lazy_lock = threading.RLock()
+
+
 class LazyMapping(Mapping, ABC):
     """Represents a dict that isn't populated until it is accessed.
 
@@ -313,21 +324,34 @@ class LazyMapping(Mapping, ABC):
     the basis for many of the dicts that the framework tracks.
     """
 
-    _lazy_data = None
+    __slots__ = ('_lazy_lock', '_lazy_data')
+
+    def __init__(self):
+        self._lazy_lock = threading.RLock()
+        self._lazy_data = None
 
     @abstractmethod
     def _load(self):
         raise NotImplementedError()
 
+    @property
+    def _lock(self):
+        # Subclasses whose __init__ doesn't call this one share a lock.
+        return getattr(self, '_lazy_lock', _shared_lazy_lock)
+
     @property
     def _data(self):
-        data = self._lazy_data
+        data = getattr(self, '_lazy_data', None)
         if data is None:
-            data = self._lazy_data = self._load()
+            with self._lock:
+                data = getattr(self, '_lazy_data', None)
+                if data is None:
+                    data = self._lazy_data = self._load()
         return data
 
     def _invalidate(self):
-        self._lazy_data = None
+        with self._lock:
+            self._lazy_data = None
 
     def __contains__(self, key):
         return key in self._data
@@ -354,6 +378,7 @@ class RelationMapping(Mapping):
         self._backend = backend
         self._cache = cache
         self._data = {relation_name: None for relation_name in relations_meta}
+        self._lock = threading.RLock()
 
     def __contains__(self, key):
         return key in self._data
@@ -368,11 +393,16 @@ class RelationMapping(Mapping):
         is_peer = relation_name in self._peers
         relation_list = self._data[relation_name]
         if relation_list is None:
-            relation_list = self._data[relation_name] = []
-            for rid in self._backend.relation_ids(relation_name):
-                relation = Relation(relation_name, rid, is_peer,
-                                    self._our_unit, self._backend, self._cache)
-                relation_list.append(relation)
+            with self._lock:
+                relation_list = self._data[relation_name]
+                if relation_list is None:
+                    relation_list = []
+                    for rid in self._backend.relation_ids(relation_name):
+                        relation = Relation(relation_name, rid, is_peer,
+                                            self._our_unit, self._backend, self._cache)
+                        relation_list.append(relation)
+                    # Only publish the list once complete, for other threads to use.
+                    self._data[relation_name] = relation_list
         return relation_list
 
     def _invalidate(self, relation_name):
@@ -419,6 +449,7 @@ class BindingMapping:
     def __init__(self, backend):
         self._backend = backend
         self._data = {}
+        self._lock = threading.RLock()
 
     def get(self, binding_key: typing.Union[str, 'Relation']) -> 'Binding':
         """Get a specific Binding for an endpoint/relation.
@@ -434,10 +465,11 @@ class BindingMapping:
         else:
             raise ModelError('binding key must be str or relation instance, not {}'
                              ''.format(type(binding_key).__name__))
-        binding = self._data.get(binding_key)
-        if binding is None:
-            binding = Binding(binding_name, relation_id, self._backend)
-            self._data[binding_key] = binding
+        with self._lock:
+            binding = self._data.get(binding_key)
+            if binding is None:
+                binding = Binding(binding_name, relation_id, self._backend)
+                self._data[binding_key] = binding
         return binding
 
 
@@ -540,6 +572,8 @@ class NetworkInterface:
             interface. This may be a single address (eg '10.0.1.2/32')
     """
 
+    __slots__ = ('name', 'address', 'subnet')
+
     def __init__(self, name: str, address_info: dict):
         self.name = name
         # TODO: expose a hardware address here, see LP: #1864070.
@@ -570,6 +604,8 @@ class Relation:
             of a relation. Accessed via eg Relation.data[unit]['foo']
     """
 
+    __slots__ = ('name', 'id', 'app', 'units', 'data', '__weakref__')
+
     def __init__(
             self, relation_name: str, relation_id: int, is_peer: bool, our_unit: Unit,
             backend: '_ModelBackend', cache: '_ModelCache'):
@@ -614,6 +650,8 @@ class RelationData(Mapping):
     :attr:`Relation.data`
     """
 
+    __slots__ = ('relation', '_data')
+
     def __init__(self, relation: Relation, our_unit: Unit, backend: '_ModelBackend'):
         self.relation = weakref.proxy(relation)
         self._data = {
@@ -646,7 +684,10 @@ class RelationData(Mapping):
 # mutable or not is controlled by the flag.
 class RelationDataContent(LazyMapping, MutableMapping):
 
+    __slots__ = ('relation', '_entity', '_backend', '_is_app')
+
     def __init__(self, relation, entity, backend):
+        super().__init__()
         self.relation = relation
         self._entity = entity
         self._backend = backend
@@ -680,16 +721,17 @@ class RelationDataContent(LazyMapping, MutableMapping):
         if not isinstance(value, str):
             raise RelationDataError('relation data values must be strings')
 
-        self._backend.relation_set(self.relation.id, key, value, self._is_app)
+        with self._lock:
+            self._backend.relation_set(self.relation.id, key, value, self._is_app)
 
-        # Don't load data unnecessarily if we're only updating.
-        if self._lazy_data is not None:
-            if value == '':
-                # Match the behavior of Juju, which is that setting the value to an
-                # empty string will remove the key entirely from the relation data.
-                del self._data[key]
-            else:
-                self._data[key] = value
+            # Don't load data unnecessarily if we're only updating.
+            if getattr(self, '_lazy_data', None) is not None:
+                if value == '':
+                    # Match the behavior of Juju, which is that setting the value to an
+                    # empty string will remove the key entirely from the relation data.
+                    del self._data[key]
+                else:
+                    self._data[key] = value
 
     def __delitem__(self, key):
         # Match the behavior of Juju, which is that setting the value to an empty
@@ -699,7 +741,10 @@ class RelationDataContent(LazyMapping, MutableMapping):
 
 class ConfigData(LazyMapping):
 
+    __slots__ = ('_backend',)
+
     def __init__(self, backend):
+        super().__init__()
         self._backend = backend
 
     def _load(self):
@@ -713,6 +758,8 @@ class StatusBase:
     directly use the child class to indicate their status.
     """
 
+    __slots__ = ('message',)
+
     _statuses = {}
     name = None
 
@@ -756,6 +803,8 @@ class UnknownStatus(StatusBase):
     charm has not called status-set yet.
 
     """
+    __slots__ = ()
+
     name = 'unknown'
 
     def __init__(self):
@@ -772,6 +821,8 @@ class ActiveStatus(StatusBase):
 
     The unit believes it is correctly offering all the services it has been asked to offer.
     """
+    __slots__ = ()
+
     name = 'active'
 
     def __init__(self, message: str = ''):
@@ -784,6 +835,8 @@ class BlockedStatus(StatusBase):
 
     An operator has to manually intervene to unblock the unit and let it proceed.
     """
+    __slots__ = ()
+
     name = 'blocked'
 
 
@@ -796,6 +849,8 @@ class MaintenanceStatus(StatusBase):
     reflects activity on the unit itself, not on peers or related units.
 
     """
+    __slots__ = ()
+
     name = 'maintenance'
 
 
@@ -807,6 +862,8 @@ class WaitingStatus(StatusBase):
     it is related is not running.
 
     """
+    __slots__ = ()
+
     name = 'waiting'
 
 
@@ -968,6 +1025,7 @@ class _ModelBackend:
 
         self._is_leader = None
         self._leader_check_time = None
+        self._leader_lock = threading.Lock()
 
     def _run(self, *args, return_output=False, use_json=False):
         kwargs = dict(stdout=PIPE, stderr=PIPE)
@@ -1050,19 +1108,20 @@ class _ModelBackend:
 
         The value is cached for the duration of a lease which is 30s in Juju.
         """
-        now = time.monotonic()
-        if self._leader_check_time is None:
-            check = True
-        else:
-            time_since_check = datetime.timedelta(seconds=now - self._leader_check_time)
-            check = (time_since_check > self.LEASE_RENEWAL_PERIOD or self._is_leader is None)
-        if check:
-            # Current time MUST be saved before running is-leader to ensure the cache
-            # is only used inside the window that is-leader itself asserts.
-            self._leader_check_time = now
-            self._is_leader = self._run('is-leader', return_output=True, use_json=True)
-
-        return self._is_leader
+        with self._leader_lock:
+            now = time.monotonic()
+            if self._leader_check_time is None:
+                check = True
+            else:
+                time_since_check = datetime.timedelta(seconds=now - self._leader_check_time)
+                check = (time_since_check > self.LEASE_RENEWAL_PERIOD or self._is_leader is None)
+            if check:
+                # Current time MUST be saved before running is-leader to ensure the cache
+                # is only used inside the window that is-leader itself asserts.
+                self._leader_check_time = now
+                self._is_leader = self._run('is-leader', return_output=True, use_json=True)
+
+            return self._is_leader
 
     def resource_get(self, resource_name):
         return self._run('resource-get', resource_name, return_output=True).strip()
@@ -0,0 +1,112 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Skip the charm entirely for the hooks it has nothing to do in.
+
+The framework can keep a dispatch manifest in the charm directory, listing the
+events the charm observes and whether any deferred events are waiting to be
+reemitted. It does so for charms run by this module, which only depends on the
+standard library so that it can be run as a script, without importing the
+framework nor the charm, from the charm's ``dispatch`` file::
+
+    #!/bin/sh
+    JUJU_DISPATCH_PATH="${JUJU_DISPATCH_PATH:-$0}" exec python3 lib/ops/shim.py ./src/charm.py
+
+The charm is then only executed when the manifest says it has work to do. As
+the manifest lists the events observed on the last hook the charm ran, this is
+only suitable for charms whose observers don't depend on their leadership,
+config or state, and that don't need their __init__ or commit observers to run
+on every hook. The same applies to the skip_unobserved argument of
+:func:`ops.main.main`, which skips the rest of the charm on such hooks.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+DISPATCH_MANIFEST_FILE = '.unit-dispatch.json'
+
+# Set in the environment of the charm run by the shim, for it to write the manifest.
+SHIM_ENV = 'OPERATOR_DISPATCH_SHIM'
+
+# The events that always run the charm: those that set up the charm directory and
+# rewrite the manifest, and those after which charms commonly change the events
+# they observe.
+ALWAYS_RUN_EVENTS = ('install', 'start', 'upgrade_charm', 'config_changed', 'leader_elected')
+
+
+def event_name_from_path(path: Path) -> str:
+    """Return the name of the event dispatched through the given hook or action path."""
+    name = path.name.replace('-', '_')
+    if path.parent.name == 'actions':
+        name = '{}_action'.format(name)
+    return name
+
+
+def read_manifest(charm_dir: Path):
+    """Return the dispatch manifest of the charm, or None if it is missing or unreadable."""
+    try:
+        manifest = json.loads((charm_dir / DISPATCH_MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict):
+        return None
+    return manifest
+
+
+def write_manifest(charm_dir: Path, manifest: dict):
+    """Atomically replace the dispatch manifest of the charm, if it changed."""
+    if read_manifest(charm_dir) == manifest:
+        return
+    path = charm_dir / DISPATCH_MANIFEST_FILE
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(manifest, sort_keys=True))
+    os.replace(str(tmp_path), str(path))
+
+
+def has_work(charm_dir: Path, event_name: str) -> bool:
+    """Return whether the charm must run to handle the named event.
+
+    That is the case unless the manifest of the charm says that the event isn't
+    observed and that no deferred event is waiting to be reemitted. Without a
+    usable manifest, the charm always runs.
+    """
+    if event_name in ALWAYS_RUN_EVENTS or event_name.endswith('_storage_attached'):
+        return True
+    manifest = read_manifest(charm_dir)
+    if manifest is None:
+        return True
+    try:
+        return bool(manifest['deferred']) or event_name in manifest['observed']
+    except (KeyError, TypeError):
+        return True
+
+
+def main(argv):
+    """Exec the charm command in argv unless the dispatched event has nothing to do."""
+    if len(argv) < 2:
+        sys.exit('usage: {} CHARM [ARGS...]'.format(argv[0]))
+    dispatch_path = os.environ.get('JUJU_DISPATCH_PATH')
+    charm_dir = Path(os.environ.get('JUJU_CHARM_DIR', '.'))
+    # A legacy hook for the event is run by the charm, so it must not be skipped.
+    if (dispatch_path and not os.access(str(charm_dir / dispatch_path), os.X_OK)
+            and not has_work(charm_dir, event_name_from_path(Path(dispatch_path)))):
+        return
+    os.environ[SHIM_ENV] = '1'
+    os.execv(argv[1], argv[1:])
+
+
+if __name__ == '__main__':
+    main(sys.argv)
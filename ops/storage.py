@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import bisect
+import copy
 from datetime import timedelta
+import io
 import pickle
 import shutil
 import subprocess
@@ -29,9 +32,12 @@ class SQLiteStorage:
     def __init__(self, filename):
         # The isolation_level argument is set to None such that the implicit
         # transaction management behavior of the sqlite3 module is disabled.
+        # The framework may hand the connection over to another thread while the
+        # dispatching thread waits for it (see Framework._run_async).
         self._db = sqlite3.connect(str(filename),
                                    isolation_level=None,
-                                   timeout=self.DB_LOCK_TIMEOUT.total_seconds())
+                                   timeout=self.DB_LOCK_TIMEOUT.total_seconds(),
+                                   check_same_thread=False)
         self._setup()
 
     def _setup(self):
@@ -49,15 +55,38 @@ class SQLiteStorage:
                   sequence INTEGER PRIMARY KEY AUTOINCREMENT,
                   event_path TEXT,
                   observer_path TEXT,
-                  method_name TEXT)
+                  method_name TEXT,
+                  due REAL,
+                  attempts INTEGER NOT NULL DEFAULT 0)
                 ''')
-            self._db.commit()
+            self.commit()
+        else:
+            c.execute("PRAGMA table_info(notice)")
+            if 'due' not in {row[1] for row in c.fetchall()}:
+                # Databases created before deferrals could be scheduled.
+                self._db.execute("ALTER TABLE notice ADD COLUMN due REAL")
+                self._db.execute(
+                    "ALTER TABLE notice ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+                self.commit()
+        c.execute("SELECT count(name) FROM sqlite_master WHERE type='table' AND name='record'")
+        if c.fetchone()[0] == 0:
+            self._db.execute('''
+                CREATE TABLE record (
+                  namespace TEXT,
+                  key TEXT,
+                  data BLOB,
+                  PRIMARY KEY (namespace, key))
+                ''')
+            self.commit()
 
     def close(self):
         self._db.close()
 
     def commit(self):
         self._db.commit()
+        # Keep what comes next in a transaction too, as the connection would otherwise
+        # be in autocommit mode; the framework may commit more than once per hook.
+        self._db.execute("BEGIN")
 
     # There's commit but no rollback. For abort to be supported, we'll need logic that
     # can rollback decisions made by third-party code in terms of the internal state
@@ -74,9 +103,19 @@ class SQLiteStorage:
             might be a dict/tuple/int, but must only contain 'simple' python types.
         """
         # Use pickle for serialization, so the value remains portable.
-        raw_data = pickle.dumps(snapshot_data)
+        raw_data = _simple_dumps(snapshot_data)
         self._db.execute("REPLACE INTO snapshot VALUES (?, ?)", (handle_path, raw_data))
 
+    def save_snapshots(self, snapshots: typing.Iterable[typing.Tuple[str, typing.Any]]) -> None:
+        """Part of the Storage API, persist several snapshots in a single batch.
+
+        Args:
+            snapshots: Iterable of (handle_path, snapshot_data) tuples.
+        """
+        self._db.executemany("REPLACE INTO snapshot VALUES (?, ?)", [
+            (handle_path, _simple_dumps(snapshot_data))
+            for handle_path, snapshot_data in snapshots])
+
     def load_snapshot(self, handle_path: str) -> typing.Any:
         """Part of the Storage API, retrieve a snapshot that was previously saved.
 
@@ -110,10 +149,96 @@ class SQLiteStorage:
             for row in rows:
                 yield row[0]
 
+    def save_record(self, namespace: str, key: str, data: typing.Any) -> None:
+        """Part of the Storage API, persist data as the record for key within namespace.
+
+        Records let an object persist its data in parts, e.g. one record per key of
+        a StoredState, rather than as a single snapshot. Like snapshot data, the data
+        must only contain 'simple' python types.
+        """
+        raw_data = _simple_dumps(data)
+        self._db.execute("REPLACE INTO record VALUES (?, ?, ?)", (namespace, key, raw_data))
+
+    def load_record(self, namespace: str, key: str) -> typing.Any:
+        """Part of the Storage API, retrieve a record that was previously saved.
+
+        Raises:
+            KeyError: if there is no record for key within namespace.
+        """
+        c = self._db.execute(
+            "SELECT data FROM record WHERE namespace=? AND key=?", (namespace, key))
+        row = c.fetchone()
+        if row:
+            return pickle.loads(row[0])
+        raise KeyError(key)
+
+    def load_records(self, namespace: str,
+                     keys: typing.Iterable[str]) -> typing.Dict[str, typing.Any]:
+        """Part of the Storage API, retrieve several records of namespace at once.
+
+        Returns:
+            Dict mapping each of the keys to its record.
+        Raises:
+            KeyError: if any of the keys has no record.
+        """
+        records = {key: None for key in keys}
+        if not records:
+            return {}
+        c = self._db.execute(
+            "SELECT key, data FROM record WHERE namespace=?", (namespace,))
+        found = set()
+        for key, raw_data in c.fetchall():
+            if key in records:
+                records[key] = pickle.loads(raw_data)
+                found.add(key)
+        for key in records:
+            if key not in found:
+                raise KeyError(key)
+        return records
+
+    def drop_record(self, namespace: str, key: str) -> None:
+        """Part of the Storage API, remove a record; a missing record is a no-op."""
+        self._db.execute("DELETE FROM record WHERE namespace=? AND key=?", (namespace, key))
+
+    def list_records(self, namespace: str, after: typing.Optional[str] = None,
+                     limit: typing.Optional[int] = None) -> typing.List[str]:
+        """Part of the Storage API, return the keys of the records within namespace.
+
+        Args:
+            namespace: The namespace to list.
+            after: If supplied, only return the keys that sort after it.
+            limit: If supplied, return at most that many keys.
+        Returns:
+            The keys, sorted.
+        """
+        query = "SELECT key FROM record WHERE namespace=?"
+        args = [namespace]
+        if after is not None:
+            query += " AND key>?"
+            args.append(after)
+        query += " ORDER BY key"
+        if limit is not None:
+            query += " LIMIT ?"
+            args.append(limit)
+        return [row[0] for row in self._db.execute(query, args).fetchall()]
+
     def save_notice(self, event_path: str, observer_path: str, method_name: str) -> None:
         """Part of the Storage API, record an notice (event and observer)"""
-        self._db.execute('INSERT INTO notice VALUES (NULL, ?, ?, ?)',
-                         (event_path, observer_path, method_name))
+        self._db.execute('''
+            INSERT INTO notice (event_path, observer_path, method_name)
+            VALUES (?, ?, ?)
+            ''', (event_path, observer_path, method_name))
+
+    def save_notices(self, notices: typing.Iterable[typing.Tuple[str, str, str]]) -> None:
+        """Part of the Storage API, record several notices in a single batch.
+
+        Args:
+            notices: Iterable of (event_path, observer_path, method_name) tuples.
+        """
+        self._db.executemany('''
+            INSERT INTO notice (event_path, observer_path, method_name)
+            VALUES (?, ?, ?)
+            ''', notices)
 
     def drop_notice(self, event_path: str, observer_path: str, method_name: str) -> None:
         """Part of the Storage API, remove a notice that was previously recorded."""
@@ -124,6 +249,24 @@ class SQLiteStorage:
                AND method_name=?
             ''', (event_path, observer_path, method_name))
 
+    def drop_notices(self, notices: typing.Iterable[typing.Tuple[str, str, str]]) -> None:
+        """Part of the Storage API, remove several notices in a single batch.
+
+        Args:
+            notices: Iterable of (event_path, observer_path, method_name) tuples.
+        """
+        self._db.executemany('''
+            DELETE FROM notice
+             WHERE event_path=?
+               AND observer_path=?
+               AND method_name=?
+            ''', notices)
+
+    def drop_snapshots(self, handle_paths: typing.Iterable[str]) -> None:
+        """Part of the Storage API, remove several snapshots in a single batch."""
+        self._db.executemany("DELETE FROM snapshot WHERE handle=?",
+                             ((handle_path,) for handle_path in handle_paths))
+
     def notices(self, event_path: typing.Optional[str]) ->\
             typing.Generator[typing.Tuple[str, str, str], None, None]:
         """Part of the Storage API, return all notices that begin with event_path.
@@ -154,29 +297,127 @@ class SQLiteStorage:
             for row in rows:
                 yield tuple(row)
 
+    def set_notice_schedule(self, event_path: str, observer_path: str, method_name: str,
+                            due: typing.Optional[float], attempts: int) -> None:
+        """Part of the Storage API, record when a deferred notice is due to be retried.
+
+        Args:
+            due: The earliest time (in seconds since the epoch) the notice should be
+                reemitted, or None to reemit it as soon as possible.
+            attempts: How many times the notice was deferred with a backoff.
+        """
+        self._db.execute('''
+            UPDATE notice
+               SET due=?, attempts=?
+             WHERE event_path=?
+               AND observer_path=?
+               AND method_name=?
+            ''', (due, attempts, event_path, observer_path, method_name))
+
+    def notice_schedules(self) -> typing.Dict[typing.Tuple[str, str, str],
+                                              typing.Tuple[typing.Optional[float], int]]:
+        """Part of the Storage API, return the schedule of the notices that have one.
+
+        Returns:
+            Dict mapping (event_path, observer_path, method_name) to (due, attempts),
+            for the notices given a schedule with :meth:`set_notice_schedule`.
+        """
+        c = self._db.execute('''
+            SELECT event_path, observer_path, method_name, due, attempts
+              FROM notice
+             WHERE due IS NOT NULL OR attempts > 0
+            ''')
+        return {tuple(row[:3]): tuple(row[3:]) for row in c.fetchall()}
+
+    def notices_with_snapshots(self, event_path: typing.Optional[str] = None,
+                               exclude: typing.Container[typing.Tuple[str, str, str]] = ()) ->\
+            typing.Generator[typing.Tuple[str, str, str, typing.Any, typing.Optional[bytes]],
+                             None, None]:
+        """Part of the Storage API, return notices joined with their event snapshot data.
+
+        The notices are all read up front with a single query, in the same order as
+        :meth:`notices`, and the snapshot data of each event is only unpickled once no
+        matter how many notices refer to it. The raw pickled data comes along, for
+        callers that need their own copy of the snapshot data; it's None for storages
+        that don't keep snapshots pickled.
+
+        Args:
+            event_path: If supplied, will only yield notices for that event path.
+            exclude: (event_path, observer_path, method_name) tuples of notices to
+                skip; their snapshot is not decoded unless another notice needs it.
+        Returns:
+            Iterable of (event_path, observer_path, method_name, snapshot_data, raw_data)
+            tuples
+        Raises:
+            NoSnapshotError: when reaching a notice whose event has no snapshot.
+        """
+        query = '''
+            SELECT notice.event_path, notice.observer_path, notice.method_name, snapshot.data
+              FROM notice
+              LEFT JOIN snapshot ON snapshot.handle = notice.event_path
+            '''
+        if event_path:
+            c = self._db.execute(query + 'WHERE notice.event_path=? ORDER BY notice.sequence',
+                                 (event_path,))
+        else:
+            c = self._db.execute(query + 'ORDER BY notice.sequence')
+        last_event_path = None
+        snapshot_data = None
+        for event_path, observer_path, method_name, raw_data in c.fetchall():
+            if (event_path, observer_path, method_name) in exclude:
+                continue
+            if event_path != last_event_path:
+                if raw_data is None:
+                    raise NoSnapshotError(event_path)
+                snapshot_data = pickle.loads(raw_data)
+                last_event_path = event_path
+            yield event_path, observer_path, method_name, snapshot_data, raw_data
+
 
 class JujuStorage:
     """"Storing the content tracked by the Framework in Juju.
 
     This uses :class:`_JujuStorageBackend` to interact with state-get/state-set
     as the way to store state for the framework and for components.
+
+    The records of a namespace are kept together under a single key, as every
+    state-get and state-set is a process of its own: a namespace is read as a whole
+    the first time it's needed, and written as a whole on commit if it changed.
     """
 
     NOTICE_KEY = "#notices#"
+    RECORDS_KEY_PREFIX = "#records#"
 
     def __init__(self, backend: '_JujuStorageBackend' = None):
         self._backend = backend
         if backend is None:
             self._backend = _JujuStorageBackend()
+        # The {key: data} records of each namespace read so far, with the changes
+        # not committed yet, and the namespaces with such changes.
+        self._records = {}
+        self._changed_namespaces = set()
 
     def close(self):
         return
 
     def commit(self):
-        return
+        for namespace in sorted(self._changed_namespaces):
+            records = self._records[namespace]
+            if records:
+                self._backend.set(self.RECORDS_KEY_PREFIX + namespace, records)
+            else:
+                self._backend.delete(self.RECORDS_KEY_PREFIX + namespace)
+        self._changed_namespaces.clear()
 
     def save_snapshot(self, handle_path: str, snapshot_data: typing.Any) -> None:
-        self._backend.set(handle_path, snapshot_data)
+        try:
+            self._backend.set(handle_path, snapshot_data)
+        except yaml.representer.RepresenterError:
+            raise _simple_type_error(snapshot_data, _YAML_SIMPLE_TYPES) from None
+
+    def save_snapshots(self, snapshots: typing.Iterable[typing.Tuple[str, typing.Any]]) -> None:
+        for handle_path, snapshot_data in snapshots:
+            self.save_snapshot(handle_path, snapshot_data)
 
     def load_snapshot(self, handle_path):
         try:
@@ -188,22 +429,113 @@ class JujuStorage:
     def drop_snapshot(self, handle_path):
         self._backend.delete(handle_path)
 
+    def _namespace_records(self, namespace: str) -> typing.Dict[str, typing.Any]:
+        records = self._records.get(namespace)
+        if records is None:
+            try:
+                records = self._backend.get(self.RECORDS_KEY_PREFIX + namespace) or {}
+            except KeyError:
+                records = {}
+            self._records[namespace] = records
+        return records
+
+    def save_record(self, namespace: str, key: str, data: typing.Any) -> None:
+        # The data is only serialized on commit, so check it can be right away.
+        found = _find_non_simple(data, _YAML_SIMPLE_TYPES)
+        if found:
+            raise SimpleTypeError(data, *found)
+        self._namespace_records(namespace)[key] = copy.deepcopy(data)
+        self._changed_namespaces.add(namespace)
+
+    def load_record(self, namespace: str, key: str) -> typing.Any:
+        try:
+            return copy.deepcopy(self._namespace_records(namespace)[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def load_records(self, namespace: str,
+                     keys: typing.Iterable[str]) -> typing.Dict[str, typing.Any]:
+        return {key: self.load_record(namespace, key) for key in keys}
+
+    def drop_record(self, namespace: str, key: str) -> None:
+        records = self._namespace_records(namespace)
+        if key in records:
+            del records[key]
+            self._changed_namespaces.add(namespace)
+
+    def list_records(self, namespace: str, after: typing.Optional[str] = None,
+                     limit: typing.Optional[int] = None) -> typing.List[str]:
+        keys = sorted(self._namespace_records(namespace))
+        start = 0 if after is None else bisect.bisect_right(keys, after)
+        end = None if limit is None else start + limit
+        return keys[start:end]
+
     def save_notice(self, event_path: str, observer_path: str, method_name: str):
         notice_list = self._load_notice_list()
         notice_list.append([event_path, observer_path, method_name])
         self._save_notice_list(notice_list)
 
+    def save_notices(self, notices: typing.Iterable[typing.Tuple[str, str, str]]) -> None:
+        notice_list = self._load_notice_list()
+        notice_list.extend(list(notice) for notice in notices)
+        self._save_notice_list(notice_list)
+
     def drop_notice(self, event_path: str, observer_path: str, method_name: str):
+        notice = (event_path, observer_path, method_name)
         notice_list = self._load_notice_list()
-        notice_list.remove([event_path, observer_path, method_name])
+        for i, row in enumerate(notice_list):
+            if tuple(row[:3]) == notice:
+                del notice_list[i]
+                break
+        else:
+            raise ValueError('no notice {}'.format(notice))
         self._save_notice_list(notice_list)
 
-    def notices(self, event_path: str):
+    def drop_notices(self, notices: typing.Iterable[typing.Tuple[str, str, str]]) -> None:
+        to_drop = {tuple(notice) for notice in notices}
+        notice_list = self._load_notice_list()
+        remaining = [row for row in notice_list if tuple(row[:3]) not in to_drop]
+        if len(remaining) != len(notice_list):
+            self._save_notice_list(remaining)
+
+    def drop_snapshots(self, handle_paths: typing.Iterable[str]) -> None:
+        for handle_path in handle_paths:
+            self._backend.delete(handle_path)
+
+    def notices(self, event_path: typing.Optional[str] = None):
         notice_list = self._load_notice_list()
         for row in notice_list:
-            if row[0] != event_path:
+            if event_path and row[0] != event_path:
                 continue
-            yield tuple(row)
+            yield tuple(row[:3])
+
+    # A notice with a schedule is stored as [event_path, observer_path, method_name,
+    # due, attempts] rather than only its first three elements.
+
+    def set_notice_schedule(self, event_path: str, observer_path: str, method_name: str,
+                            due: typing.Optional[float], attempts: int) -> None:
+        notice = (event_path, observer_path, method_name)
+        notice_list = self._load_notice_list()
+        for row in notice_list:
+            if tuple(row[:3]) == notice:
+                row[3:] = [due, attempts]
+        self._save_notice_list(notice_list)
+
+    def notice_schedules(self):
+        return {tuple(row[:3]): tuple(row[3:]) for row in self._load_notice_list()
+                if len(row) > 3 and (row[3] is not None or row[4] > 0)}
+
+    def notices_with_snapshots(self, event_path: typing.Optional[str] = None,
+                               exclude: typing.Container[typing.Tuple[str, str, str]] = ()):
+        last_event_path = None
+        snapshot_data = None
+        for row in list(self.notices(event_path)):
+            if row in exclude:
+                continue
+            if row[0] != last_event_path:
+                snapshot_data = self.load_snapshot(row[0])
+                last_event_path = row[0]
+            yield row + (snapshot_data, None)
 
     def _load_notice_list(self) -> typing.List[typing.Tuple[str]]:
         try:
@@ -218,6 +550,104 @@ class JujuStorage:
         self._backend.set(self.NOTICE_KEY, notices)
 
 
+# The types snapshot data may be made of. JujuStorage, being YAML based, can't store
+# the complex and frozenset values that SQLiteStorage accepts.
+_SIMPLE_TYPES = frozenset((
+    type(None), bool, int, float, complex, str, bytes, list, tuple, dict, set, frozenset))
+_YAML_SIMPLE_TYPES = _SIMPLE_TYPES - {complex, frozenset}
+
+
+class SimpleTypeError(ValueError):
+    """Raised when saving snapshot data that isn't made only of simple types.
+
+    Attributes:
+        data: the snapshot data that was being saved.
+        value: the offending value within data.
+        path: where value is within data, as Python subscripts like "['foo'][0]".
+    """
+
+    def __init__(self, data, value, path):
+        super().__init__(data, value, path)
+        self.data = data
+        self.value = value
+        self.path = path
+
+    def __str__(self):
+        return 'cannot store {!r} at data{}, only simple types are supported'.format(
+            self.value, self.path)
+
+
+def _find_non_simple(value, simple_types, path=''):
+    """Return (value, path) for the first element of value that isn't simple, or None."""
+    value_type = type(value)
+    if value_type not in simple_types:
+        return value, path
+    if value_type is dict:
+        for key, item in value.items():
+            found = (_find_non_simple(key, simple_types, '{} (key {!r})'.format(path, key))
+                     or _find_non_simple(item, simple_types, '{}[{!r}]'.format(path, key)))
+            if found:
+                return found
+    elif value_type in (list, tuple):
+        for i, item in enumerate(value):
+            found = _find_non_simple(item, simple_types, '{}[{}]'.format(path, i))
+            if found:
+                return found
+    elif value_type in (set, frozenset):
+        for item in value:
+            found = _find_non_simple(item, simple_types, '{} (member {!r})'.format(path, item))
+            if found:
+                return found
+    return None
+
+
+def _simple_type_error(data, simple_types):
+    found = _find_non_simple(data, simple_types)
+    if found is None:
+        # Simple types, but it couldn't be serialized anyway (e.g. recursive data).
+        found = data, ''
+    return SimpleTypeError(data, *found)
+
+
+class _NonSimpleType(Exception):
+    pass
+
+
+class _SimpleReducers(dict):
+    """Pickler dispatch table refusing every type the pickler doesn't handle natively."""
+
+    def __missing__(self, cls):
+        raise _NonSimpleType(cls)
+
+
+class _SimplePickler(pickle.Pickler):
+    """Pickler that only accepts simple types, validating them as it serializes.
+
+    Types the C pickler handles natively never reach the dispatch table, so custom
+    objects are refused at no cost for simple data. Classes and functions however are
+    pickled natively, as globals; any global in the output triggers a full check.
+    """
+
+    dispatch_table = _SimpleReducers({complex: lambda c: (complex, (c.real, c.imag))})
+
+
+def _simple_dumps(data: typing.Any) -> bytes:
+    """Pickle data in a single pass, raising SimpleTypeError if it's not only simple types."""
+    buf = io.BytesIO()
+    try:
+        # Protocol 4 pickles sets and frozensets without referring to globals.
+        _SimplePickler(buf, protocol=4).dump(data)
+    except (_NonSimpleType, pickle.PicklingError, TypeError, AttributeError, RecursionError):
+        raise _simple_type_error(data, _SIMPLE_TYPES) from None
+    raw_data = buf.getvalue()
+    if pickle.STACK_GLOBAL in raw_data:
+        # Most likely string or bytes content, but it may also be a pickled global.
+        found = _find_non_simple(data, _SIMPLE_TYPES)
+        if found:
+            raise SimpleTypeError(data, *found)
+    return raw_data
+
+
 class _SimpleLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
     """Handle a couple basic python types.
 
@@ -237,10 +667,11 @@ _SimpleLoader.add_constructor(
 
 
 class _SimpleDumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
-    """Add types supported by 'marshal'
+    """Add tuples to the types SafeDumper supports.
 
     YAML can support arbitrary types, but that is generally considered unsafe (like pickle). So
-    we want to only support dumping out types that are safe to load.
+    we want to only support dumping out types that are safe to load. Anything else is refused
+    while dumping, so the data doesn't need to be validated beforehand.
     """
 
 
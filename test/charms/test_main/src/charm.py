@@ -184,4 +184,4 @@ class Charm(CharmBase):
 
 
 if __name__ == '__main__':
-    main(Charm)
+    main(Charm, skip_unobserved='TEST_SKIP_UNOBSERVED' in os.environ)
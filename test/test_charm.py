@@ -24,7 +24,7 @@ from ops.charm import (
     CharmMeta,
     CharmEvents,
 )
-from ops.framework import Framework, EventSource, EventBase
+from ops.framework import Framework, EventSource, EventBase, observe
 from ops.model import Model, _ModelBackend
 from ops.storage import SQLiteStorage
 
@@ -120,6 +120,7 @@ class TestCharm(unittest.TestCase):
             def on_any_relation(self, event):
                 assert event.relation.name == 'req1'
                 assert event.relation.app.name == 'remote'
+                assert event.coalesce_key() == (1, None)
                 self.seen.append(type(event).__name__)
 
         # language=YAML
@@ -164,6 +165,166 @@ peers:
             'RelationBrokenEvent',
         ])
 
+    def test_relation_event_filters(self):
+
+        class MyCharm(CharmBase):
+            def __init__(self, *args):
+                super().__init__(*args)
+                self.seen = []
+                self.framework.observe(
+                    self.on.req1_relation_changed, self._on_rel1, when={'relation_id': 1})
+                self.framework.observe(
+                    self.on.req1_relation_changed, self._on_app_level,
+                    when={'app': ['remote', 'other'], 'unit': None})
+
+            def _on_rel1(self, event):
+                self.seen.append(('rel1', event.relation.id))
+                event.defer()
+
+            def _on_app_level(self, event):
+                self.seen.append(('app', event.relation.id))
+                event.defer()
+
+        self.meta = CharmMeta.from_yaml(metadata='''
+name: my-charm
+requires:
+ req1:
+   interface: req1
+''')
+        framework = self.create_framework()
+        charm = MyCharm(framework)
+        with self.assertRaisesRegex(TypeError, "StartEvent events cannot be filtered on 'app'"):
+            framework.observe(charm.on.start, charm._on_rel1, when={'app': 'remote'})
+
+        rel1 = framework.model.get_relation('req1', 1)
+        rel2 = framework.model.get_relation('req1', 2)
+        app = framework.model.get_app('remote')
+        unit = framework.model.get_unit('remote/0')
+        charm.on.req1_relation_changed.emit(rel1, app, unit)
+        charm.on.req1_relation_changed.emit(rel2, app, unit)
+        charm.on.req1_relation_changed.emit(rel2, app)
+        charm.on.req1_relation_changed.emit(rel1, framework.model.get_app('unknown'))
+
+        self.assertEqual(charm.seen, [('rel1', 1), ('app', 2), ('rel1', 1)])
+        # Nothing was saved for the observers that filtered the events out.
+        self.assertEqual(list(framework._storage.notices(None)), [
+            ('MyCharm/on/req1_relation_changed[1]', 'MyCharm', '_on_rel1'),
+            ('MyCharm/on/req1_relation_changed[3]', 'MyCharm', '_on_app_level'),
+            ('MyCharm/on/req1_relation_changed[4]', 'MyCharm', '_on_rel1'),
+        ])
+        self.assertEqual(
+            list(framework._storage.list_snapshots()), [
+                'MyCharm/on/req1_relation_changed[1]',
+                'MyCharm/on/req1_relation_changed[3]',
+                'MyCharm/on/req1_relation_changed[4]',
+            ])
+
+    def test_relation_event_lazy_restore(self):
+
+        class MyCharm(CharmBase):
+            def __init__(self, *args):
+                super().__init__(*args)
+                self.events = []
+                self.framework.observe(self.on.req1_relation_changed, self._on_changed)
+
+            def _on_changed(self, event):
+                self.events.append(event)
+                event.defer()
+
+        fake_script(self, 'relation-ids', """echo '["req1:1"]'""")
+        fake_script(self, 'relation-list', """echo '["remote/0"]'""")
+        self.meta = CharmMeta.from_yaml(metadata='''
+name: my-charm
+requires:
+ req1:
+   interface: req1
+''')
+        framework = self.create_framework()
+        charm = MyCharm(framework)
+        rel = framework.model.get_relation('req1', 1)
+        charm.on.req1_relation_changed.emit(
+            rel, framework.model.get_app('remote'), framework.model.get_unit('remote/0'))
+        fake_script_calls(self, clear=True)
+
+        framework.model.relations._invalidate('req1')
+        framework.reemit()
+        event = charm.events[-1]
+        self.assertEqual(event.coalesce_key(), (1, 'remote/0'))
+        # Nothing was looked up to reemit the event and defer it again.
+        self.assertEqual(fake_script_calls(self), [])
+        self.assertEqual(event.relation.id, 1)
+        self.assertIs(event.relation, event.relation)
+        self.assertEqual(event.app.name, 'remote')
+        self.assertEqual(event.unit.name, 'remote/0')
+        self.assertEqual(fake_script_calls(self), [
+            ['relation-ids', 'req1', '--format=json'],
+            ['relation-list', '-r', '1', '--format=json'],
+        ])
+        # The snapshot is the same as ever.
+        self.assertEqual(event.snapshot(), {
+            'relation_name': 'req1', 'relation_id': 1,
+            'app_name': 'remote', 'unit_name': 'remote/0'})
+
+    def test_observe_decorator(self):
+
+        class MyCharm(CharmBase):
+            def __init__(self, *args):
+                super().__init__(*args)
+                self.seen = []
+
+            @observe('start')
+            def _on_start(self, event):
+                self.seen.append('start')
+
+            @observe('req1_relation_changed', when={'relation_id': 1})
+            @observe('req1_relation_joined')
+            def _on_req1(self, event):
+                self.seen.append(type(event).__name__)
+
+        class MySubCharm(MyCharm):
+            @observe(CharmEvents.config_changed)
+            def _on_config_changed(self, event):
+                self.seen.append('config')
+
+            # Overriding a method without the decorator stops observing.
+            def _on_start(self, event):
+                pass
+
+        self.meta = CharmMeta.from_yaml(metadata='''
+name: my-charm
+requires:
+ req1:
+   interface: req1
+''')
+        framework = self.create_framework()
+        charm = MySubCharm(framework)
+        rel1 = framework.model.get_relation('req1', 1)
+        rel2 = framework.model.get_relation('req1', 2)
+        app = framework.model.get_app('remote')
+        charm.on.start.emit()
+        charm.on.config_changed.emit()
+        charm.on.req1_relation_joined.emit(rel2, app)
+        charm.on.req1_relation_changed.emit(rel2, app)
+        charm.on.req1_relation_changed.emit(rel1, app)
+        self.assertEqual(
+            charm.seen, ['config', 'RelationJoinedEvent', 'RelationChangedEvent'])
+
+        with self.assertRaisesRegex(TypeError, 'has extra required parameter'):
+            class BadCharm(CharmBase):
+                @observe('start')
+                def _on_start(self, event, other):
+                    pass
+
+        class UnknownEventCharm(CharmBase):
+            @observe('nope')
+            def _on_nope(self, event):
+                pass
+
+        self.meta = CharmMeta()
+        other = UnknownEventCharm(self.create_framework())
+        with self.assertRaisesRegex(RuntimeError, "UnknownEventCharm cannot observe 'nope'"):
+            other.on.start.emit()
+
     def test_storage_events(self):
 
         class MyCharm(CharmBase):
@@ -306,7 +467,7 @@ start:
                 framework.observe(self.on.start_action, self._on_start_action)
 
             def _on_start_action(self, event):
-                event.defer()
+                self.defer(event)
 
         fake_script(self, cmd_type + '-get', """echo '{"foo-name": "name", "silent": true}'""")
         self.meta = self._get_action_test_meta()
@@ -315,8 +476,14 @@ start:
         framework = self.create_framework()
         charm = MyCharm(framework)
 
-        with self.assertRaises(RuntimeError):
-            charm.on.start_action.emit()
+        for defer in [
+            lambda event: event.defer(),
+            lambda event: event.defer(until=0),
+            lambda event: event.defer_all(backoff=1),
+        ]:
+            charm.defer = defer
+            with self.assertRaisesRegex(RuntimeError, 'cannot defer action events'):
+                charm.on.start_action.emit()
 
     def test_action_event_defer_fails(self):
         self._test_action_event_defer_fails('action')
@@ -12,16 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import abc
+import asyncio
+import copy
 import datetime
 import gc
 import inspect
 import io
 import os
+import pickle
 import re
 import shutil
 import sys
 import tempfile
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import Mock, call, patch
 from pathlib import Path
 
 import logassert
@@ -29,21 +35,33 @@ import logassert
 from ops import charm
 from ops.framework import (
     _BREAKPOINT_WELCOME_MESSAGE,
+    BoundStoredMapping,
     BoundStoredState,
+    CacheInfo,
+    cached_across_hooks,
+    cached_per_hook,
+    CoalescePolicy,
     CommitEvent,
+    DeferralLimitError,
     EventBase,
+    EventField,
+    EvictionPolicy,
     _event_regex,
     ObjectEvents,
     EventSource,
     Framework,
     Handle,
+    LazyObject,
     Object,
+    observe,
     PreCommitEvent,
     StoredList,
+    StoredMapping,
+    StoredMappingData,
     StoredState,
     StoredStateData,
 )
-from ops.storage import NoSnapshotError, SQLiteStorage
+from ops.storage import JujuStorage, NoSnapshotError, SQLiteStorage
 from test.test_helpers import fake_script, BaseTestCase
 
 
@@ -333,6 +351,793 @@ class TestFramework(BaseTestCase):
         self.assertRaises(NoSnapshotError, framework.load_snapshot, ev_b_handle)
         self.assertRaises(NoSnapshotError, framework.load_snapshot, ev_c_handle)
 
+    def test_reemit_single_pass(self):
+        framework = self.create_framework()
+
+        class MyNotifier(Object):
+            foo = EventSource(NumberEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+                self.defer = True
+
+            def _on_foo(self, event):
+                self.seen.append(event.n)
+                # Each observer gets its own event object.
+                event.n = None
+                if self.defer:
+                    event.defer()
+
+        pub = MyNotifier(framework, "pub")
+        obs1 = MyObserver(framework, "1")
+        obs2 = MyObserver(framework, "2")
+        framework.observe(pub.foo, obs1._on_foo)
+        framework.observe(pub.foo, obs2._on_foo)
+        pub.foo.emit(1)
+        pub.foo.emit(2)
+        self.assertEqual(obs1.seen, [1, 2])
+        self.assertEqual(obs2.seen, [1, 2])
+
+        obs1.defer = obs2.defer = False
+        store = framework._storage
+        with patch.object(store, 'load_snapshot', side_effect=AssertionError), \
+                patch.object(store, 'drop_notice', side_effect=AssertionError), \
+                patch.object(store, 'drop_notices', wraps=store.drop_notices) as drop_notices, \
+                patch.object(store, 'drop_snapshots', wraps=store.drop_snapshots) as drop_snaps:
+            framework.reemit()
+        self.assertEqual(obs1.seen, [1, 2, 1, 2])
+        self.assertEqual(obs2.seen, [1, 2, 1, 2])
+        self.assertEqual(drop_notices.call_count, 1)
+        self.assertEqual(drop_snaps.call_count, 1)
+        self.assertEqual(list(store.notices(None)), [])
+        self.assertEqual(list(store.list_snapshots()), [])
+
+    def test_coalesce_deferrals(self):
+        framework = self.create_framework()
+
+        class MyEvent(NumberEvent):
+            def coalesce_key(self):
+                return self.n % 2
+
+        class LatestEvent(MyEvent):
+            coalesce = CoalescePolicy.latest
+
+        class MyNotifier(Object):
+            foo = EventSource(MyEvent)
+            bar = EventSource(LatestEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+
+            def _on_event(self, event):
+                self.seen.append((event.handle.kind, event.n))
+                event.defer()
+
+        pub = MyNotifier(framework, "pub")
+        obs_all = MyObserver(framework, "all")
+        obs_key = MyObserver(framework, "key")
+        obs_latest = MyObserver(framework, "latest")
+        framework.observe(pub.foo, obs_all._on_event)
+        framework.observe(pub.foo, obs_key._on_event, coalesce=CoalescePolicy.latest_per_key)
+        framework.observe(pub.bar, obs_latest._on_event)
+        with self.assertRaises(TypeError):
+            framework.observe(pub.foo, obs_all._on_event, coalesce='latest')
+
+        for n in range(4):
+            pub.foo.emit(n)
+            pub.bar.emit(n)
+
+        self.assertEqual(deferred_numbers(framework, obs_all), [0, 1, 2, 3])
+        self.assertEqual(deferred_numbers(framework, obs_key), [2, 3])
+        self.assertEqual(deferred_numbers(framework, obs_latest), [3])
+
+        # Events nobody references anymore are gone from storage.
+        snapshots = [path for path in framework._storage.list_snapshots() if '/bar[' in path]
+        self.assertEqual(snapshots, ['MyNotifier[pub]/bar[8]'])
+
+        obs_latest.seen = []
+        framework.reemit()
+        self.assertEqual(obs_latest.seen, [('bar', 3)])
+
+    def test_deferral_limits(self):
+        framework = self.create_framework()
+
+        class MyNotifier(Object):
+            foo = EventSource(NumberEvent)
+            bar = EventSource(NumberEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.refused = []
+
+            def _on_foo(self, event):
+                try:
+                    event.defer()
+                except DeferralLimitError:
+                    self.refused.append(event.n)
+
+        pub = MyNotifier(framework, "pub")
+        obs1 = MyObserver(framework, "1")
+        obs2 = MyObserver(framework, "2")
+        framework.observe(pub.foo, obs1._on_foo)
+        framework.observe(pub.foo, obs2._on_foo)
+
+        with self.assertRaises(ValueError):
+            framework.set_deferral_limits(per_observer=0)
+        with self.assertRaises(TypeError):
+            framework.set_deferral_limits(total=3, eviction='refuse')
+
+        framework.set_deferral_limits(per_observer=2)
+        for n in range(4):
+            pub.foo.emit(n)
+        self.assertLoggedWarning('Deferred events for', 'MyObserver[1]', 'exceeded the limit of 2')
+        self.assertEqual(deferred_numbers(framework, obs1), [2, 3])
+        self.assertEqual(deferred_numbers(framework, obs2), [2, 3])
+        self.assertEqual(framework.evicted_count, 4)
+        self.assertEqual(len(list(framework._storage.list_snapshots())), 2)
+
+        framework.set_deferral_limits(total=3, eviction=EvictionPolicy.drop_newest)
+        pub.foo.emit(4)
+        self.assertEqual(deferred_numbers(framework, obs1), [2, 3])
+        self.assertEqual(deferred_numbers(framework, obs2), [2])
+        self.assertEqual(framework.evicted_count, 7)
+
+        framework.set_deferral_limits(per_observer=2, eviction=EvictionPolicy.refuse)
+        pub.foo.emit(5)
+        self.assertEqual(obs1.refused, [5])
+        self.assertEqual(obs2.refused, [])
+        self.assertEqual(deferred_numbers(framework, obs1), [2, 3])
+        self.assertEqual(deferred_numbers(framework, obs2), [2, 5])
+        self.assertEqual(framework.evicted_count, 7)
+
+        # Events emitted together only count once their observer deferred them.
+        obs3 = MyObserver(framework, "3")
+        framework.observe(pub.bar, obs3._on_foo)
+        pub.bar.emit_many([(n,) for n in range(6, 11)])
+        self.assertEqual(obs3.refused, [8, 9, 10])
+        self.assertEqual(deferred_numbers(framework, obs3), [6, 7])
+
+        # Deferrals that aren't stored yet count too.
+        framework = self.create_framework()
+        framework.enable_optimistic_persistence()
+        framework.set_deferral_limits(per_observer=2, eviction=EvictionPolicy.refuse)
+        pub = MyNotifier(framework, "pub")
+        obs = MyObserver(framework, "1")
+        framework.observe(pub.foo, obs._on_foo)
+        pub.foo.emit_many([(n,) for n in range(4)])
+        self.assertEqual(obs.refused, [2, 3])
+        framework.commit()
+        self.assertEqual(deferred_numbers(framework, obs), [0, 1])
+
+    def test_defer_schedule(self):
+        framework = self.create_framework()
+
+        class MyNotifier(Object):
+            foo = EventSource(NumberEvent)
+            bar = EventSource(NumberEvent)
+
+        class OtherNotifier(Object):
+            foo = EventSource(NumberEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+                self.defer_args = {}
+
+            def _on_event(self, event):
+                self.seen.append(event.n)
+                if event.n in self.defer_args:
+                    event.defer(**self.defer_args[event.n])
+
+        pub = MyNotifier(framework, "pub")
+        other = OtherNotifier(framework, "other")
+        obs = MyObserver(framework, "obs")
+        framework.observe(pub.foo, obs._on_event)
+        framework.observe(pub.bar, obs._on_event)
+        framework.observe(other.foo, obs._on_event)
+
+        with self.assertRaises(TypeError):
+            NumberEvent(None, 0).defer(until='tomorrow')
+        with self.assertRaises(TypeError):
+            NumberEvent(None, 0).defer(backoff='1h')
+
+        now = 1000.0
+        obs.defer_args = {
+            1: {'until': datetime.datetime.fromtimestamp(now + 60)},
+            3: {'backoff': datetime.timedelta(seconds=10)},
+        }
+        with patch('time.time', return_value=now):
+            pub.foo.emit(1)
+            pub.bar.emit(2)
+            other.foo.emit(3)
+            other.foo.emit(4)
+        self.assertEqual(obs.seen, [1, 2, 3, 4])
+        self.assertEqual(framework._storage.notice_schedules(), {
+            ('MyNotifier[pub]/foo[1]', 'MyObserver[obs]', '_on_event'): (now + 60, 0),
+            ('OtherNotifier[other]/foo[3]', 'MyObserver[obs]', '_on_event'): (now + 10, 1),
+        })
+
+        obs.seen = []
+        obs.defer_args = {2: {}}
+        pub.bar.emit(2)
+        self.assertEqual(obs.seen, [2])
+
+        # Nothing is due yet, and the later event from the same emitter waits too.
+        obs.seen = []
+        with patch('time.time', return_value=now + 5), \
+                patch.object(framework._storage, 'load_snapshot') as load_snapshot:
+            framework.reemit()
+        load_snapshot.assert_not_called()
+        self.assertEqual(obs.seen, [])
+
+        # Deferring again with a backoff doubles the delay.
+        obs.defer_args = {3: {'backoff': 10}}
+        with patch('time.time', return_value=now + 10):
+            framework.reemit()
+        self.assertEqual(obs.seen, [3])
+        self.assertEqual(framework._storage.notice_schedules()[
+            ('OtherNotifier[other]/foo[3]', 'MyObserver[obs]', '_on_event')], (now + 30, 2))
+
+        obs.seen = []
+        obs.defer_args = {}
+        with patch('time.time', return_value=now + 30):
+            framework.reemit()
+        self.assertEqual(obs.seen, [3])
+        with patch('time.time', return_value=now + 60):
+            framework.reemit()
+        self.assertEqual(obs.seen, [3, 1, 2])
+        self.assertEqual(list(framework._storage.notices(None)), [])
+
+    def test_profiling(self):
+        framework = self.create_framework()
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+            bar = EventSource(EventBase)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.defer_foo = True
+
+            def _on_foo(self, event):
+                if self.defer_foo:
+                    event.defer()
+
+            def _on_bar(self, event):
+                pass
+
+        pub = MyNotifier(framework, "pub")
+        obs = MyObserver(framework, "obs")
+        framework.observe(pub.foo, obs._on_foo)
+        framework.observe(pub.bar, obs._on_bar)
+
+        # Nothing is collected by default.
+        self.assertIsNone(framework.profiler)
+        pub.foo.emit()
+
+        profiler = framework.enable_profiling()
+        self.assertIs(framework.enable_profiling(), profiler)
+        calls = []
+        profiler.add_callback(calls.append)
+        pub.bar.emit()
+        framework.reemit()
+        obs.defer_foo = False
+        framework.reemit()
+        framework.commit()
+
+        self.assertEqual([c[:3] + c[5:] for c in calls], [
+            ('bar', 'MyObserver[obs]', '_on_bar', False),
+            ('foo', 'MyObserver[obs]', '_on_foo', True),
+            ('foo', 'MyObserver[obs]', '_on_foo', False),
+        ])
+        for c in calls:
+            self.assertGreaterEqual(c.wall_time, 0)
+            self.assertGreaterEqual(c.cpu_time, 0)
+        stats = profiler.observers[('foo', 'MyObserver[obs]', '_on_foo')]
+        self.assertEqual((stats.calls, stats.deferred), (2, 1))
+        self.assertEqual(stats.wall_time, calls[1].wall_time + calls[2].wall_time)
+
+        results = profiler.as_dict()
+        self.assertEqual(
+            [(o['event_kind'], o['calls'], o['deferred']) for o in results['observers']],
+            [('bar', 1, 0), ('foo', 2, 1)])
+        # The bar event, plus the framework state on commit.
+        self.assertGreaterEqual(results['snapshots']['save']['count'], 2)
+        self.assertGreater(results['snapshots']['load']['count'], 0)
+        self.assertGreater(results['snapshots']['load']['time'], 0)
+
+    def test_async_observers(self):
+        framework = self.create_framework()
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+            bar = EventSource(EventBase)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+                self.defer = False
+
+            async def _on_foo(self, event):
+                self.seen.append('start ' + self.handle.key)
+                await asyncio.sleep(0)
+                self.seen.append('end ' + self.handle.key)
+                if self.defer:
+                    event.defer()
+
+            def _on_sync_foo(self, event):
+                self.seen.append('sync ' + self.handle.key)
+
+            async def _on_bar(self, event):
+                # Emitting from an async observer reaches other async observers.
+                pub.foo.emit()
+
+        pub = MyNotifier(framework, "pub")
+        obs1 = MyObserver(framework, "1")
+        obs2 = MyObserver(framework, "2")
+        framework.observe(pub.foo, obs1._on_foo)
+        framework.observe(pub.foo, obs2._on_foo)
+        framework.observe(pub.foo, obs2._on_sync_foo)
+
+        # Async observers are run one after the other by default.
+        pub.foo.emit()
+        self.assertEqual(obs1.seen + obs2.seen, ['start 1', 'end 1', 'start 2', 'end 2', 'sync 2'])
+
+        seen = []
+        framework2 = self.create_framework()
+        pub = MyNotifier(framework2, "pub")
+        obs1 = MyObserver(framework2, "1")
+        obs2 = MyObserver(framework2, "2")
+        obs1.seen = obs2.seen = seen
+        framework2.observe(pub.foo, obs1._on_foo, parallel=True)
+        framework2.observe(pub.foo, obs2._on_foo, parallel=True)
+        framework2.observe(pub.foo, obs2._on_sync_foo)
+        framework2.observe(pub.bar, obs1._on_bar)
+
+        obs2.defer = True
+        pub.foo.emit()
+        self.assertEqual(seen, ['start 1', 'start 2', 'end 1', 'end 2', 'sync 2'])
+        self.assertEqual(list(framework2._storage.notices(None)), [
+            ('MyNotifier[pub]/foo[1]', 'MyObserver[2]', '_on_foo'),
+        ])
+
+        del seen[:]
+        obs2.defer = False
+        pub.bar.emit()
+        self.assertEqual(seen, ['start 1', 'start 2', 'end 1', 'end 2', 'sync 2'])
+        del seen[:]
+        framework2.reemit()
+        self.assertEqual(seen, ['start 2', 'end 2'])
+        self.assertEqual(list(framework2._storage.notices(None)), [])
+
+    def test_parallel_observers(self):
+        framework = self.create_framework()
+        barrier = threading.Barrier(3, timeout=5)
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+            bar = EventSource(EventBase)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.threads = []
+                self.defer = False
+
+            def _on_foo(self, event):
+                self.threads.append(threading.get_ident())
+                # Only passes if all the parallel observers run at the same time.
+                barrier.wait()
+                if self.defer:
+                    event.defer()
+
+            async def _on_async_foo(self, event):
+                self.threads.append(threading.get_ident())
+                await asyncio.get_event_loop().run_in_executor(None, barrier.wait)
+
+            def _on_bar(self, event):
+                pub.foo.emit()
+
+        pub = MyNotifier(framework, "pub")
+        obs1 = MyObserver(framework, "1")
+        obs2 = MyObserver(framework, "2")
+        obs3 = MyObserver(framework, "3")
+        framework.observe(pub.foo, obs1._on_foo, parallel=True)
+        framework.observe(pub.foo, obs2._on_foo, parallel=True)
+        framework.observe(pub.foo, obs3._on_async_foo, parallel=True)
+        framework.observe(pub.bar, obs1._on_bar, parallel=True)
+
+        obs1.defer = obs2.defer = True
+        pub.foo.emit()
+        self.assertNotIn(threading.get_ident(), obs1.threads + obs2.threads)
+        self.assertEqual(obs3.threads, [threading.get_ident()])
+        # The notices are still kept in order.
+        self.assertEqual(list(framework._storage.notices(None)), [
+            ('MyNotifier[pub]/foo[1]', 'MyObserver[1]', '_on_foo'),
+            ('MyNotifier[pub]/foo[1]', 'MyObserver[2]', '_on_foo'),
+        ])
+
+        with self.assertRaisesRegex(RuntimeError, 'cannot emit MyNotifier\\[pub\\]/foo\\[3\\]'):
+            pub.bar.emit()
+
+    def test_parallel_observers_use_storage(self):
+        framework = self.create_framework()
+        barrier = threading.Barrier(4, timeout=5)
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+
+        class Shared(Object):
+            _stored = StoredState()
+
+        class MyObserver(Object):
+            def _on_foo(self, event):
+                barrier.wait()
+                # They all bind the state at once.
+                shared._stored.set_default(count=0)
+                event.defer()
+
+        pub = MyNotifier(framework, 'pub')
+        shared = Shared(framework, 'shared')
+        observers = [MyObserver(framework, str(i)) for i in range(4)]
+        for obs in observers:
+            framework.observe(pub.foo, obs._on_foo, parallel=True)
+        framework.set_deferral_limits(per_observer=1, eviction=EvictionPolicy.refuse)
+
+        pub.foo.emit()
+        self.assertEqual(shared._stored.count, 0)
+        self.assertEqual(len(list(framework._storage.notices(None))), 4)
+        # Deferrals over the limit are refused once the observers are done.
+        with self.assertRaises(DeferralLimitError):
+            pub.foo.emit()
+
+    def test_emit_batch(self):
+        framework = self.create_framework()
+
+        class MyEvent(EventBase):
+            def __init__(self, handle, n, tag='x'):
+                super().__init__(handle)
+                self.n = n
+                self.tag = tag
+
+            def snapshot(self):
+                return {'n': self.n, 'tag': self.tag}
+
+            def restore(self, snapshot):
+                self.n = snapshot['n']
+                self.tag = snapshot['tag']
+
+        class MyNotifier(Object):
+            foo = EventSource(MyEvent)
+            bar = EventSource(MyEvent)
+            baz = EventSource(MyEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+
+            def _on_any(self, event):
+                if not self.seen:
+                    # Everything was saved before the first observer is notified.
+                    self.pending = len(list(framework._storage.notices(None)))
+                self.seen.append((self.handle.key, event.handle.path, event.n, event.tag))
+                if event.n == 2:
+                    event.defer()
+
+        pub = MyNotifier(framework, "pub")
+        obs1 = MyObserver(framework, "1")
+        obs2 = MyObserver(framework, "2")
+        framework.observe(pub.foo, obs1._on_any)
+        framework.observe(pub.foo, obs2._on_any)
+        framework.observe(pub.bar, obs1._on_any)
+
+        pub.foo.emit_many([(1,), (2,)])
+        self.assertEqual(obs1.pending, 4)
+        self.assertEqual(obs1.seen + obs2.seen, [
+            ('1', 'MyNotifier[pub]/foo[1]', 1, 'x'),
+            ('1', 'MyNotifier[pub]/foo[2]', 2, 'x'),
+            ('2', 'MyNotifier[pub]/foo[1]', 1, 'x'),
+            ('2', 'MyNotifier[pub]/foo[2]', 2, 'x'),
+        ])
+
+        obs1.seen = []
+        framework.emit_batch([
+            (pub.bar, (3,), {'tag': 'y'}),
+            (pub.baz, (4,)),
+            (pub.foo, (5,)),
+        ])
+        self.assertEqual(obs1.seen, [
+            ('1', 'MyNotifier[pub]/bar[3]', 3, 'y'),
+            ('1', 'MyNotifier[pub]/foo[5]', 5, 'x'),
+        ])
+        # Only the deferred notices are left, and the event without observers was
+        # never saved.
+        self.assertEqual(list(framework._storage.notices(None)), [
+            ('MyNotifier[pub]/foo[2]', 'MyObserver[1]', '_on_any'),
+            ('MyNotifier[pub]/foo[2]', 'MyObserver[2]', '_on_any'),
+        ])
+        self.assertEqual(
+            sorted(framework._storage.list_snapshots()), ['MyNotifier[pub]/foo[2]'])
+        self.assertEqual(framework._stored['event_count'], 5)
+
+        msg = 'unable to save the data for MyEvent, it must contain only simple types'
+        with self.assertRaisesRegex(ValueError, msg):
+            pub.foo.emit_many([(6,), (object(),)])
+
+    def test_optimistic_persistence(self):
+        framework = self.create_framework()
+        framework.enable_optimistic_persistence()
+
+        class MyNotifier(Object):
+            foo = EventSource(NumberEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+                self.defer = self.fail = False
+
+            def _on_foo(self, event):
+                self.seen.append(event.n)
+                if self.fail:
+                    raise RuntimeError('failed')
+                if self.defer:
+                    event.defer()
+
+        pub = MyNotifier(framework, "pub")
+        obs1 = MyObserver(framework, "1")
+        obs2 = MyObserver(framework, "2")
+        framework.observe(pub.foo, obs1._on_foo)
+        framework.observe(pub.foo, obs2._on_foo)
+        framework._storage = storage = Mock(wraps=framework._storage)
+
+        def writes():
+            return [c[0] for c in storage.method_calls if c[0].startswith(('save', 'drop'))]
+
+        pub.foo.emit(1)
+        obs2.defer = True
+        pub.foo.emit(2)
+        pub.foo.emit_many([(3,)])
+        self.assertEqual((obs1.seen, obs2.seen), ([1, 2, 3], [1, 2, 3]))
+        self.assertEqual(writes(), [])
+
+        # An observer raising leaves nothing behind.
+        obs1.fail = True
+        with self.assertRaisesRegex(RuntimeError, 'failed'):
+            pub.foo.emit(4)
+        obs1.fail = False
+
+        # The deferred events are stored on commit.
+        framework.commit()
+        self.assertEqual(list(storage.notices(None)), [
+            ('MyNotifier[pub]/foo[2]', 'MyObserver[2]', '_on_foo'),
+            ('MyNotifier[pub]/foo[3]', 'MyObserver[2]', '_on_foo'),
+        ])
+        self.assertEqual(
+            sorted(storage.list_snapshots()),
+            ['MyNotifier[pub]/foo[2]', 'MyNotifier[pub]/foo[3]', 'StoredStateData[_stored]'])
+
+        obs2.seen = []
+        obs2.defer = False
+        pub.foo.emit(5)
+        obs2.defer = True
+        pub.foo.emit(6)
+        # Reemitting needs the pending deferrals stored first.
+        framework.reemit()
+        self.assertEqual(obs2.seen, [5, 6, 2, 3, 6])
+        self.assertEqual(list(storage.notices(None)), [
+            ('MyNotifier[pub]/foo[2]', 'MyObserver[2]', '_on_foo'),
+            ('MyNotifier[pub]/foo[3]', 'MyObserver[2]', '_on_foo'),
+            # The commit took keys 5 and 6 for its own events.
+            ('MyNotifier[pub]/foo[8]', 'MyObserver[2]', '_on_foo'),
+        ])
+
+    def test_lazy_objects(self):
+        constructed = []
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+            bar = EventSource(EventBase)
+            upgrade = EventSource(charm.UpgradeCharmEvent)
+
+        class Component(Object):
+            _stored = StoredState()
+
+            def __init__(self, parent, key, event_kind):
+                super().__init__(parent, key)
+                constructed.append(key)
+                self.seen = []
+                # Binding the StoredState observes the commits of the framework.
+                self._stored.set_default(events=0)
+                self.framework.observe(getattr(parent.pub, event_kind), self._on_event)
+
+            def _on_event(self, event):
+                self.seen.append(event.handle.path)
+                self._stored.events += 1
+                if self.parent_defers:
+                    event.defer()
+
+            parent_defers = False
+
+        class Owner(Object):
+            comp = LazyObject(lambda owner: Component(owner, 'comp', 'foo'))
+            idle = LazyObject(lambda owner: Component(owner, 'idle', owner.idle_event))
+
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                # Factories may use anything set up in __init__.
+                self.pub = MyNotifier(self, 'pub')
+                self.idle_event = self.idle_kind
+
+            idle_kind = 'bar'
+
+        frameworks = []
+
+        def hook(*emit, reemit=False, defer=False):
+            del constructed[:]
+            if frameworks:
+                frameworks.pop().close()
+            framework = self.create_framework(tmpdir=self.tmpdir)
+            frameworks.append(framework)
+            Component.parent_defers = defer
+            owner = Owner(framework, 'owner')
+            if reemit:
+                framework.reemit()
+            for event_kind in emit:
+                getattr(owner.pub, event_kind).emit()
+            framework.commit()
+            return owner
+
+        self.assertIsInstance(Owner.comp, LazyObject)
+        # Nothing is known about them on the first hook.
+        hook()
+        self.assertEqual(constructed, ['comp', 'idle'])
+        owner = hook('bar')
+        self.assertEqual(constructed, ['idle'])
+        self.assertEqual(owner.idle.seen, ['Owner[owner]/MyNotifier[pub]/bar[3]'])
+        owner = hook('foo', defer=True)
+        self.assertEqual(constructed, ['comp'])
+        self.assertNotIn('idle', owner.__dict__)
+
+        owner = hook(reemit=True)
+        self.assertEqual(constructed, ['comp'])
+        self.assertEqual(owner.comp.seen, ['Owner[owner]/MyNotifier[pub]/foo[6]'])
+        self.assertEqual(owner.comp._stored.events, 2)
+        # Accessing the attribute constructs it too.
+        self.assertEqual(owner.idle.seen, [])
+        self.assertEqual(constructed, ['comp', 'idle'])
+
+        # On upgrade everything is constructed, and the observed events updated.
+        Owner.idle_kind = 'foo'
+        hook('upgrade')
+        self.assertEqual(constructed, ['comp', 'idle'])
+        hook('foo')
+        self.assertEqual(constructed, ['comp', 'idle'])
+        frameworks.pop().close()
+
+    def test_lazy_objects_with_declared_observers(self):
+        constructed = []
+
+        class MyNotifier(Object):
+            ping = EventSource(EventBase)
+            pong = EventSource(EventBase)
+
+        class Component(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                constructed.append(key)
+                self.owner = parent
+                self.seen = []
+
+            @observe('owner.pub.ping')
+            def _on_ping(self, event):
+                self.seen.append(event.handle.path)
+
+        class Owner(Object):
+            comp = LazyObject(lambda owner: Component(owner, 'comp'))
+
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.pub = MyNotifier(self, 'pub')
+
+        frameworks = []
+
+        def hook(*emit):
+            del constructed[:]
+            if frameworks:
+                frameworks.pop().close()
+            framework = self.create_framework(tmpdir=self.tmpdir)
+            frameworks.append(framework)
+            owner = Owner(framework, 'owner')
+            for event_kind in emit:
+                getattr(owner.pub, event_kind).emit()
+            framework.commit()
+            return owner
+
+        # The first hook constructs it to find out the events it observes, and it
+        # is notified of the event that caused that.
+        owner = hook('ping')
+        self.assertEqual(constructed, ['comp'])
+        self.assertEqual(owner.comp.seen, ['Owner[owner]/MyNotifier[pub]/ping[1]'])
+        owner = hook('pong')
+        self.assertEqual(constructed, [])
+        owner = hook('ping')
+        self.assertEqual(constructed, ['comp'])
+        self.assertEqual(owner.comp.seen, ['Owner[owner]/MyNotifier[pub]/ping[7]'])
+        frameworks.pop().close()
+
+    def test_cached_methods(self):
+        computed = []
+
+        class Component(Object):
+            config = {'rules': 'a,b'}
+
+            @cached_per_hook
+            def topology(self, scale=1):
+                computed.append(('topology', scale))
+                return [scale]
+
+            @cached_across_hooks(key=lambda self: self.config['rules'])
+            def rules(self):
+                computed.append('rules')
+                return self.config['rules'].split(',')
+
+            @cached_across_hooks(key=lambda self, name: name, ttl=60)
+            def greeting(self, name):
+                computed.append(('greeting', name))
+                return 'hello ' + name
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        comp = Component(framework, 'comp')
+        self.assertEqual(comp.topology(), [1])
+        self.assertIs(comp.topology(), comp.topology())
+        self.assertEqual(comp.topology(scale=2), [2])
+        self.assertEqual(comp.rules(), ['a', 'b'])
+        self.assertEqual(comp.rules(), ['a', 'b'])
+        self.assertEqual(computed, [('topology', 1), ('topology', 2), 'rules'])
+        self.assertEqual(Component.topology.cache_info(), (2, 2))
+        self.assertEqual(comp.rules.cache_info(), CacheInfo(hits=1, misses=1))
+        framework.commit()
+        framework.close()
+
+        # Per-hook results are gone, the others are loaded from storage.
+        del computed[:]
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        comp = Component(framework, 'comp')
+        comp.topology()
+        self.assertEqual(comp.rules(), ['a', 'b'])
+        self.assertEqual(computed, [('topology', 1)])
+        self.assertEqual(comp.rules.cache_info(), (2, 1))
+
+        # Only the result for the latest inputs is kept.
+        Component.config = {'rules': 'c'}
+        self.assertEqual(comp.rules(), ['c'])
+        self.assertEqual(comp.rules(), ['c'])
+        self.assertEqual(comp.greeting('bob'), 'hello bob')
+        self.assertEqual(comp.greeting('bob'), 'hello bob')
+        self.assertEqual(comp.greeting('ann'), 'hello ann')
+        self.assertEqual(
+            computed, [('topology', 1), 'rules', ('greeting', 'bob'), ('greeting', 'ann')])
+
+        # Results expire after their ttl.
+        del computed[:]
+        with patch('time.time', return_value=time.time() + 61):
+            comp.greeting('ann')
+        self.assertEqual(computed, [('greeting', 'ann')])
+
+        with self.assertRaisesRegex(TypeError, 'must be JSON serializable'):
+            comp.greeting(object())
+        framework.close()
+
     def test_custom_event_data(self):
         framework = self.create_framework()
 
@@ -381,6 +1186,361 @@ class TestFramework(BaseTestCase):
         #
         self.assertEqual(obs.seen, ["on_foo:foo=2", "on_foo:foo=2"])
 
+    def test_observers_dont_share_event_data(self):
+
+        class MyEvent(EventBase):
+            def __init__(self, handle, items):
+                super().__init__(handle)
+                self.items = items
+
+            def snapshot(self):
+                return {'items': self.items}
+
+            def restore(self, snapshot):
+                super().restore(snapshot)
+                self.items = snapshot['items']
+
+        class MyNotifier(Object):
+            foo = EventSource(MyEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+
+            def _on_foo(self, event):
+                self.seen.append(list(event.items))
+                event.items.append('x')
+                event.defer()
+
+        def check(emit, optimistic=False):
+            framework = self.create_framework()
+            self.addCleanup(framework.close)
+            if optimistic:
+                framework.enable_optimistic_persistence()
+            pub = MyNotifier(framework, '1')
+            obs_a = MyObserver(framework, 'a')
+            obs_b = MyObserver(framework, 'b')
+            framework.observe(pub.foo, obs_a._on_foo)
+            framework.observe(pub.foo, obs_b._on_foo)
+            emit(pub)
+            framework.reemit()
+            self.assertEqual(obs_a.seen, [['1'], ['1']])
+            self.assertEqual(obs_b.seen, [['1'], ['1']])
+            framework.commit()
+            framework.close()
+
+        check(lambda pub: pub.foo.emit(['1']))
+        check(lambda pub: pub.foo.emit_many([(['1'],)]))
+        check(lambda pub: pub.foo.emit(['1']), optimistic=True)
+
+    def test_event_data_decoded_once_per_observer(self):
+        framework = self.create_framework()
+
+        class MyEvent(EventBase):
+            def __init__(self, handle, items):
+                super().__init__(handle)
+                self.items = items
+
+            def snapshot(self):
+                return {'items': self.items}
+
+            def restore(self, snapshot):
+                super().restore(snapshot)
+                self.items = snapshot['items']
+
+        class MyNotifier(Object):
+            foo = EventSource(MyEvent)
+            bar = EventSource(MyEvent)
+
+        class MyObserver(Object):
+            def _on_event(self, event):
+                event.items.append('x')
+
+        pub = MyNotifier(framework, '1')
+        observers = [MyObserver(framework, str(i)) for i in range(3)]
+        framework.observe(pub.foo, observers[0]._on_event)
+        for observer in observers:
+            framework.observe(pub.bar, observer._on_event)
+
+        with patch('copy.deepcopy', wraps=copy.deepcopy) as deepcopy, \
+                patch('pickle.loads', wraps=pickle.loads) as loads:
+            # A single observer gets the data the storage decoded.
+            pub.foo.emit(['1'])
+            self.assertEqual(loads.call_count, 1)
+            # Every other observer unpickles its own copy.
+            pub.bar.emit(['1'])
+            self.assertEqual(loads.call_count, 4)
+        deepcopy.assert_not_called()
+
+    def test_event_fields(self):
+        framework = self.create_framework()
+
+        class MyEvent(EventBase):
+            host = EventField(str)
+            port = EventField(int)
+            tls = EventField(bool, default=False)
+            note = EventField((str, dict), default=None)
+
+        class MyOtherEvent(MyEvent):
+            weight = EventField(float, default=1.0)
+
+        class MyNotifier(Object):
+            foo = EventSource(MyEvent)
+            bar = EventSource(MyOtherEvent)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+
+            def _on_event(self, event):
+                self.seen.append(event.snapshot())
+                event.defer()
+
+        pub = MyNotifier(framework, "1")
+        obs = MyObserver(framework, "1")
+        framework.observe(pub.foo, obs._on_event, when={'port': 80})
+        framework.observe(pub.bar, obs._on_event)
+
+        pub.foo.emit('example.com', 80)
+        pub.foo.emit('example.com', 443)
+        pub.bar.emit('example.com', 80, note={'a': 1}, weight=0.5)
+        framework.reemit()
+        self.assertEqual(obs.seen, [
+            ('example.com', 80, False, None),
+            ('example.com', 80, False, {'a': 1}, 0.5),
+            ('example.com', 80, False, None),
+            ('example.com', 80, False, {'a': 1}, 0.5),
+        ])
+        self.assertEqual(
+            framework._storage.load_snapshot('MyNotifier[1]/foo[1]'),
+            ('example.com', 80, False, None))
+
+        event = MyOtherEvent(Handle(pub, 'bar', '9'), 'localhost', port=8080, tls=True)
+        self.assertEqual((event.host, event.port, event.tls, event.note, event.weight),
+                         ('localhost', 8080, True, None, 1.0))
+        self.assertFalse(hasattr(event, '__dict__'))
+        self.assertEqual(MyOtherEvent.__slots__, ('weight',))
+
+        # Snapshots from before a field with a default was added are still restored.
+        event.restore(('other', 1))
+        self.assertEqual((event.host, event.port, event.tls), ('other', 1, False))
+
+        with self.assertRaisesRegex(TypeError, r"MyEvent.port must be a int, not '80'"):
+            MyEvent(Handle(pub, 'foo', '9'), 'localhost', '80')
+        with self.assertRaisesRegex(TypeError, "missing a required argument: 'port'"):
+            MyEvent(Handle(pub, 'foo', '9'), 'localhost')
+        with self.assertRaisesRegex(TypeError, "multiple values for argument 'host'"):
+            MyEvent(Handle(pub, 'foo', '9'), 'localhost', 80, host='other')
+        with self.assertRaisesRegex(TypeError, 'event fields cannot be of type'):
+            EventField(object)
+        with self.assertRaisesRegex(TypeError, 'is mutable'):
+            EventField(list, default=[])
+        with self.assertRaisesRegex(TypeError, 'without a default follows'):
+            class BadEvent(MyEvent):
+                user = EventField(str)
+        for name in ('handle', 'deferred', 'snapshot', 'self'):
+            with self.subTest(name=name):
+                with self.assertRaisesRegex(TypeError, 'clashes with an attribute'):
+                    type('BadEvent', (EventBase,), {name: EventField(str)})
+
+        # Event types can still be abstract.
+        class MyAbstractEvent(EventBase, abc.ABC):
+            host = EventField(str)
+
+            @abc.abstractmethod
+            def describe(self):
+                pass
+
+        class MyConcreteEvent(MyAbstractEvent):
+            def describe(self):
+                return 'on ' + self.host
+
+        with self.assertRaises(TypeError):
+            MyAbstractEvent(Handle(pub, 'foo', '9'), 'localhost')
+        event = MyConcreteEvent(Handle(pub, 'foo', '9'), 'localhost')
+        self.assertEqual((event.describe(), event.snapshot()), ('on localhost', ('localhost',)))
+
+    def test_incremental_reemit(self):
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+
+        class MyObserver(Object):
+            _stored = StoredState()
+
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self._stored.set_default(seen=[])
+                self.fail_on = None
+
+            def _on_foo(self, event):
+                if not self._stored.seen and self.fail_on is None:
+                    event.defer()
+                    return
+                if event.handle.key == self.fail_on:
+                    raise RuntimeError('crash')
+                self._stored.seen.append(event.handle.key)
+
+        def hook():
+            framework = self.create_framework(tmpdir=self.tmpdir)
+            pub = MyNotifier(framework, 'pub')
+            obs = MyObserver(framework, 'obs')
+            framework.observe(pub.foo, obs._on_foo)
+            return framework, pub, obs
+
+        framework, pub, obs = hook()
+        for _ in range(5):
+            pub.foo.emit()
+        framework.commit()
+        framework.close()
+
+        framework, pub, obs = hook()
+        with self.assertRaises(ValueError):
+            framework.enable_incremental_reemit(0)
+        framework.enable_incremental_reemit(batch_size=2)
+        framework.enable_profiling()
+        obs.fail_on = '4'
+        with self.assertRaisesRegex(RuntimeError, 'crash'):
+            framework.reemit()
+        self.assertEqual(framework.profiler.snapshots['checkpoint'].count, 1)
+        # The hook dies without committing.
+        framework.close()
+
+        # Only the events past the last checkpoint are reemitted.
+        framework, pub, obs = hook()
+        self.assertEqual(obs._stored.seen, ['1', '2'])
+        framework.reemit()
+        self.assertEqual(list(obs._stored.seen), ['1', '2', '3', '4', '5'])
+        framework.commit()
+        self.assertEqual(list(framework._storage.notices(None)), [])
+        framework.close()
+
+        # Juju only commits the state at the end of the hook.
+        framework = self.create_framework()
+        framework._storage = JujuStorage(Mock())
+        framework.enable_incremental_reemit()
+        self.assertLoggedWarning('Incremental reemit has no effect')
+        self.assertIsNone(framework._reemit_batch_size)
+
+    def test_observe_decorator(self):
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.pub = MyNotifier(self, 'pub')
+                self.seen = []
+
+            @observe('pub.foo')
+            def _on_foo(self, event, defer=True):
+                self.seen.append(event.handle.path)
+                if defer:
+                    event.defer()
+
+        self.assertEqual(MyObserver._observer_table, (('_on_foo', 'pub.foo', {
+            'coalesce': None, 'parallel': False, 'when': None, 'priority': 0}),))
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obs = MyObserver(framework, '1')
+        with patch('inspect.signature') as signature:
+            obs.pub.foo.emit()
+        signature.assert_not_called()
+        framework.commit()
+        framework.close()
+
+        # Deferred events are reemitted to the declared observers of new objects.
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obs = MyObserver(framework, '1')
+        framework.reemit()
+        self.assertEqual(obs.seen, ['MyObserver[1]/MyNotifier[pub]/foo[1]'])
+        framework.close()
+
+        with self.assertRaises(TypeError):
+            observe(object())
+
+    def test_observer_priority(self):
+        framework = self.create_framework()
+
+        class MyNotifier(Object):
+            foo = EventSource(EventBase)
+
+        class MyObserver(Object):
+            def __init__(self, parent, key):
+                super().__init__(parent, key)
+                self.seen = []
+                self.action = None
+
+            def _on_foo(self, event):
+                self.seen.append(event.handle.path)
+                if self.action == 'consume':
+                    event.consume()
+                elif self.action == 'defer_all':
+                    event.defer_all()
+                elif self.action == 'defer':
+                    event.defer()
+
+        pub = MyNotifier(framework, 'pub')
+        low = MyObserver(framework, 'low')
+        default = MyObserver(framework, 'default')
+        guard = MyObserver(framework, 'guard')
+        framework.observe(pub.foo, low._on_foo, priority=-1)
+        framework.observe(pub.foo, default._on_foo)
+        framework.observe(pub.foo, guard._on_foo, priority=10)
+
+        def seen():
+            seen = [(obs.handle.key, path[-2]) for obs in (guard, default, low)
+                    for path in obs.seen]
+            for obs in (guard, default, low):
+                del obs.seen[:]
+            return seen
+
+        # Observers are notified by decreasing priority.
+        self.assertEqual(framework._event_observers(EventBase(Handle(pub, 'foo', '0'))), [
+            ('MyObserver[guard]', '_on_foo'), ('MyObserver[default]', '_on_foo'),
+            ('MyObserver[low]', '_on_foo')])
+        pub.foo.emit()
+        self.assertEqual(seen(), [('guard', '1'), ('default', '1'), ('low', '1')])
+
+        # Consuming the event drops the notices of the observers after the consumer.
+        default.action = 'consume'
+        pub.foo.emit()
+        self.assertEqual(seen(), [('guard', '2'), ('default', '2')])
+        self.assertEqual(list(framework._storage.notices(None)), [])
+
+        # Deferring it for all keeps them, and they only run after the consumer again.
+        default.action = None
+        guard.action = 'defer_all'
+        pub.foo.emit()
+        self.assertEqual(seen(), [('guard', '3')])
+        self.assertEqual(len(list(framework._storage.notices(None))), 3)
+        framework.reemit()
+        self.assertEqual(seen(), [('guard', '3')])
+        guard.action = None
+        low.action = 'defer'
+        framework.reemit()
+        self.assertEqual(seen(), [('guard', '3'), ('default', '3'), ('low', '3')])
+        self.assertEqual(list(framework._storage.notices(None)), [
+            ('MyNotifier[pub]/foo[3]', 'MyObserver[low]', '_on_foo')])
+
+        # A consumer that defers only itself drops the others.
+        low.action = None
+        guard.action = 'defer'
+        default.action = 'consume'
+        pub.foo.emit()
+        self.assertEqual(seen(), [('guard', '4'), ('default', '4')])
+        self.assertEqual(list(framework._storage.notices(None)), [
+            ('MyNotifier[pub]/foo[3]', 'MyObserver[low]', '_on_foo'),
+            ('MyNotifier[pub]/foo[4]', 'MyObserver[guard]', '_on_foo')])
+
+        with self.assertRaises(TypeError):
+            framework.observe(pub.foo, low._on_foo, priority='high')
+        with self.assertRaises(TypeError):
+            observe('foo', priority=1.5)
+
     def test_weak_observer(self):
         framework = self.create_framework()
 
@@ -695,6 +1855,39 @@ class TestFramework(BaseTestCase):
         with self.assertRaises(RuntimeError):
             pub.on_a.define_event("foo", MyFoo)
 
+    def test_events_table(self):
+        framework = self.create_framework()
+
+        class MyEvent(EventBase):
+            pass
+
+        class MyEvents(ObjectEvents):
+            foo = EventSource(MyEvent)
+            bar = EventSource(MyEvent)
+
+        class MySubEvents(MyEvents):
+            bar = None
+            db_baz = EventSource(MyEvent)
+
+        class MyNotifier(Object):
+            on = MySubEvents()
+
+        pub = MyNotifier(framework, "1")
+        self.assertEqual(list(pub.on.events()), ['foo', 'db_baz'])
+        self.assertEqual(list(MyEvents._event_sources), ['foo', 'bar'])
+
+        # Events defined at runtime on a base are visible from existing subclasses.
+        MyEvents.define_event('qux', MyEvent)
+        events = pub.on.events()
+        self.assertEqual(list(events), ['foo', 'db_baz', 'qux'])
+        self.assertEqual(events['qux'].event_kind, 'qux')
+        self.assertIs(events['qux'].emitter, pub.on)
+
+        # Prefixed lookups go through the same table.
+        self.assertEqual(pub.on['db'].baz.event_kind, 'db_baz')
+        with self.assertRaises(AttributeError):
+            pub.on['db'].bar
+
     def test_event_key_roundtrip(self):
         class MyEvent(EventBase):
             def __init__(self, handle, value):
@@ -779,7 +1972,8 @@ class TestFramework(BaseTestCase):
         with self.assertRaises(ValueError) as cm:
             framework.save_snapshot(event)
         expected = (
-            "unable to save the data for FooEvent, it must contain only simple types: "
+            "unable to save the data for FooEvent, it must contain only simple types "
+            "(found <class 'test.test_framework.TestFramework'> at data['bar']): "
             "{'bar': <class 'test.test_framework.TestFramework'>}")
         self.assertEqual(str(cm.exception), expected)
 
@@ -1003,6 +2197,254 @@ class TestStoredState(BaseTestCase):
         self.assertEqual(b2._stored.foo, "hello")
         self.assertEqual(z2._stored.foo, {1})
 
+    def test_per_key_persistence(self):
+        class SomeObject(Object):
+            _stored = StoredState()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        obj._stored.peers = {'a/0': {'addr': '10.0.0.1'}}
+        obj._stored.count = 0
+        framework.commit()
+
+        path = 'SomeObject[1]/StoredStateData[_stored]'
+        saved = []
+        orig_save_record = framework._storage.save_record
+        orig_save_snapshot = framework._storage.save_snapshot
+
+        def save_record(namespace, key, data):
+            if namespace == path:
+                saved.append(key)
+            orig_save_record(namespace, key, data)
+
+        def save_snapshot(handle_path, data):
+            if handle_path == path:
+                saved.append(data)
+            orig_save_snapshot(handle_path, data)
+
+        with patch.object(framework._storage, 'save_record', save_record), \
+                patch.object(framework._storage, 'save_snapshot', save_snapshot):
+            # Only the changed keys are saved, and the list of keys only when it changes.
+            obj._stored.count += 1
+            framework.commit()
+            self.assertEqual(saved, ['count'])
+            saved.clear()
+            obj._stored.peers['a/0']['addr'] = '10.0.0.2'
+            framework.commit()
+            self.assertEqual(saved, ['peers'])
+            saved.clear()
+            obj._stored.extra = True
+            framework.commit()
+            self.assertEqual(saved, ['extra', ['count', 'extra', 'peers']])
+            saved.clear()
+            framework.commit()
+            self.assertEqual(saved, [])
+        framework.close()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertEqual(obj._stored.peers, {'a/0': {'addr': '10.0.0.2'}})
+        self.assertEqual(obj._stored.count, 1)
+        self.assertEqual(obj._stored.extra, True)
+
+    def test_cached_wrappers(self):
+        class SomeObject(Object):
+            _stored = StoredState()
+
+        framework = self.create_framework()
+        obj = SomeObject(framework, '1')
+        obj._stored.peers = {'a/0': {'addr': '10.0.0.1'}, 'a/1': {'addr': '10.0.0.2'}}
+        obj._stored.seen = [{1}]
+
+        peers = obj._stored.peers
+        self.assertIs(obj._stored.peers, peers)
+        self.assertIs(peers['a/0'], obj._stored.peers['a/0'])
+        self.assertIs(obj._stored.seen[0], obj._stored.seen[0])
+        with self.assertRaises(AttributeError):
+            peers.__dict__
+
+        # Replaced containers get new wrappers, the others keep theirs.
+        a0 = peers['a/0']
+        a1 = peers['a/1']
+        peers['a/0'] = {'addr': '10.0.0.3'}
+        self.assertIsNot(peers['a/0'], a0)
+        self.assertEqual(peers['a/0'], {'addr': '10.0.0.3'})
+        self.assertIs(peers['a/1'], a1)
+        del peers['a/1']
+        peers['a/1'] = {'addr': '10.0.0.4'}
+        self.assertIsNot(peers['a/1'], a1)
+        self.assertEqual(peers['a/1']['addr'], '10.0.0.4')
+
+        obj._stored.peers = {}
+        self.assertIsNot(obj._stored.peers, peers)
+        self.assertEqual(obj._stored.peers, {})
+
+    def test_single_snapshot_migration(self):
+        class SomeObject(Object):
+            _stored = StoredState()
+
+        # The format used before each key was saved as a separate record.
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        path = 'SomeObject[1]/StoredStateData[_stored]'
+        framework._storage.save_snapshot(path, {'foo': [1, 2], 'bar': 'baz'})
+        framework.commit()
+        framework.close()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertEqual(obj._stored.foo, [1, 2])
+        self.assertEqual(obj._stored.bar, 'baz')
+        framework.commit()
+        self.assertEqual(framework._storage.load_snapshot(path), ['bar', 'foo'])
+        self.assertEqual(framework._storage.load_record(path, 'foo'), [1, 2])
+        framework.close()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertEqual(obj._stored.foo, [1, 2])
+        self.assertEqual(obj._stored.bar, 'baz')
+
+    def test_stored_mapping(self):
+        class SomeObject(Object):
+            peers = StoredMapping()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertIsInstance(obj.peers, BoundStoredMapping)
+        self.assertIs(obj.peers, obj.peers)
+        self.assertEqual(len(obj.peers), 0)
+        for i in range(5):
+            obj.peers['a/{}'.format(i)] = {'addr': '10.0.0.{}'.format(i)}
+        with self.assertRaises(TypeError):
+            obj.peers[1] = 'foo'
+        with self.assertRaises(TypeError):
+            obj.peers['foo'] = object()
+        with self.assertRaises(TypeError):
+            StoredMapping(schema={'addr': str})
+        framework.commit()
+        framework.close()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        namespace = 'SomeObject[1]/StoredMappingData[peers]'
+        storage = framework._storage
+        with patch.object(storage, 'load_record', wraps=storage.load_record) as load_record:
+            self.assertEqual(obj.peers['a/3'], {'addr': '10.0.0.3'})
+            self.assertEqual(obj.peers.get('a/3'), {'addr': '10.0.0.3'})
+            self.assertNotIn('b/0', obj.peers)
+            # Only the touched keys are loaded, once.
+            self.assertEqual(load_record.call_args_list, [
+                call(namespace, 'a/3'), call(namespace, 'b/0')])
+
+        obj.peers['a/3']['addr'] = '10.0.0.30'
+        del obj.peers['a/1']
+        with self.assertRaises(KeyError):
+            del obj.peers['a/1']
+        obj.peers['a/10'] = {}
+        obj.peers['a/5'] = {}
+        del obj.peers['a/5']
+        with patch.object(StoredMappingData, 'page_size', 2), \
+                patch.object(storage, 'list_records', wraps=storage.list_records) as list_records:
+            self.assertEqual([key for key in obj.peers], ['a/0', 'a/10', 'a/2', 'a/3', 'a/4'])
+            self.assertEqual(list_records.call_args_list, [
+                call(namespace, after=None, limit=2),
+                call(namespace, after='a/1', limit=2),
+                call(namespace, after='a/3', limit=2),
+            ])
+
+        with patch.object(storage, 'save_record', wraps=storage.save_record) as save_record, \
+                patch.object(storage, 'drop_record', wraps=storage.drop_record) as drop_record:
+            framework.commit()
+        self.assertEqual([c for c in save_record.call_args_list if c[0][0] == namespace], [
+            call(namespace, 'a/10', {}), call(namespace, 'a/3', {'addr': '10.0.0.30'})])
+        self.assertEqual(drop_record.call_args_list, [
+            call(namespace, 'a/1'), call(namespace, 'a/5')])
+        framework.close()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertEqual(dict(obj.peers), {
+            'a/0': {'addr': '10.0.0.0'},
+            'a/10': {},
+            'a/2': {'addr': '10.0.0.2'},
+            'a/3': {'addr': '10.0.0.30'},
+            'a/4': {'addr': '10.0.0.4'},
+        })
+
+    def test_stored_state_schema(self):
+        class SomeObject(Object):
+            _stored = StoredState(schema={
+                'seen': (set, set()),
+                'count': (int, 0),
+                'ratio': ((int, float), 0.5),
+                'leader': str,
+                'started': (bool, False),
+            })
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertEqual(
+            (obj._stored.seen, obj._stored.count, obj._stored.ratio, obj._stored.leader,
+             obj._stored.started),
+            (set(), 0, 0.5, None, False))
+        obj._stored.seen.add('a')
+        obj._stored.count += 1
+        obj._stored.ratio = 1
+        obj._stored.started = True
+        # Flags must be declared as bool rather than int.
+        with self.assertRaisesRegex(AttributeError, "'count' must be a int, not True"):
+            obj._stored.count = True
+        with self.assertRaisesRegex(AttributeError, "'started' must be a bool, not 1"):
+            obj._stored.started = 1
+        with self.assertRaisesRegex(AttributeError, "'leader' must be a str, not 1"):
+            obj._stored.leader = 1
+        with self.assertRaisesRegex(AttributeError, "'other' is not in the schema"):
+            obj._stored.other = 'foo'
+        with self.assertRaises(TypeError):
+            obj._stored.set_default(count=1)
+        storage = framework._storage
+        with patch.object(storage, 'save_record', wraps=storage.save_record) as save_record:
+            framework.commit()
+        self.assertEqual(storage.load_snapshot('SomeObject[1]/StoredStateData[_stored]'), (
+            ('count', 'leader', 'ratio', 'seen', 'started'), (1, None, 1, {'a'}, True)))
+        self.assertEqual(
+            [c for c in save_record.call_args_list if c[0][0].startswith('SomeObject')], [])
+        framework.close()
+
+        # Fields added to the schema start from their default, removed ones are dropped.
+        SomeObject._stored = StoredState(schema={'seen': set, 'extra': (str, 'x')})
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = SomeObject(framework, '1')
+        self.assertEqual((obj._stored.seen, obj._stored.extra), ({'a'}, 'x'))
+        with self.assertRaises(AttributeError):
+            obj._stored.count
+        framework.close()
+
+        # State saved without a schema is converted.
+        class OtherObject(Object):
+            _stored = StoredState()
+
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = OtherObject(framework, '1')
+        obj._stored.count = 3
+        framework.commit()
+        framework.close()
+        OtherObject._stored = StoredState(schema={'count': int})
+        framework = self.create_framework(tmpdir=self.tmpdir)
+        obj = OtherObject(framework, '1')
+        self.assertEqual(obj._stored.count, 3)
+        framework.commit()
+        self.assertEqual(
+            list(framework._storage.list_records('OtherObject[1]/StoredStateData[_stored]')), [])
+        framework.close()
+
+        with self.assertRaisesRegex(TypeError, 'cannot be of type'):
+            StoredState(schema={'foo': object})
+        with self.assertRaisesRegex(TypeError, 'is not a str'):
+            StoredState(schema={'foo': (str, 1)})
+        with self.assertRaises(ValueError):
+            StoredState(schema={'on': str})
+
     def test_two_names_one_state(self):
         class Mine(Object):
             _stored = StoredState()
@@ -1231,12 +2673,18 @@ class TestStoredState(BaseTestCase):
             def __init__(self, store, charm_dir, meta, model):
                 super().__init__(store, charm_dir, meta, model)
                 self.snapshots = []
+                self.records = []
 
             def save_snapshot(self, value):
                 if value.handle.path == 'SomeObject[1]/StoredStateData[_stored]':
                     self.snapshots.append((type(value), value.snapshot()))
                 return super().save_snapshot(value)
 
+            def _save_record(self, owner, namespace, key, data):
+                if namespace == 'SomeObject[1]/StoredStateData[_stored]':
+                    self.records.append((type(owner), key, data))
+                return super()._save_record(owner, namespace, key, data)
+
         # Validate correctness of modification operations.
         for get_a, b, expected_res, op, validate_op in test_operations:
             storage = SQLiteStorage(self.tmpdir / "framework.data")
@@ -1252,8 +2700,8 @@ class TestStoredState(BaseTestCase):
             obj._stored.a = get_a()
             framework.commit()
             # We should see an update for initializing a
-            self.assertEqual(framework.snapshots, [
-                (StoredStateData, {'a': get_a()}),
+            self.assertEqual(framework.records, [
+                (StoredStateData, 'a', get_a()),
             ])
             del obj
             gc.collect()
@@ -1277,6 +2725,7 @@ class TestStoredState(BaseTestCase):
             framework.snapshots.clear()
             framework_copy.commit()
             self.assertEqual(framework_copy.snapshots, [])
+            self.assertEqual(framework_copy.records, [])
             framework_copy.close()
 
     def test_comparison_operations(self):
@@ -1454,6 +2903,27 @@ class TestStoredState(BaseTestCase):
         #       parent._stored._data.dirty is False?
 
 
+class NumberEvent(EventBase):
+    """Event carrying a number, for the tests."""
+
+    def __init__(self, handle, n):
+        super().__init__(handle)
+        self.n = n
+
+    def snapshot(self):
+        return {'n': self.n}
+
+    def restore(self, snapshot):
+        self.n = snapshot['n']
+
+
+def deferred_numbers(framework, observer):
+    """Return the numbers of the NumberEvents observer deferred, in order."""
+    return [framework.load_snapshot(Handle.from_path(event_path)).n
+            for event_path, observer_path, _ in framework._storage.notices(None)
+            if observer_path == observer.handle.path]
+
+
 class GenericObserver(Object):
     """Generic observer for the tests."""
 
@@ -21,6 +21,7 @@ import sys
 import tempfile
 import unittest
 import importlib.util
+import json
 import warnings
 from pathlib import Path
 from unittest.mock import patch
@@ -32,9 +33,11 @@ from ops.charm import (
     HookEvent,
     InstallEvent,
     StartEvent,
+    StopEvent,
     ConfigChangedEvent,
     UpgradeCharmEvent,
     UpdateStatusEvent,
+    LeaderElectedEvent,
     LeaderSettingsChangedEvent,
     RelationJoinedEvent,
     RelationChangedEvent,
@@ -46,7 +49,8 @@ from ops.charm import (
     CollectMetricsEvent,
 )
 from ops.framework import Framework, StoredStateData
-from ops.main import main, CHARM_STATE_FILE
+from ops.main import main, CHARM_STATE_FILE, PROFILE_FILE
+from ops.shim import DISPATCH_MANIFEST_FILE
 from ops.storage import SQLiteStorage
 from ops.version import version
 
@@ -304,6 +308,52 @@ class _TestMain(abc.ABC):
             list(state.observed_event_types),
             ['ConfigChangedEvent', 'UpdateStatusEvent'])
 
+    def test_profile(self):
+        profile_file = self.JUJU_CHARM_DIR / PROFILE_FILE
+        self._simulate_event(EventSpec(InstallEvent, 'install'))
+        self.assertFalse(profile_file.exists())
+
+        self._simulate_event(EventSpec(
+            InstallEvent, 'install', set_in_env={'OPERATOR_PROFILE': '1'}))
+        profile = json.loads(profile_file.read_text())
+        self.assertEqual(profile['event_name'], 'install')
+        calls = [(o['event_kind'], o['observer_path'], o['method_name'], o['calls'])
+                 for o in profile['observers']]
+        self.assertIn(('install', 'Charm', '_on_install', 1), calls)
+        self.assertGreater(profile['snapshots']['load']['count'], 0)
+        self.assertGreater(profile['snapshots']['save']['count'], 0)
+
+    def test_dispatch_manifest(self):
+        manifest_file = self.JUJU_CHARM_DIR / DISPATCH_MANIFEST_FILE
+        skip_env = {'TEST_SKIP_UNOBSERVED': '1'}
+        # The manifest is only kept when the charm skips unobserved events.
+        self._simulate_event(EventSpec(InstallEvent, 'install'))
+        self.assertFalse(manifest_file.exists())
+        self._simulate_event(EventSpec(InstallEvent, 'install', set_in_env=skip_env))
+        manifest = json.loads(manifest_file.read_text())
+        self.assertIn('install', manifest['observed'])
+        self.assertIn('foo_bar_action', manifest['observed'])
+        self.assertNotIn('stop', manifest['observed'])
+        self.assertFalse(manifest['deferred'])
+        skipped = ['juju-log', '--log-level', 'DEBUG',
+                   'Event stop is not observed and nothing is deferred.']
+
+        # Unobserved events are only skipped when the charm asks for it.
+        fake_script_calls(self, clear=True)
+        self._simulate_event(EventSpec(StopEvent, 'stop'))
+        self.assertNotIn(skipped, fake_script_calls(self, clear=True))
+        # Nothing to do: the charm isn't even instantiated.
+        self._simulate_event(EventSpec(StopEvent, 'stop', set_in_env=skip_env))
+        self.assertIn(skipped, fake_script_calls(self, clear=True))
+
+        self._simulate_event(
+            EventSpec(ConfigChangedEvent, 'config-changed', set_in_env=skip_env))
+        self.assertTrue(json.loads(manifest_file.read_text())['deferred'])
+
+        # The deferred config-changed needs reemitting.
+        state = self._simulate_event(EventSpec(StopEvent, 'stop', set_in_env=skip_env))
+        self.assertEqual(list(state.observed_event_types), ['ConfigChangedEvent'])
+
     def test_no_reemission_on_collect_metrics(self):
         fake_script(self, 'add-metric', 'exit 0')
 
@@ -785,3 +835,23 @@ class TestMainWithDispatchAsScript(TestMainWithDispatch):
         dispatch = self.JUJU_CHARM_DIR / 'dispatch'
         subprocess.check_call([str(dispatch)],
                               env=env, cwd=str(self.JUJU_CHARM_DIR))
+
+    def test_dispatch_shim(self):
+        dispatch = self.JUJU_CHARM_DIR / 'dispatch'
+        dispatch.write_text('#!/bin/sh\nexec "{0}" "{1}" "{0}" "{2}"\n'.format(
+            sys.executable,
+            Path(__file__).parent.parent / 'ops/shim.py',
+            self.JUJU_CHARM_DIR / 'src/charm.py'))
+        self._simulate_event(EventSpec(InstallEvent, 'install'))
+        self.assertIn(VERSION_LOGLINE, fake_script_calls(self, clear=True))
+
+        # The charm isn't run at all for an event it doesn't observe.
+        self._simulate_event(EventSpec(StopEvent, 'stop'))
+        self.assertEqual(fake_script_calls(self, clear=True), [])
+        # Unless it's an event after which it may observe others.
+        self._simulate_event(EventSpec(LeaderElectedEvent, 'leader-elected'))
+        self.assertIn(VERSION_LOGLINE, fake_script_calls(self, clear=True))
+
+        state = self._simulate_event(EventSpec(ConfigChangedEvent, 'config-changed'))
+        self.assertEqual(list(state.observed_event_types), ['ConfigChangedEvent'])
+        self.assertIn(VERSION_LOGLINE, fake_script_calls(self, clear=True))
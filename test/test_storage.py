@@ -17,6 +17,8 @@ import gc
 import io
 import os
 import pathlib
+import pickle
+import sqlite3
 import sys
 import tempfile
 from textwrap import dedent
@@ -188,12 +190,214 @@ class StoragePermutations(abc.ABC):
              ('event', 'observer', 'method2'),
              ])
 
+    def test_drop_notices(self):
+        store = self.create_storage()
+        store.save_notice('event', 'observer', 'method')
+        store.save_notice('event', 'observer', 'method2')
+        store.save_notice('event2', 'observer', 'method')
+        store.drop_notices([('event', 'observer', 'method'), ('event2', 'observer', 'method')])
+        self.assertEqual(list(store.notices(None)), [('event', 'observer', 'method2')])
+        # Dropping notices that aren't there is a no-op.
+        store.drop_notices([('event', 'observer', 'method')])
+        self.assertEqual(list(store.notices(None)), [('event', 'observer', 'method2')])
+
+    def test_drop_snapshots(self):
+        store = self.create_storage()
+        store.save_snapshot('one', 1)
+        store.save_snapshot('two', 2)
+        store.drop_snapshots(['one', 'two', 'three'])
+        with self.assertRaises(storage.NoSnapshotError):
+            store.load_snapshot('one')
+        with self.assertRaises(storage.NoSnapshotError):
+            store.load_snapshot('two')
+
+    def test_notices_with_snapshots(self):
+        store = self.create_storage()
+        store.save_snapshot('event', {'content': 1})
+        store.save_snapshot('event2', {'content': 2})
+        store.save_notice('event', 'observer', 'method')
+        store.save_notice('event', 'observer2', 'method')
+        store.save_notice('event2', 'observer', 'method')
+        rows = list(store.notices_with_snapshots())
+        self.assertEqual([row[:4] for row in rows], [
+            ('event', 'observer', 'method', {'content': 1}),
+            ('event', 'observer2', 'method', {'content': 1}),
+            ('event2', 'observer', 'method', {'content': 2}),
+        ])
+        # The snapshot is only decoded once per event.
+        self.assertIs(rows[0][3], rows[1][3])
+        # Fresh copies can be unpickled from the raw data, if there's one.
+        for row in rows:
+            if row[4] is not None:
+                self.assertEqual(pickle.loads(row[4]), row[3])
+        self.assertEqual(
+            [row[:4] for row in store.notices_with_snapshots('event2')],
+            [('event2', 'observer', 'method', {'content': 2})])
+
+    def test_notices_with_missing_snapshot(self):
+        store = self.create_storage()
+        store.save_notice('event', 'observer', 'method')
+        with self.assertRaises(storage.NoSnapshotError):
+            list(store.notices_with_snapshots())
+
+    def test_save_snapshot_refuses_non_simple_types(self):
+        store = self.create_storage()
+
+        class Foo:
+            pass
+        foo = Foo()
+        cases = [
+            (foo, foo, ''),
+            ({'a': [1, 2, foo]}, foo, "['a'][2]"),
+            ({'a': {(1, foo): 1}}, foo, "['a'] (key (1, {!r}))[1]".format(foo)),
+            ((1, {'b': Foo}), Foo, "[1]['b']"),
+            ([bytearray(b'x')], bytearray(b'x'), '[0]'),
+        ]
+        for data, value, path in cases:
+            with self.subTest(data=data):
+                with self.assertRaises(storage.SimpleTypeError) as cm:
+                    store.save_snapshot('foo', data)
+                self.assertEqual(cm.exception.value, value)
+                self.assertEqual(cm.exception.path, path)
+                self.assertIs(cm.exception.data, data)
+                with self.assertRaises(storage.NoSnapshotError):
+                    store.load_snapshot('foo')
+
+    def test_records(self):
+        store = self.create_storage()
+        store.save_record('ns', 'foo', {'a': 1})
+        store.save_record('ns', 'bar', [1, 2])
+        store.save_record('ns2', 'foo', 'other')
+        self.assertEqual(store.load_record('ns', 'foo'), {'a': 1})
+        self.assertEqual(store.load_records('ns', ['foo', 'bar']),
+                         {'foo': {'a': 1}, 'bar': [1, 2]})
+        self.assertEqual(store.load_records('ns', []), {})
+        with self.assertRaises(KeyError):
+            store.load_records('ns2', ['foo', 'bar'])
+        store.save_record('ns', 'foo', None)
+        self.assertIsNone(store.load_record('ns', 'foo'))
+        store.drop_record('ns', 'foo')
+        with self.assertRaises(KeyError):
+            store.load_record('ns', 'foo')
+        self.assertEqual(store.load_record('ns2', 'foo'), 'other')
+        with self.assertRaises(storage.SimpleTypeError):
+            store.save_record('ns', 'foo', object())
+
+    def test_list_records(self):
+        store = self.create_storage()
+        for key in ('c', 'a', 'd', 'b'):
+            store.save_record('ns', key, 1)
+        store.save_record('ns', 'a', 2)
+        store.save_record('other', 'aa', 1)
+        self.assertEqual(store.list_records('ns'), ['a', 'b', 'c', 'd'])
+        self.assertEqual(store.list_records('ns', limit=2), ['a', 'b'])
+        self.assertEqual(store.list_records('ns', after='b', limit=2), ['c', 'd'])
+        self.assertEqual(store.list_records('ns', after='aa'), ['b', 'c', 'd'])
+        self.assertEqual(store.list_records('ns', after='d'), [])
+        store.drop_record('ns', 'b')
+        store.drop_record('ns', 'missing')
+        self.assertEqual(store.list_records('ns'), ['a', 'c', 'd'])
+        self.assertEqual(store.list_records('empty'), [])
+
+    def test_notice_schedules(self):
+        store = self.create_storage()
+        store.save_notice('event', 'observer', 'method')
+        store.save_notice('event', 'observer2', 'method')
+        self.assertEqual(store.notice_schedules(), {})
+        store.set_notice_schedule('event', 'observer2', 'method', 100.5, 1)
+        self.assertEqual(store.notice_schedules(), {
+            ('event', 'observer2', 'method'): (100.5, 1),
+        })
+        # Scheduled notices are still plain notices for the rest of the API.
+        self.assertEqual(list(store.notices(None)), [
+            ('event', 'observer', 'method'),
+            ('event', 'observer2', 'method'),
+        ])
+        store.drop_notice('event', 'observer2', 'method')
+        self.assertEqual(store.notice_schedules(), {})
+
+    def test_notices_with_snapshots_exclude(self):
+        store = self.create_storage()
+        store.save_snapshot('event', {'content': 1})
+        store.save_notice('event', 'observer', 'method')
+        store.save_notice('event2', 'observer', 'method')
+        # event2 has no snapshot, but is not needed.
+        self.assertEqual(
+            [row[:4] for row in store.notices_with_snapshots(
+                exclude={('event2', 'observer', 'method')})],
+            [('event', 'observer', 'method', {'content': 1})])
+
+    def test_save_snapshots_and_notices(self):
+        store = self.create_storage()
+        store.save_notice('event0', 'observer', 'method')
+        store.save_snapshots([('event1', {'content': 1}), ('event2', None)])
+        store.save_notices([
+            ('event1', 'observer', 'method'),
+            ('event2', 'observer', 'method'),
+            ('event1', 'observer2', 'method'),
+        ])
+        self.assertEqual(store.load_snapshot('event1'), {'content': 1})
+        self.assertIsNone(store.load_snapshot('event2'))
+        self.assertEqual(list(store.notices(None)), [
+            ('event0', 'observer', 'method'),
+            ('event1', 'observer', 'method'),
+            ('event2', 'observer', 'method'),
+            ('event1', 'observer2', 'method'),
+        ])
+        with self.assertRaises(storage.SimpleTypeError):
+            store.save_snapshots([('event3', {'content': object()})])
+
 
 class TestSQLiteStorage(StoragePermutations, BaseTestCase):
 
     def create_storage(self):
         return storage.SQLiteStorage(':memory:')
 
+    def test_save_snapshot_marshal_types(self):
+        store = self.create_storage()
+        # Content that may look like a pickled global is fine.
+        data = {'c': 1 + 2j, 'f': frozenset(['foo']), 's': '\x93', 'b': b'\x93'}
+        store.save_snapshot('foo', data)
+        self.assertEqual(store.load_snapshot('foo'), data)
+
+    def test_upgrade_notice_table(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        filename = os.path.join(tmpdir.name, 'unit-state.db')
+        db = sqlite3.connect(filename)
+        db.execute("CREATE TABLE snapshot (handle TEXT PRIMARY KEY, data BLOB)")
+        db.execute(
+            "CREATE TABLE notice (sequence INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " event_path TEXT, observer_path TEXT, method_name TEXT)")
+        db.execute("INSERT INTO notice VALUES (NULL, 'event', 'observer', 'method')")
+        db.commit()
+        db.close()
+
+        store = storage.SQLiteStorage(filename)
+        self.addCleanup(store.close)
+        store.save_notice('event2', 'observer', 'method')
+        store.set_notice_schedule('event', 'observer', 'method', 10.0, 0)
+        self.assertEqual(list(store.notices(None)), [
+            ('event', 'observer', 'method'),
+            ('event2', 'observer', 'method'),
+        ])
+        self.assertEqual(store.notice_schedules(), {('event', 'observer', 'method'): (10.0, 0)})
+
+    def test_uncommitted_changes_are_lost(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        filename = os.path.join(tmpdir.name, 'unit-state.db')
+        store = storage.SQLiteStorage(filename)
+        store.save_snapshot('foo', 1)
+        store.commit()
+        # Changes after a commit need another one too.
+        store.save_snapshot('bar', 2)
+        store.close()
+
+        store = storage.SQLiteStorage(filename)
+        self.addCleanup(store.close)
+        self.assertEqual(list(store.list_snapshots()), ['foo'])
+
 
 def setup_juju_backend(test_case, state_file):
     """Create fake scripts for pretending to be state-set and state-get"""
@@ -270,6 +474,52 @@ class TestJujuStorage(StoragePermutations, BaseTestCase):
         setup_juju_backend(self, state_file)
         return storage.JujuStorage()
 
+    def test_save_snapshot_refuses_marshal_types(self):
+        store = self.create_storage()
+        with self.assertRaises(storage.SimpleTypeError) as cm:
+            store.save_snapshot('foo', {'a': [frozenset()]})
+        self.assertEqual(cm.exception.path, "['a'][0]")
+        self.assertEqual(fake_script_calls(self, clear=True), [])
+
+    def test_save_record_refuses_marshal_types(self):
+        store = self.create_storage()
+        with self.assertRaises(storage.SimpleTypeError) as cm:
+            store.save_record('ns', 'foo', {'a': [frozenset()]})
+        self.assertEqual(cm.exception.path, "['a'][0]")
+        store.commit()
+        self.assertEqual(fake_script_calls(self, clear=True), [])
+
+    def test_records_stored_per_namespace(self):
+        store = self.create_storage()
+        keys = ['key{}'.format(i) for i in range(10)]
+        for i, key in enumerate(keys):
+            store.save_record('ns', key, {'value': i})
+        store.save_record('other', 'key', 1)
+        store.commit()
+        self.assertEqual(fake_script_calls(self, clear=True), [
+            ['state-get', '#records#ns'],
+            ['state-get', '#records#other'],
+            ['state-set', '--file', '-'],
+            ['state-set', '--file', '-'],
+        ])
+
+        # A namespace is read at once.
+        store = storage.JujuStorage()
+        records = store.load_records('ns', keys)
+        self.assertEqual(records, {key: {'value': i} for i, key in enumerate(keys)})
+        self.assertEqual(store.list_records('ns', after='key5'), keys[6:])
+        # The loaded records are copies.
+        records['key0']['value'] = 'changed'
+        self.assertEqual(store.load_record('ns', 'key0'), {'value': 0})
+        self.assertEqual(fake_script_calls(self, clear=True), [['state-get', '#records#ns']])
+
+        # Unchanged namespaces aren't written, and emptied ones are deleted.
+        for key in keys:
+            store.drop_record('ns', key)
+        store.commit()
+        self.assertEqual(fake_script_calls(self, clear=True), [['state-delete', '#records#ns']])
+        self.assertEqual(storage.JujuStorage().list_records('ns'), [])
+
 
 class TestSimpleLoader(BaseTestCase):
 
@@ -27,6 +27,7 @@ from ops.charm import (
 )
 from ops.framework import (
     Object,
+    cached_per_hook,
 )
 from ops.model import (
     ActiveStatus,
@@ -475,6 +476,28 @@ class TestHarness(unittest.TestCase):
              {'name': 'config-changed', 'data': {'a': ''}},
              ])
 
+    def test_cached_per_hook_across_simulated_hooks(self):
+
+        class CachingCharm(CharmBase):
+            def __init__(self, framework, key=None):
+                super().__init__(framework, key)
+                self.ports = []
+                self.framework.observe(self.on.config_changed, self._on_config_changed)
+
+            @cached_per_hook
+            def port(self):
+                return self.model.config['port']
+
+            def _on_config_changed(self, event):
+                self.ports.append(self.port())
+
+        harness = Harness(CachingCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        harness.update_config({'port': 2})
+        harness.update_config({'port': 3})
+        self.assertEqual(harness.charm.ports, [2, 3])
+
     def test_set_leader(self):
         harness = Harness(RecordingCharm)
         self.addCleanup(harness.cleanup)